@@ -0,0 +1,191 @@
+"""
+Benchmark of the write, fetch, and delete paths of DatabaseConnectionHoneycomb
+against an in-process fake Honeycomb server (see fake_honeycomb.py).
+
+For each combination of number of datapoints, number of assignments (devices),
+and write/read chunk size, writes the datapoints, fetches them all back, and
+deletes them, reporting throughput, request latency percentiles, and peak
+memory for each path. Peak memory is measured with tracemalloc and includes
+the allocations of the fake server, which runs in the same process.
+
+Usage (with the package installed, e.g., via pip install -e .):
+    python benchmarks/connection_paths.py [--datapoints N [N ...]] [--assignments N [N ...]]
+        [--write-chunk-sizes N [N ...]] [--read-chunk-sizes N [N ...]]
+        [--payload-fields N] [--latency SECONDS] [--connection-option KEY=VALUE ...]
+"""
+import database_connection_honeycomb
+from fake_honeycomb import FakeHoneycombServer
+import argparse
+import datetime
+import itertools
+import statistics
+import tracemalloc
+import json
+import time
+
+START = datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+
+def generate_datapoints(
+    num_datapoints,
+    object_ids,
+    num_payload_fields
+):
+    datapoints = []
+    for datapoint_index in range(num_datapoints):
+        datapoint = {
+            'timestamp': START + datetime.timedelta(milliseconds=100*datapoint_index),
+            'object_id': object_ids[datapoint_index % len(object_ids)]
+        }
+        for field_index in range(num_payload_fields):
+            datapoint['field_{}'.format(field_index)] = datapoint_index + field_index/num_payload_fields
+        datapoints.append(datapoint)
+    return datapoints
+
+class RequestLatencies:
+    # Instrumentation callback collecting the latency of every request
+    def __init__(self):
+        self.values = []
+
+    def __call__(self, kind, name, value):
+        if kind == 'observe' and name.startswith('request_seconds.'):
+            self.values.append(value)
+
+def run_path(
+    connection,
+    request_latencies,
+    function
+):
+    # The environment is loaded before timing starts
+    connection.refresh_environment()
+    request_latencies.values = []
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    connection.close()
+    return result, elapsed, list(request_latencies.values), peak_memory
+
+def run_combination(
+    server,
+    num_datapoints,
+    object_ids,
+    write_chunk_size,
+    read_chunk_size,
+    num_payload_fields,
+    connection_options
+):
+    datapoints = generate_datapoints(num_datapoints, object_ids, num_payload_fields)
+    end = START + datetime.timedelta(milliseconds=100*num_datapoints)
+    results = dict()
+    for path in ['write', 'fetch', 'delete']:
+        request_latencies = RequestLatencies()
+        connection = database_connection_honeycomb.DatabaseConnectionHoneycomb(
+            time_series_database=True,
+            object_database=True,
+            write_chunk_size=write_chunk_size,
+            read_chunk_size=read_chunk_size,
+            instrumentation=database_connection_honeycomb.Instrumentation(callback=request_latencies),
+            **connection_options,
+            **server.connection_arguments()
+        )
+        if path == 'write':
+            function = lambda: connection.write_data_object_time_series(datapoints)
+        elif path == 'fetch':
+            function = lambda: connection.fetch_data_object_time_series(
+                start_time=START,
+                end_time=end,
+                object_ids=object_ids
+            )
+        else:
+            function = lambda: connection.delete_data_object_time_series(
+                start_time=START,
+                end_time=end,
+                object_ids=object_ids
+            )
+        results[path] = run_path(connection, request_latencies, function)
+        if path == 'fetch' and len(results[path][0]) != num_datapoints:
+            raise ValueError('Fetched {} datapoints but wrote {}'.format(len(results[path][0]), num_datapoints))
+    return results
+
+def percentile(values, fraction):
+    if len(values) == 0:
+        return float('nan')
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[int(round(fraction*100)) - 1]
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the write, fetch, and delete paths against a fake Honeycomb server')
+    parser.add_argument('--datapoints', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--assignments', type=int, nargs='+', default=[1, 10])
+    parser.add_argument('--write-chunk-sizes', type=int, nargs='+', default=[20, 100])
+    parser.add_argument('--read-chunk-sizes', type=int, nargs='+', default=[1000])
+    parser.add_argument('--payload-fields', type=int, default=10, help='Number of numeric fields in each datapoint')
+    parser.add_argument('--latency', type=float, default=0.005, help='Delay added to every request by the fake server in seconds')
+    parser.add_argument(
+        '--connection-option',
+        action='append',
+        default=[],
+        metavar='KEY=VALUE',
+        help='Extra DatabaseConnectionHoneycomb argument (value parsed as JSON if possible)'
+    )
+    args = parser.parse_args()
+    connection_options = dict()
+    for connection_option in args.connection_option:
+        key, value = connection_option.split('=', 1)
+        try:
+            connection_options[key] = json.loads(value)
+        except ValueError:
+            connection_options[key] = value
+    print('{:<8}{:>10}{:>8}{:>8}{:>8}{:>10}{:>12}{:>8}{:>10}{:>10}{:>10}{:>10}'.format(
+        'path',
+        'points',
+        'assign',
+        'wchunk',
+        'rchunk',
+        'seconds',
+        'points/s',
+        'reqs',
+        'p50 ms',
+        'p90 ms',
+        'p99 ms',
+        'peak MB'
+    ))
+    for num_datapoints, num_assignments, write_chunk_size, read_chunk_size in itertools.product(
+        args.datapoints,
+        args.assignments,
+        args.write_chunk_sizes,
+        args.read_chunk_sizes
+    ):
+        with FakeHoneycombServer(latency=args.latency) as server:
+            object_ids = server.add_devices(num_assignments)
+            results = run_combination(
+                server=server,
+                num_datapoints=num_datapoints,
+                object_ids=object_ids,
+                write_chunk_size=write_chunk_size,
+                read_chunk_size=read_chunk_size,
+                num_payload_fields=args.payload_fields,
+                connection_options=connection_options
+            )
+        for path in ['write', 'fetch', 'delete']:
+            result, elapsed, request_seconds, peak_memory = results[path]
+            print('{:<8}{:>10}{:>8}{:>8}{:>8}{:>10.3f}{:>12.0f}{:>8}{:>10.2f}{:>10.2f}{:>10.2f}{:>10.1f}'.format(
+                path,
+                num_datapoints,
+                num_assignments,
+                write_chunk_size,
+                read_chunk_size,
+                elapsed,
+                num_datapoints/elapsed,
+                len(request_seconds),
+                1000*percentile(request_seconds, 0.50),
+                1000*percentile(request_seconds, 0.90),
+                1000*percentile(request_seconds, 0.99),
+                peak_memory/1e6
+            ))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,390 @@
+"""
+In-process fake Honeycomb server for benchmarks.
+
+Implements the token endpoint and the subset of the Honeycomb GraphQL API that
+DatabaseConnectionHoneycomb uses (findEnvironment, getEnvironment,
+searchDatapoints with cursor pagination, createDatapoint(s), and
+deleteDatapoint(s)), with a configurable delay added to every request.
+Responses contain only the fields selected by the request, so response sizes
+track those of the real server.
+
+Only the request formats produced by minimal_honeycomb are understood. This is
+not a general GraphQL server.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import email.parser
+import datetime
+import threading
+import bisect
+import json
+import time
+import re
+import uuid
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+OPERATION_PATTERN = re.compile(r'^(query|mutation) (\w+)')
+FIELD_PATTERN = re.compile(r'^(?:(\w+): )?(\w+)(?:\((.*)\))? \{$')
+ARGUMENT_PATTERN = re.compile(r'(\w+): \$(\w+)')
+
+class FakeHoneycombServer:
+    """
+    Fake Honeycomb server running on a background thread.
+
+    Use as a context manager, or call start() and stop().
+    """
+
+    def __init__(
+        self,
+        environment_name='benchmark',
+        latency=0.0,
+        host='127.0.0.1',
+        port=0
+    ):
+        """
+        Constructor for FakeHoneycombServer.
+
+        Parameters:
+            environment_name (string): Name of the (single) environment (default is 'benchmark')
+            latency (float): Delay added to every GraphQL request in seconds (default is 0.0)
+            host (string): Host to listen on (default is '127.0.0.1')
+            port (int): Port to listen on (default is 0, i.e., any free port)
+        """
+        self.environment_name = environment_name
+        self.environment_id = uuid.uuid4().hex
+        self.latency = latency
+        self.assignments = []
+        self.assignments_by_id = dict()
+        self.datapoints = dict()
+        self.datapoint_keys = []
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.http_server = ThreadingHTTPServer((host, port), _RequestHandler)
+        self.http_server.daemon_threads = True
+        self.http_server.fake_honeycomb = self
+        self.thread = None
+
+    @property
+    def uri(self):
+        return 'http://{}:{}/graphql'.format(*self.http_server.server_address[:2])
+
+    @property
+    def token_uri(self):
+        return 'http://{}:{}/oauth/token'.format(*self.http_server.server_address[:2])
+
+    def connection_arguments(self):
+        """
+        Return the Honeycomb access arguments for a DatabaseConnectionHoneycomb
+        which talks to this server.
+        """
+        return {
+            'environment_name_honeycomb': self.environment_name,
+            'object_type_honeycomb': 'DEVICE',
+            'object_id_field_name_honeycomb': 'part_number',
+            'honeycomb_uri': self.uri,
+            'honeycomb_token_uri': self.token_uri,
+            'honeycomb_audience': 'benchmark',
+            'honeycomb_client_id': 'benchmark',
+            'honeycomb_client_secret': 'benchmark'
+        }
+
+    def start(self):
+        self.thread = threading.Thread(target=self.http_server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.http_server.shutdown()
+        self.http_server.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def add_devices(
+        self,
+        num_devices,
+        start='2020-01-01T00:00:00.000000Z'
+    ):
+        """
+        Add devices, each with one open-ended assignment to the environment.
+
+        Devices have part numbers device_0, device_1, etc.
+
+        Parameters:
+            num_devices (int): Number of devices to add
+            start (string): Start of the assignments (default is '2020-01-01T00:00:00.000000Z')
+
+        Returns:
+            (list of string): Part numbers of the new devices
+        """
+        part_numbers = []
+        with self.lock:
+            for device_index in range(len(self.assignments), len(self.assignments) + num_devices):
+                part_number = 'device_{}'.format(device_index)
+                assignment = {
+                    '__typename': 'Assignment',
+                    'assignment_id': uuid.uuid4().hex,
+                    'start': start,
+                    'end': None,
+                    'assigned_type': 'DEVICE',
+                    'environment': {
+                        '__typename': 'Environment',
+                        'name': self.environment_name
+                    },
+                    'assigned': {
+                        '__typename': 'Device',
+                        'device_id': uuid.uuid4().hex,
+                        'device_type': 'BENCHMARK',
+                        'part_number': part_number,
+                        'serial_number': None,
+                        'name': part_number,
+                        'mac_address': None,
+                        'tag_id': str(device_index)
+                    }
+                }
+                self.assignments.append(assignment)
+                self.assignments_by_id[assignment['assignment_id']] = assignment
+                part_numbers.append(part_number)
+        return part_numbers
+
+    def clear_datapoints(self):
+        with self.lock:
+            self.datapoints = dict()
+            self.datapoint_keys = []
+
+    def handle_graphql(self, payload):
+        if self.latency > 0:
+            time.sleep(self.latency)
+        with self.lock:
+            self.request_count += 1
+        query = payload['query']
+        variables = payload.get('variables') or {}
+        lines = query.split('\n')
+        operation_match = OPERATION_PATTERN.match(lines[0])
+        if operation_match is None:
+            raise ValueError('Unsupported request: {}'.format(lines[0]))
+        selections = _parse_selections(lines[1:])
+        data = dict()
+        for alias, field_name, arguments_string, selection in selections:
+            arguments = {
+                argument_name: variables.get(variable_name)
+                for argument_name, variable_name in ARGUMENT_PATTERN.findall(arguments_string or '')
+            }
+            result = self.resolve(field_name, arguments)
+            data[alias or field_name] = _project(result, selection)
+        return {'data': data}
+
+    def resolve(self, field_name, arguments):
+        if field_name == 'findEnvironment':
+            if arguments.get('name') != self.environment_name:
+                return {'data': []}
+            return {'data': [{'environment_id': self.environment_id}]}
+        if field_name == 'getEnvironment':
+            if arguments.get('environment_id') != self.environment_id:
+                return None
+            return {
+                'name': self.environment_name,
+                'assignments': self.assignments
+            }
+        if field_name == 'searchDatapoints':
+            return self.search_datapoints(arguments.get('query'), arguments.get('page') or {})
+        if field_name == 'createDatapoint':
+            return self.create_datapoint(arguments.get('datapoint'))
+        if field_name == 'deleteDatapoint':
+            with self.lock:
+                datapoint = self.datapoints.pop(arguments.get('data_id'), None)
+                if datapoint is not None:
+                    key = (datapoint['timestamp'], datapoint['data_id'])
+                    del self.datapoint_keys[bisect.bisect_left(self.datapoint_keys, key)]
+            return {'status': 'ok' if datapoint is not None else 'not found'}
+        raise ValueError('Unsupported field: {}'.format(field_name))
+
+    def create_datapoint(self, datapoint_input):
+        timestamp = _normalize_timestamp(datapoint_input['timestamp'])
+        file_data = datapoint_input['file'].get('data')
+        if not isinstance(file_data, str):
+            file_data = json.dumps(file_data)
+        data_id = uuid.uuid4().hex
+        datapoint = {
+            '__typename': 'Datapoint',
+            'data_id': data_id,
+            'timestamp': timestamp,
+            'format': datapoint_input.get('format'),
+            'source_type': datapoint_input.get('source_type'),
+            'source_id': datapoint_input.get('source'),
+            'file': {
+                '__typename': 'S3File',
+                'name': datapoint_input['file'].get('name'),
+                'contentType': datapoint_input['file'].get('contentType'),
+                'data': file_data
+            }
+        }
+        with self.lock:
+            self.datapoints[data_id] = datapoint
+            bisect.insort(self.datapoint_keys, (timestamp, data_id))
+        return {'data_id': data_id}
+
+    def search_datapoints(self, query_expression, page):
+        max_count = page.get('max') or 1000
+        cursor = page.get('cursor')
+        with self.lock:
+            if cursor is not None:
+                cursor_timestamp, cursor_data_id = cursor.split('|')
+                position = bisect.bisect_right(self.datapoint_keys, (cursor_timestamp, cursor_data_id))
+            else:
+                position = 0
+            page_datapoints = []
+            while position < len(self.datapoint_keys) and len(page_datapoints) < max_count:
+                datapoint = self.datapoints[self.datapoint_keys[position][1]]
+                if _matches(query_expression, datapoint):
+                    page_datapoints.append(datapoint)
+                position += 1
+        data = []
+        for datapoint in page_datapoints:
+            data.append({
+                **datapoint,
+                'source': self.assignments_by_id.get(datapoint['source_id'])
+            })
+        next_cursor = None
+        if len(data) > 0:
+            next_cursor = '{}|{}'.format(data[-1]['timestamp'], data[-1]['data_id'])
+        return {
+            'data': data,
+            'page_info': {
+                'count': len(data),
+                'cursor': next_cursor
+            }
+        }
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        fake_honeycomb = self.server.fake_honeycomb
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            if self.path.startswith('/oauth/token'):
+                response = {
+                    'access_token': uuid.uuid4().hex,
+                    'expires_in': 86400
+                }
+            else:
+                response = fake_honeycomb.handle_graphql(_decode_graphql_body(body))
+            status = 200
+        except Exception as exception:
+            response = {'errors': [{'message': str(exception)}]}
+            status = 200
+        response_body = json.dumps(response).encode('utf-8')
+        if not self.path.startswith('/oauth/token'):
+            with fake_honeycomb.lock:
+                fake_honeycomb.bytes_received += len(body)
+                fake_honeycomb.bytes_sent += len(response_body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response_body)))
+        self.end_headers()
+        self.wfile.write(response_body)
+
+    def log_message(self, format, *args):
+        pass
+
+def _decode_graphql_body(body):
+    # Uploads are sent as multipart form data (with files mapped into the
+    # variables, as in the GraphQL multipart request spec); everything else is
+    # sent as JSON
+    if not body.startswith(b'--'):
+        return json.loads(body)
+    boundary = body.split(b'\r\n', 1)[0][2:]
+    message = email.parser.BytesParser().parsebytes(
+        b'Content-Type: multipart/form-data; boundary=' + boundary + b'\r\n\r\n' + body
+    )
+    form = dict()
+    for part in message.get_payload():
+        form[part.get_param('name', header='content-disposition')] = part.get_payload(decode=True)
+    payload = json.loads(form['operations'])
+    for file_id, variable_paths in json.loads(form['map']).items():
+        for variable_path in variable_paths:
+            path_components = variable_path.split('.')[1:]
+            target = payload['variables']
+            for path_component in path_components[:-1]:
+                target = target[path_component]
+            target[path_components[-1]] = form[file_id].decode('utf-8')
+    return payload
+
+def _parse_selections(lines):
+    # Parse the selection set of a request as formatted by minimal_honeycomb
+    # (one field per line, two-space indentation) into a list of (alias, field
+    # name, arguments string, child selection) tuples. Fragments are
+    # represented by a field name of '... on <Type>'.
+    root = []
+    stack = [root]
+    for line in lines:
+        stripped_line = line.strip()
+        if len(stripped_line) == 0:
+            continue
+        if stripped_line == '}':
+            stack.pop()
+            continue
+        if stripped_line.startswith('... on ') and stripped_line.endswith(' {'):
+            children = []
+            stack[-1].append((None, stripped_line[:-2], None, children))
+            stack.append(children)
+            continue
+        field_match = FIELD_PATTERN.match(stripped_line)
+        if field_match is not None:
+            children = []
+            stack[-1].append((field_match.group(1), field_match.group(2), field_match.group(3), children))
+            stack.append(children)
+            continue
+        stack[-1].append((None, stripped_line, None, None))
+    return root
+
+def _project(value, selection):
+    if selection is None or value is None:
+        return value
+    if isinstance(value, list):
+        return [_project(item, selection) for item in value]
+    projected_value = dict()
+    for alias, field_name, arguments_string, child_selection in selection:
+        if field_name.startswith('... on '):
+            if value.get('__typename') == field_name[len('... on '):]:
+                projected_value.update(_project(value, child_selection))
+            continue
+        projected_value[alias or field_name] = _project(value.get(field_name), child_selection)
+    return projected_value
+
+def _matches(query_expression, datapoint):
+    if query_expression is None:
+        return True
+    operator = query_expression.get('operator')
+    if operator == 'AND':
+        return all([_matches(child, datapoint) for child in query_expression.get('children')])
+    if operator == 'OR':
+        return any([_matches(child, datapoint) for child in query_expression.get('children')])
+    field = query_expression.get('field')
+    value = query_expression.get('value')
+    if field == 'source':
+        datapoint_value = datapoint['source_id']
+    elif field == 'timestamp':
+        datapoint_value = datapoint['timestamp']
+        value = _normalize_timestamp(value)
+    else:
+        datapoint_value = datapoint.get(field)
+    if operator == 'EQ':
+        return datapoint_value == value
+    if operator == 'GTE':
+        return datapoint_value >= value
+    if operator == 'LTE':
+        return datapoint_value <= value
+    raise ValueError('Unsupported query operator: {}'.format(operator))
+
+def _normalize_timestamp(timestamp):
+    # Timestamps are stored and compared as strings in a single fixed format
+    timestamp = datetime.datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    return timestamp.astimezone(datetime.timezone.utc).strftime(TIMESTAMP_FORMAT)
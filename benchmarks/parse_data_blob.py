@@ -0,0 +1,79 @@
+"""
+Micro-benchmark comparing the current parse_data_blob() implementation with the
+original recursive implementation. That the implementations agree is checked
+by tests/test_parse_data_blob.py (which also uses the blobs generated here).
+
+Usage (with the package installed, e.g., via pip install -e .):
+    python benchmarks/parse_data_blob.py [--num-records N] [--repeat R]
+"""
+import database_connection_honeycomb
+import argparse
+import json
+import timeit
+
+def legacy_parse_data_blob(data_blob):
+    # Original recursive implementation, kept here for comparison
+    data_dict_list=[]
+    if isinstance(data_blob, dict):
+        data_dict_list.append(data_blob)
+        return data_dict_list
+    if isinstance(data_blob, list):
+        for item in data_blob:
+            data_dict_list.extend(legacy_parse_data_blob(item))
+        return data_dict_list
+    try:
+        data_dict_list.extend(legacy_parse_data_blob(json.loads(data_blob)))
+        return data_dict_list
+    except:
+        pass
+    try:
+        for line in data_blob.split('\n'):
+            if len(line) > 0:
+                data_dict_list.extend(legacy_parse_data_blob(line))
+        return data_dict_list
+    except:
+        pass
+    return data_dict_list
+
+def generate_blobs(num_records):
+    records = [
+        {
+            'x': record_index * 0.25,
+            'y': record_index,
+            'anchor_id': 'anchor_{}'.format(record_index % 7),
+            'quality': [record_index % 3, record_index % 5]
+        }
+        for record_index in range(num_records)
+    ]
+    blobs = {
+        'dict': records[0],
+        'list of dicts': records,
+        'JSON document': json.dumps(records),
+        'NDJSON': '\n'.join([json.dumps(record) for record in records]),
+        'JSON-encoded NDJSON': json.dumps('\n'.join([json.dumps(record) for record in records])),
+        'list of JSON strings': [json.dumps(record) for record in records]
+    }
+    return blobs
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare parse_data_blob() implementations')
+    parser.add_argument('--num-records', type=int, default=1000, help='Number of records in each blob (default: 1000)')
+    parser.add_argument('--repeat', type=int, default=20, help='Number of times to parse each blob (default: 20)')
+    args = parser.parse_args()
+    connection = database_connection_honeycomb.DatabaseConnectionHoneycomb.__new__(
+        database_connection_honeycomb.DatabaseConnectionHoneycomb
+    )
+    print('JSON backend: {}'.format('orjson' if database_connection_honeycomb.orjson is not None else 'json'))
+    print('{:<24}{:>14}{:>14}{:>10}'.format('Blob', 'Legacy (ms)', 'Current (ms)', 'Speedup'))
+    for blob_name, blob in generate_blobs(args.num_records).items():
+        legacy_time = min(timeit.repeat(lambda: legacy_parse_data_blob(blob), number=1, repeat=args.repeat))
+        current_time = min(timeit.repeat(lambda: connection.parse_data_blob(blob), number=1, repeat=args.repeat))
+        print('{:<24}{:>14.3f}{:>14.3f}{:>10.1f}'.format(
+            blob_name,
+            legacy_time * 1000,
+            current_time * 1000,
+            legacy_time / current_time
+        ))
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,40 @@
 from database_connection import DatabaseConnection
 import minimal_honeycomb
+from database_connection_honeycomb.cache import DatapointCache, MIN_TIMESTAMP, MAX_TIMESTAMP
+from database_connection_honeycomb.client_pool import get_pooled_client, DEFAULT_MAX_CONNECTIONS
+from database_connection_honeycomb.buffered_writer import BufferedWriter
+from database_connection_honeycomb.checkpoint import WriteCheckpoint, FetchCheckpoint
+from database_connection_honeycomb.instrumentation import Instrumentation, InstrumentedHoneycombClient
+from database_connection_honeycomb.timestamps import python_datetime_utc, python_datetimes_utc, datetime_honeycomb_string, datetime_honeycomb_strings
 import json
 import os
+import time
+import hashlib
 import math
+import datetime
+import bisect
+import heapq
+import itertools
+import concurrent.futures
+import threading
+import queue
 import logging
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
 logger = logging.getLogger(__name__)
 
 class DatabaseConnectionHoneycomb(DatabaseConnection):
@@ -21,6 +51,31 @@ class DatabaseConnectionHoneycomb(DatabaseConnection):
         object_id_field_name_honeycomb=None,
         write_chunk_size=20,
         read_chunk_size=1000,
+        write_max_workers=1,
+        write_retries=0,
+        write_retry_backoff=0.5,
+        write_checkpoint_sync_interval=0.0,
+        pack_interval=None,
+        pack_format='json',
+        read_ahead_pages=0,
+        read_shard_mode=None,
+        read_shard_count=None,
+        read_shard_duration=None,
+        read_max_workers=4,
+        read_max_query_assignments=None,
+        read_lean_fetch=False,
+        delete_chunk_size=100,
+        delete_max_workers=1,
+        cache_directory=None,
+        cache_max_bytes=1000000000,
+        environment_snapshot_directory=None,
+        environment_snapshot_ttl=3600,
+        environment_refresh_interval=None,
+        environment_refresh_on_miss=False,
+        environment_refresh_min_interval=60,
+        honeycomb_client_pool=False,
+        honeycomb_max_connections=DEFAULT_MAX_CONNECTIONS,
+        instrumentation=None,
         honeycomb_uri=None,
         honeycomb_token_uri=None,
         honeycomb_audience=None,
@@ -44,6 +99,28 @@ class DatabaseConnectionHoneycomb(DatabaseConnection):
         For an object time series database, Honeycomb environment, object type,
         and object ID field name must be specified.
 
+        The Honeycomb environment is loaded the first time it is needed. If an
+        environment snapshot directory is specified, the loaded environment is
+        saved there and reused (by this and later processes) until it is older
+        than the snapshot TTL.
+
+        If a pack interval is specified, bulk and buffered writes pack the
+        measurements for each assignment within each interval of that length
+        (aligned to the Unix epoch) into a single datapoint whose file holds a
+        list (or, if pack_format is 'ndjson', lines) of measurements, each with
+        its own timestamp. Fetches unpack such datapoints into one row per
+        measurement whatever the pack interval, but only look back far enough
+        for packs which begin before the start time if the pack interval is
+        specified. If the pack interval is specified, deletes remove exactly
+        the measurements within the time span: packs which also hold
+        measurements outside it are written again without the deleted
+        measurements before the original packs are deleted.
+
+        If honeycomb_client_pool is True, the connection uses the process-wide
+        client for its Honeycomb access parameters (see get_pooled_client()), so
+        that all such connections share HTTP keep-alive connections and a single
+        access token.
+
         If Honeycomb access parameters (URI, token URI, audience, client ID,
         client secret) are not specified, method will attempt to read from
         corresponding environment variables (HONEYCOMB_URI, HONEYCOMB_TOKEN_URI,
@@ -57,6 +134,31 @@ class DatabaseConnectionHoneycomb(DatabaseConnection):
             object_id_field_name_honeycomb (string): Honeycomb field name that holds the object ID (e.g., part_number)
             write_chunk_size (int): Number of datapoints to write in each request (default is 20)
             read_chunk_size (int): Number of datapoints to read in each request (default is 1000)
+            write_max_workers (int): Maximum number of write requests in flight at once (default is 1)
+            write_retries (int): Number of times to retry a failed write chunk (default is 0)
+            write_retry_backoff (float): Delay before the first retry of a write chunk in seconds, doubled for each further retry (default is 0.5)
+            write_checkpoint_sync_interval (float): Minimum time between syncs of a write checkpoint file to disk in seconds (default is 0.0, i.e., sync after every chunk; see WriteCheckpoint)
+            pack_interval (timedelta or float): Interval for packing measurements into shared datapoints (in seconds if float) (default is None, i.e., one datapoint per measurement)
+            pack_format (string): Format of packed datapoints, 'json' (a JSON list) or 'ndjson' (default is 'json')
+            read_ahead_pages (int): Number of pages to request in the background while earlier pages are parsed (default is 0)
+            read_shard_mode (string): Split fetches into parallel queries by 'time' or by 'assignments' (default is None, i.e., a single query)
+            read_shard_count (int): Number of shards for sharded fetches (default is read_max_workers)
+            read_shard_duration (timedelta or float): Duration of each time shard (in seconds if float); overrides read_shard_count
+            read_max_workers (int): Maximum number of shard queries in flight at once (default is 4)
+            read_max_query_assignments (int): Maximum number of assignments in the filter of a single query; larger sets are split into parallel sub-queries (default is None, i.e., no limit)
+            read_lean_fetch (bool): Boolean indicating whether to request only the source assignment ID of each datapoint and fill in environment name and object ID from the loaded environment (default is False)
+            delete_chunk_size (int): Number of datapoints to delete in each request (default is 100)
+            delete_max_workers (int): Maximum number of delete requests in flight at once (default is 1)
+            cache_directory (string): Directory for a local cache of fetched datapoints (default is None, i.e., no cache)
+            cache_max_bytes (int): Maximum size of the local datapoint cache in bytes (default is 1000000000)
+            environment_snapshot_directory (string): Directory for persisted snapshots of the Honeycomb environment (default is None, i.e., no snapshots)
+            environment_snapshot_ttl (float): Maximum age of a usable environment snapshot in seconds (default is 3600)
+            environment_refresh_interval (float): Interval between background refreshes of the environment in seconds (default is None, i.e., no background refresh)
+            environment_refresh_on_miss (bool): Boolean indicating whether to refresh the environment when no assignment matches a datapoint (default is False)
+            environment_refresh_min_interval (float): Minimum time between refreshes triggered by assignment lookup misses in seconds (default is 60)
+            honeycomb_client_pool (bool): Boolean indicating whether to use the process-wide Honeycomb client for these access parameters (default is False)
+            honeycomb_max_connections (int): Maximum number of open connections for a newly pooled Honeycomb client (default is 10)
+            instrumentation (Instrumentation or bool): Recorder for request and processing statistics, or True for a new Instrumentation (default is None, i.e., no instrumentation)
             honeycomb_uri (string): Honeycomb URI
             honeycomb_token_uri (string): Honeycomb token URI
             honeycomb_audience (string): Honeycomb audience
@@ -71,6 +173,14 @@ class DatabaseConnectionHoneycomb(DatabaseConnection):
             raise ValueError('Honeycomb object type must be specified for object time series database')
         if time_series_database and object_database and object_id_field_name_honeycomb is None:
             raise ValueError('Honeycomb object ID field name must be specified for object time series database')
+        if read_shard_mode not in [None, 'time', 'assignments']:
+            raise ValueError('Read shard mode must be None, \'time\', or \'assignments\'')
+        if read_shard_duration is not None and not isinstance(read_shard_duration, datetime.timedelta):
+            read_shard_duration = datetime.timedelta(seconds=read_shard_duration)
+        if pack_format not in PACKED_DATAPOINT_FILES.keys():
+            raise ValueError('Pack format must be \'json\' or \'ndjson\'')
+        if pack_interval is not None and not isinstance(pack_interval, datetime.timedelta):
+            pack_interval = datetime.timedelta(seconds=pack_interval)
         self.time_series_database = time_series_database
         self.object_database = object_database
         self.environment_name_honeycomb = environment_name_honeycomb
@@ -78,87 +188,395 @@ class DatabaseConnectionHoneycomb(DatabaseConnection):
         self.object_id_field_name_honeycomb = object_id_field_name_honeycomb
         self.write_chunk_size = write_chunk_size
         self.read_chunk_size = read_chunk_size
-        self.honeycomb_client = minimal_honeycomb.MinimalHoneycombClient(
-            uri=honeycomb_uri,
-            token_uri=honeycomb_token_uri,
-            audience=honeycomb_audience,
-            client_id=honeycomb_client_id,
-            client_secret=honeycomb_client_secret
-        )
-        if self.environment_name_honeycomb is not None:
+        self.write_max_workers = write_max_workers
+        self.write_retries = write_retries
+        self.write_retry_backoff = write_retry_backoff
+        self.write_checkpoint_sync_interval = write_checkpoint_sync_interval
+        self.pack_interval = pack_interval
+        self.pack_format = pack_format
+        self.read_ahead_pages = read_ahead_pages
+        self.read_shard_mode = read_shard_mode
+        self.read_shard_count = read_shard_count
+        self.read_shard_duration = read_shard_duration
+        self.read_max_workers = read_max_workers
+        self.read_max_query_assignments = read_max_query_assignments
+        self.read_lean_fetch = read_lean_fetch
+        self.delete_chunk_size = delete_chunk_size
+        self.delete_max_workers = delete_max_workers
+        self.honeycomb_uri = honeycomb_uri if honeycomb_uri is not None else os.getenv('HONEYCOMB_URI')
+        self.environment_snapshot_directory = environment_snapshot_directory
+        self.environment_snapshot_ttl = environment_snapshot_ttl
+        self.cache = None
+        if cache_directory is not None:
+            self.cache = DatapointCache(
+                cache_directory=cache_directory,
+                honeycomb_uri=self.honeycomb_uri,
+                max_bytes=cache_max_bytes
+            )
+        if honeycomb_client_pool:
+            self.honeycomb_client = get_pooled_client(
+                uri=honeycomb_uri,
+                token_uri=honeycomb_token_uri,
+                audience=honeycomb_audience,
+                client_id=honeycomb_client_id,
+                client_secret=honeycomb_client_secret,
+                max_connections=honeycomb_max_connections
+            )
+        else:
+            self.honeycomb_client = minimal_honeycomb.MinimalHoneycombClient(
+                uri=honeycomb_uri,
+                token_uri=honeycomb_token_uri,
+                audience=honeycomb_audience,
+                client_id=honeycomb_client_id,
+                client_secret=honeycomb_client_secret
+            )
+        if instrumentation is True:
+            instrumentation = Instrumentation()
+        self.instrumentation = instrumentation if instrumentation is not False else None
+        if self.instrumentation is not None:
+            self.honeycomb_client = InstrumentedHoneycombClient(
+                honeycomb_client=self.honeycomb_client,
+                instrumentation=self.instrumentation
+            )
+        self._environment_id = None
+        self._environment_state = None
+        self._assignment_sources = None
+        self._environment_lock = threading.Lock()
+        self.environment_refresh_interval = environment_refresh_interval
+        self.environment_refresh_on_miss = environment_refresh_on_miss
+        self.environment_refresh_min_interval = environment_refresh_min_interval
+        self._environment_refresh_lock = threading.Lock()
+        self._environment_refreshed_at = None
+        self._environment_refresh_stop_event = threading.Event()
+        self._environment_refresh_thread = None
+        if self.environment_refresh_interval is not None and self.environment_name_honeycomb is not None:
+            self._environment_refresh_thread = threading.Thread(
+                target=self._run_environment_refresh,
+                name='honeycomb-environment-refresh',
+                daemon=True
+            )
+            self._environment_refresh_thread.start()
+
+    @property
+    def environment(self):
+        """
+        Honeycomb environment (name and assignments) for this connection.
+
+        The environment is loaded from Honeycomb (or from a snapshot, if enabled
+        and fresh) the first time it is needed rather than when the connection
+        is constructed.
+        """
+        environment_state = self._environment_state
+        if environment_state is None:
+            environment_state = self._ensure_environment_state()
+        return environment_state[0]
+
+    @property
+    def assignment_index(self):
+        environment_state = self._environment_state
+        if environment_state is None:
+            environment_state = self._ensure_environment_state()
+        return environment_state[1]
+
+    def _ensure_environment_state(self):
+        with self._environment_lock:
+            if self._environment_state is None:
+                if self.environment_name_honeycomb is None:
+                    return (None, dict())
+                environment = self._load_environment()
+                self._environment_state = (
+                    environment,
+                    self._build_assignment_index(environment.get('assignments'))
+                )
+                self._environment_refreshed_at = time.time()
+            return self._environment_state
+
+    def refresh_environment(self):
+        """
+        Reload the Honeycomb environment (e.g., to pick up new assignments).
+
+        The new environment and its assignment index are built completely before
+        being swapped in with a single assignment, so concurrent readers and
+        writers see either the old environment or the new one, never a mix.
+        """
+        if self.environment_name_honeycomb is None:
+            raise ValueError('Refreshing environment only enabled when Honeycomb environment is specified')
+        with self._environment_refresh_lock:
+            environment = self._load_environment(use_snapshot=False)
+            environment_state = (
+                environment,
+                self._build_assignment_index(environment.get('assignments'))
+            )
+            self._environment_state = environment_state
+            self._environment_refreshed_at = time.time()
+        logger.info('Refreshed environment {} ({} assignments)'.format(
+            self.environment_name_honeycomb,
+            len(environment.get('assignments') or [])
+        ))
+
+    def stats(self):
+        """
+        Return request and processing statistics for this connection.
+
+        Requires instrumentation to be enabled (see constructor). Counters
+        include requests (in total and by operation), request errors, bytes
+        out and in (as transferred, only if honeycomb_client_pool is True),
+        pages and datapoints fetched, rows parsed, datapoints written and
+        deleted, and assignment lookup misses. Histograms include
+        request latency (by operation), parse time per datapoint, and
+        assignment lookup time.
+
+        Returns:
+            (dict): Dict with 'counters' and 'histograms' (see Instrumentation.stats())
+        """
+        if self.instrumentation is None:
+            raise ValueError('Statistics only available when instrumentation is enabled')
+        return self.instrumentation.stats()
+
+    def close(self):
+        """
+        Stop background environment refreshes and close the local cache (if any).
+        """
+        self._environment_refresh_stop_event.set()
+        if self._environment_refresh_thread is not None:
+            self._environment_refresh_thread.join()
+            self._environment_refresh_thread = None
+        if self.cache is not None:
+            self.cache.close()
+
+    def _run_environment_refresh(self):
+        while not self._environment_refresh_stop_event.wait(self.environment_refresh_interval):
+            if self._environment_state is None:
+                continue
+            try:
+                self.refresh_environment()
+            except Exception as exception:
+                logger.warning('Background refresh of environment {} failed: {}'.format(
+                    self.environment_name_honeycomb,
+                    exception
+                ))
+
+    # Internal method for refreshing the environment after an assignment lookup
+    # miss. Refreshes are rate limited, and a refresh which completed while
+    # waiting for the lock counts as this refresh.
+    def _refresh_environment_on_miss(self):
+        requested_at = time.time()
+        with self._environment_refresh_lock:
+            refreshed_at = self._environment_refreshed_at
+            if refreshed_at is not None and refreshed_at >= requested_at:
+                return True
+            if refreshed_at is not None and requested_at - refreshed_at < self.environment_refresh_min_interval:
+                return False
+        try:
+            self.refresh_environment()
+        except Exception as exception:
+            logger.warning('Refresh of environment {} after assignment lookup miss failed: {}'.format(
+                self.environment_name_honeycomb,
+                exception
+            ))
+            return False
+        return True
+
+    # Internal method for loading the Honeycomb environment, from a snapshot if
+    # one is enabled and fresh and otherwise from Honeycomb. The environment ID
+    # is remembered, so reloads only need the getEnvironment query.
+    def _load_environment(self, use_snapshot=True):
+        if use_snapshot and self.environment_snapshot_directory is not None:
+            environment = self._read_environment_snapshot()
+            if environment is not None:
+                return environment
+        if self._environment_id is None:
             findEnvironment_result = self.honeycomb_client.request(
                 request_type='query',
                 request_name='findEnvironment',
-                arguments= {
-                    'name': {
-                        'type': 'String',
-                        'value': self.environment_name_honeycomb
-                    }
-                },
-                return_object = [
-                    {'data': [
-                        'environment_id'
-                    ]}
-                ]
-            )
-            if len(findEnvironment_result.get('data')) == 0:
-                raise ValueError('Environment name {} matched no environments'.format(self.environment_name_honeycomb))
-            if len(findEnvironment_result.get('data')) > 1:
-                raise ValueError('Environment name {} matched more than one environment'.format(self.environment_name_honeycomb))
-            environment_id = findEnvironment_result.get('data')[0].get('environment_id')
-            getEnvironment_result = self.honeycomb_client.request(
-                request_type='query',
-                request_name='getEnvironment',
-                arguments={
-                    'environment_id': {
-                        'type': 'ID!',
-                        'value': environment_id
-                    }
-                },
-                return_object = [
-                    'name',
-                    {'assignments': [
-                        'assignment_id',
-                        'start',
-                        'end',
-                        'assigned_type',
-                        {'assigned': [
-                            {'... on Device': [
-                                'device_id',
-                                'device_type',
-                                'part_number',
-                                'serial_number',
-                                'name',
-                                'mac_address',
-                                'tag_id'
-                            ]},
-                            {'... on Person': [
-                                'person_id',
-                                'name',
-                                'first_name',
-                                'last_name',
-                                'nickname',
-                                'short_name',
-                                'person_type',
-                                'transparent_classroom_id'
-                            ]},
-                            {'... on Material': [
-                                'material_id',
-                                'name',
-                                'transparent_classroom_id'
-                            ]},
-                            {'... on Tray': [
-                                'tray_id',
-                                'part_number',
-                                'name',
-                                'serial_number'
-                            ]}
-                        ]}
-                    ]}
-                ]
+                arguments=self._find_environment_arguments(),
+                return_object=FIND_ENVIRONMENT_RETURN_OBJECT
             )
-            self.environment = getEnvironment_result
+            self._environment_id = self._parse_find_environment_result(findEnvironment_result)
+        getEnvironment_result = self.honeycomb_client.request(
+            request_type='query',
+            request_name='getEnvironment',
+            arguments=self._get_environment_arguments(self._environment_id),
+            return_object=GET_ENVIRONMENT_RETURN_OBJECT
+        )
+        environment = getEnvironment_result
+        if self.environment_snapshot_directory is not None:
+            self._write_environment_snapshot(environment)
+        return environment
+
+    def _find_environment_arguments(self):
+        arguments = {
+            'name': {
+                'type': 'String',
+                'value': self.environment_name_honeycomb
+            }
+        }
+        return arguments
+
+    def _parse_find_environment_result(self, findEnvironment_result):
+        if len(findEnvironment_result.get('data')) == 0:
+            raise ValueError('Environment name {} matched no environments'.format(self.environment_name_honeycomb))
+        if len(findEnvironment_result.get('data')) > 1:
+            raise ValueError('Environment name {} matched more than one environment'.format(self.environment_name_honeycomb))
+        environment_id = findEnvironment_result.get('data')[0].get('environment_id')
+        return environment_id
+
+    def _get_environment_arguments(self, environment_id):
+        arguments = {
+            'environment_id': {
+                'type': 'ID!',
+                'value': environment_id
+            }
+        }
+        return arguments
+
+    def _environment_snapshot_path(self):
+        snapshot_key = hashlib.sha1('{}\n{}'.format(
+            self.environment_name_honeycomb,
+            self.honeycomb_uri
+        ).encode('utf-8')).hexdigest()
+        return os.path.join(
+            self.environment_snapshot_directory,
+            'environment_{}.json'.format(snapshot_key)
+        )
+
+    def _read_environment_snapshot(self):
+        snapshot_path = self._environment_snapshot_path()
+        try:
+            with open(snapshot_path, 'r') as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except (OSError, ValueError):
+            return None
+        if snapshot.get('environment_name') != self.environment_name_honeycomb or snapshot.get('honeycomb_uri') != self.honeycomb_uri:
+            return None
+        if self.environment_snapshot_ttl is not None and time.time() - snapshot.get('saved_at', 0) > self.environment_snapshot_ttl:
+            return None
+        logger.info('Loaded environment {} from snapshot {}'.format(
+            self.environment_name_honeycomb,
+            snapshot_path
+        ))
+        return snapshot.get('environment')
+
+    def _write_environment_snapshot(self, environment):
+        snapshot_path = self._environment_snapshot_path()
+        snapshot = {
+            'environment_name': self.environment_name_honeycomb,
+            'honeycomb_uri': self.honeycomb_uri,
+            'saved_at': time.time(),
+            'environment': environment
+        }
+        try:
+            os.makedirs(self.environment_snapshot_directory, exist_ok=True)
+            temporary_snapshot_path = '{}.{}.tmp'.format(snapshot_path, os.getpid())
+            with open(temporary_snapshot_path, 'w') as snapshot_file:
+                json.dump(snapshot, snapshot_file)
+            os.replace(temporary_snapshot_path, snapshot_path)
+        except OSError as exception:
+            logger.warning('Failed to write environment snapshot {}: {}'.format(
+                snapshot_path,
+                exception
+            ))
+
+    def write_data_object_time_series(
+        self,
+        datapoints,
+        checkpoint_path=None
+    ):
+        """
+        Write multiple datapoints with timestamps and object IDs.
+
+        Input should be a list (or any other iterable, e.g., a generator) of
+        dicts. Each dict must contain a 'timestamp' element and an 'object_id'
+        element. The dicts are not modified.
+
+        Iterables other than lists and tuples are consumed lazily, one chunk at
+        a time, so memory use depends on the write chunk size rather than on
+        the number of datapoints. Lists and tuples are checked before anything
+        is written; other iterables are checked as they are consumed, so an
+        invalid datapoint stops the write after earlier chunks were written.
+
+        Timestamps must either be native Python datetimes or strings which are
+        parsable by dateutil.parser.parse(). If timestamp is timezone-naive,
+        timezone is assumed to be UTC.
+
+        Data must be serializable by native Python json methods.
+
+        If a checkpoint path is specified, each completed chunk (and the data
+        IDs returned for it) is recorded in that file. If the write is
+        interrupted, calling this method again with the same datapoints and the
+        same checkpoint path skips the chunks which were already written.
+
+        Parameters:
+            datapoints (iterable of dict): Datapoints to be written
+            checkpoint_path (string): Path of a checkpoint file for the write (default is None, i.e., no checkpoint)
+
+        Returns:
+            (list of string): Honeycomb data IDs of the new datapoints (in input order)
+        """
+        if not self.time_series_database or not self.object_database:
+            raise ValueError('Writing datapoint by timestamp and object ID only enabled for object time series databases')
+        if isinstance(datapoints, (list, tuple)):
+            # Check every datapoint before anything is written
+            for datapoint in datapoints:
+                self._validate_datapoint(datapoint)
+        else:
+            datapoints = self._validated_datapoints(datapoints)
+        return_value = self._write_data_object_time_series(
+            datapoints,
+            checkpoint_path=checkpoint_path
+        )
+        return return_value
+
+    # Internal method for checking that a datapoint to be written has a
+    # parsable timestamp and an object ID (without modifying it)
+    def _validate_datapoint(self, datapoint):
+        if 'timestamp' not in datapoint.keys():
+            raise ValueError('Each datapoint must contain a timestamp')
+        if 'object_id' not in datapoint.keys():
+            raise ValueError('Each datapoint must contain an object ID')
+        self._python_datetime_utc(datapoint['timestamp'])
+
+    # Internal method for checking datapoints as they are consumed from an
+    # iterable (so that the iterable is never held in memory all at once)
+    def _validated_datapoints(self, datapoints):
+        for datapoint in datapoints:
+            self._validate_datapoint(datapoint)
+            yield datapoint
+
+    def buffered_writer(
+        self,
+        max_count=None,
+        max_bytes=1000000,
+        max_latency=1.0,
+        max_queue_size=10000,
+        callback=None,
+        error_callback=None
+    ):
+        """
+        Create a write-behind buffer which batches datapoints appended one at a time.
+
+        See BufferedWriter for details.
+
+        Parameters:
+            max_count (int): Maximum number of datapoints in each batch (default is write_chunk_size)
+            max_bytes (int): Maximum size of the data in each batch in bytes (default is 1000000)
+            max_latency (float): Maximum time a datapoint waits before its batch is written in seconds (default is 1.0; None means no limit)
+            max_queue_size (int): Maximum number of datapoints waiting to be batched before append() blocks (default is 10000)
+            callback (function): Function called with the data IDs of each written batch (default is None)
+            error_callback (function): Function called with the datapoints and exception of each failed batch (default is None)
 
+        Returns:
+            (BufferedWriter): Buffered writer for this connection
+        """
+        return BufferedWriter(
+            connection=self,
+            max_count=max_count,
+            max_bytes=max_bytes,
+            max_latency=max_latency,
+            max_queue_size=max_queue_size,
+            callback=callback,
+            error_callback=error_callback
+        )
 
     # Internal method for writing a single datapoint of object time series data
     # (Honeycomb-specific)
@@ -173,45 +591,272 @@ class DatabaseConnectionHoneycomb(DatabaseConnection):
         createDatapoint_result = self.honeycomb_client.request(
             request_type='mutation',
             request_name='createDatapoint',
-            arguments={
-                'datapoint': {
-                    'type': 'DatapointInput',
-                    'value': {
-                        'timestamp': timestamp_honeycomb_format,
-                        'format': 'application/json',
-                        'source_type': 'MEASURED',
-                        'source': assignment_id,
-                        'file': {
-                            'name': 'datapoint.json',
-                            'contentType': 'application/json',
-                            'data': data
-                        }
-                    }
-                }
-            },
+            arguments=self._create_datapoint_arguments(
+                timestamp_honeycomb_format,
+                assignment_id,
+                data
+            ),
             return_object = [
                 'data_id'
             ]
         )
         data_id = createDatapoint_result.get('data_id')
+        self._invalidate_cached_ranges([(assignment_id, timestamp_honeycomb_format)])
+        if self.instrumentation is not None:
+            self.instrumentation.count('datapoints_written')
         return data_id
 
     # Internal method for writing object time series data (Honeycomb-specific)
     def _write_data_object_time_series(
         self,
-        datapoints
+        datapoints,
+        checkpoint_path=None
     ):
-        num_datapoints = len(datapoints)
-        num_chunks = math.ceil(num_datapoints / self.write_chunk_size)
-        data_ids = []
-        for chunk_index in range(num_chunks):
-            chunk_beginning = chunk_index * self.write_chunk_size
-            chunk_end = min((chunk_index + 1) * self.write_chunk_size, num_datapoints)
-            chunk_datapoints = datapoints[chunk_beginning:chunk_end]
-            chunk_data_ids = self._write_datapoints_object_time_series(chunk_datapoints)
-            data_ids.extend(chunk_data_ids)
+        pack_indices = None
+        if self.pack_interval is not None:
+            pack_indices = []
+            datapoints = self._iter_packs(datapoints, pack_indices)
+        checkpoint = None
+        completed_chunks = None
+        chunk_callback = None
+        if checkpoint_path is not None:
+            checkpoint = WriteCheckpoint(
+                path=checkpoint_path,
+                num_items=len(datapoints) if isinstance(datapoints, (list, tuple)) else None,
+                chunk_size=self.write_chunk_size,
+                sync_interval=self.write_checkpoint_sync_interval
+            )
+            completed_chunks = checkpoint.load()
+            if len(completed_chunks) > 0:
+                logger.info('Resuming write from checkpoint {}: {} chunks already written'.format(
+                    checkpoint_path,
+                    len(completed_chunks)
+                ))
+            chunk_callback = checkpoint.record
+        try:
+            data_ids = self._process_chunks(
+                items=datapoints,
+                chunk_size=self.write_chunk_size,
+                max_workers=self.write_max_workers,
+                chunk_function=self._write_datapoints_object_time_series,
+                max_retries=self.write_retries,
+                retry_backoff=self.write_retry_backoff,
+                completed_chunks=completed_chunks,
+                chunk_callback=chunk_callback
+            )
+        except ChunkedRequestError as error:
+            if pack_indices is None:
+                raise
+            raise self._unpacked_chunked_request_error(error, pack_indices) from error
+        finally:
+            if checkpoint is not None:
+                checkpoint.sync()
+        if pack_indices is not None:
+            data_ids = [data_ids[pack_index] for pack_index in pack_indices]
         return data_ids
 
+    # Internal method for converting a ChunkedRequestError for a packed write
+    # (whose results and failed chunks are indexed by pack) into one whose
+    # results and failed index ranges refer to the input datapoints. Datapoints
+    # of a pack are not generally adjacent in the input, so a failed chunk of
+    # packs can become several ranges of datapoints.
+    def _unpacked_chunked_request_error(
+        self,
+        error,
+        pack_indices
+    ):
+        results = [
+            error.results[pack_index] if pack_index < len(error.results) else None
+            for pack_index in pack_indices
+        ]
+        failed_chunk_beginnings = [chunk_beginning for chunk_beginning, chunk_end, exception in error.failed_chunks]
+        failed_chunks = []
+        for datapoint_index, pack_index in enumerate(pack_indices):
+            failed_chunk_index = bisect.bisect_right(failed_chunk_beginnings, pack_index) - 1
+            if failed_chunk_index < 0 or pack_index >= error.failed_chunks[failed_chunk_index][1]:
+                continue
+            exception = error.failed_chunks[failed_chunk_index][2]
+            if len(failed_chunks) > 0 and failed_chunks[-1][1] == datapoint_index and failed_chunks[-1][2] is exception:
+                failed_chunks[-1] = (failed_chunks[-1][0], datapoint_index + 1, exception)
+                continue
+            failed_chunks.append((datapoint_index, datapoint_index + 1, exception))
+        return ChunkedRequestError(
+            results=results,
+            failed_chunks=failed_chunks
+        )
+
+    # Internal method for packing datapoints into one DatapointPack for each
+    # assignment and pack interval. Also returns the index of the pack holding
+    # each datapoint.
+    def _pack_datapoints(
+        self,
+        datapoints
+    ):
+        pack_indices = []
+        packs = list(self._iter_packs(datapoints, pack_indices))
+        return packs, pack_indices
+
+    # Internal method for packing datapoints from an iterable as they are
+    # consumed. At most PACK_BUFFER_SIZE datapoints are held in open packs;
+    # when the buffer is full, the open packs are yielded and packing starts
+    # over. The index of the pack holding each datapoint is appended to
+    # pack_indices (complete once the generator is exhausted).
+    def _iter_packs(
+        self,
+        datapoints,
+        pack_indices
+    ):
+        num_packs_yielded = 0
+        packs = []
+        pack_index_by_key = dict()
+        num_buffered_datapoints = 0
+        for datapoint_dict in datapoints:
+            timestamp = self._python_datetime_utc(datapoint_dict['timestamp'])
+            object_id = datapoint_dict['object_id']
+            assignment_id = self._lookup_assignment_id_object_time_series(timestamp, object_id)
+            pack_key = (
+                assignment_id,
+                object_id if assignment_id is None else None,
+                (timestamp - PACK_INTERVAL_EPOCH) // self.pack_interval
+            )
+            pack_index = pack_index_by_key.get(pack_key)
+            if pack_index is None:
+                pack_index = len(packs)
+                pack_index_by_key[pack_key] = pack_index
+                packs.append(DatapointPack(
+                    object_id=object_id,
+                    assignment_id=assignment_id
+                ))
+            packs[pack_index].add(
+                timestamp=timestamp,
+                datapoint=datapoint_dict
+            )
+            pack_indices.append(num_packs_yielded + pack_index)
+            num_buffered_datapoints += 1
+            if num_buffered_datapoints >= PACK_BUFFER_SIZE:
+                yield from packs
+                num_packs_yielded += len(packs)
+                packs = []
+                pack_index_by_key = dict()
+                num_buffered_datapoints = 0
+        yield from packs
+
+    # Internal method for sending chunks of a list (or any other iterable) of
+    # items to Honeycomb, optionally with several chunks in flight at once.
+    # Items are consumed one chunk at a time, and at most twice as many chunks
+    # as workers are held at once. Failed chunks are retried with exponential
+    # backoff. Chunks listed in completed_chunks (a map from index range to
+    # results) are not sent again, and chunk_callback (if specified) is called
+    # with the index range and results of each chunk as it completes. Results
+    # are returned in input order. If any chunk fails, a ChunkedRequestError is
+    # raised which identifies the index range of every chunk that did not
+    # complete.
+    def _process_chunks(
+        self,
+        items,
+        chunk_size,
+        max_workers,
+        chunk_function,
+        max_retries=0,
+        retry_backoff=0.0,
+        completed_chunks=None,
+        chunk_callback=None
+    ):
+        results = []
+        failed_chunks = []
+        def process_chunk(chunk_beginning, chunk_end, chunk_items):
+            chunk_results = self._call_with_retries(
+                chunk_function,
+                chunk_items,
+                max_retries,
+                retry_backoff,
+                'Chunk of items {} to {}'.format(chunk_beginning, chunk_end - 1)
+            )
+            if chunk_callback is not None:
+                chunk_callback(chunk_beginning, chunk_end, chunk_results)
+            return chunk_results
+        def record_failure(chunk_beginning, chunk_end, exception):
+            logger.warning('Chunk of items {} to {} failed: {}'.format(
+                chunk_beginning,
+                chunk_end - 1,
+                exception
+            ))
+            failed_chunks.append((chunk_beginning, chunk_end, exception))
+        if max_workers is not None and max_workers > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                future_chunk_ranges = dict()
+                def collect(futures):
+                    for future in futures:
+                        chunk_beginning, chunk_end = future_chunk_ranges.pop(future)
+                        try:
+                            results[chunk_beginning:chunk_end] = future.result()
+                        except Exception as exception:
+                            record_failure(chunk_beginning, chunk_end, exception)
+                for chunk_beginning, chunk_end, chunk_items in iter_chunks(items, chunk_size):
+                    results.extend([None] * (chunk_end - chunk_beginning))
+                    if completed_chunks is not None and (chunk_beginning, chunk_end) in completed_chunks.keys():
+                        results[chunk_beginning:chunk_end] = completed_chunks[(chunk_beginning, chunk_end)]
+                        continue
+                    if len(future_chunk_ranges) >= 2 * max_workers:
+                        done_futures, pending_futures = concurrent.futures.wait(
+                            future_chunk_ranges.keys(),
+                            return_when=concurrent.futures.FIRST_COMPLETED
+                        )
+                        collect(done_futures)
+                    future = executor.submit(process_chunk, chunk_beginning, chunk_end, chunk_items)
+                    future_chunk_ranges[future] = (chunk_beginning, chunk_end)
+                collect(concurrent.futures.as_completed(list(future_chunk_ranges.keys())))
+            failed_chunks.sort(key=lambda failed_chunk: failed_chunk[0])
+        else:
+            for chunk_beginning, chunk_end, chunk_items in iter_chunks(items, chunk_size):
+                results.extend([None] * (chunk_end - chunk_beginning))
+                if completed_chunks is not None and (chunk_beginning, chunk_end) in completed_chunks.keys():
+                    results[chunk_beginning:chunk_end] = completed_chunks[(chunk_beginning, chunk_end)]
+                    continue
+                if len(failed_chunks) > 0:
+                    # Remaining chunks are consumed (to report their index
+                    # ranges) but not sent
+                    failed_chunks.append((chunk_beginning, chunk_end, None))
+                    continue
+                try:
+                    results[chunk_beginning:chunk_end] = process_chunk(chunk_beginning, chunk_end, chunk_items)
+                except Exception as exception:
+                    record_failure(chunk_beginning, chunk_end, exception)
+        if len(failed_chunks) > 0:
+            raise ChunkedRequestError(
+                results=results,
+                failed_chunks=failed_chunks
+            )
+        return results
+
+    # Internal method for calling a function, retrying with exponential backoff
+    # if it raises an exception
+    def _call_with_retries(
+        self,
+        function,
+        argument,
+        max_retries,
+        retry_backoff,
+        description
+    ):
+        attempt = 0
+        while True:
+            try:
+                return function(argument)
+            except Exception as exception:
+                if attempt >= max_retries:
+                    raise
+                delay = retry_backoff * 2**attempt
+                attempt += 1
+                logger.warning('{} failed (attempt {} of {}): {}. Retrying in {:.1f} seconds'.format(
+                    description,
+                    attempt,
+                    max_retries + 1,
+                    exception,
+                    delay
+                ))
+                time.sleep(delay)
+
     # Internal method for fetching object time series data (Honeycomb-specific)
     def _fetch_data_object_time_series(
         self,
@@ -223,166 +868,779 @@ class DatabaseConnectionHoneycomb(DatabaseConnection):
             start_time,
             end_time
         ))
-        datapoints = self._fetch_datapoints_object_time_series(
+        data=[]
+        num_datapoints = 0
+        for datapoints in self._iter_datapoint_pages_object_time_series(
             start_time,
             end_time,
             object_ids
-        )
-        logger.info('Parsing {} datapoints'.format(len(datapoints)))
-        data=[]
-        for datapoint in datapoints:
-            source = datapoint.get('source')
-            timestamp = self._python_datetime_utc(datapoint.get('timestamp'))
-            environment_name = source.get('environment', {}).get('name')
-            object_id = source.get('assigned', {}).get(self.object_id_field_name_honeycomb)
-            base_data_dict = {
-                'timestamp': timestamp,
-                'environment_name': environment_name,
-                'object_id': object_id
-            }
-            data_blob = datapoint.get('file', {}).get('data')
-            extracted_data_dict_list = self.parse_data_blob(data_blob)
-            for extracted_data_dict in extracted_data_dict_list:
-                sanitized_extracted_data_dict = dict()
-                for key, value in extracted_data_dict.items():
-                    if key in base_data_dict.keys():
-                        sanitized_extracted_data_dict[key + '_secondary'] = extracted_data_dict[key]
-                    else:
-                        sanitized_extracted_data_dict[key] = extracted_data_dict[key]
-                complete_data_dict = {**base_data_dict, **sanitized_extracted_data_dict}
-                data.append(complete_data_dict)
+        ):
+            num_datapoints += len(datapoints)
+            for datapoint, timestamp in zip(datapoints, self._datapoint_timestamps(datapoints)):
+                data.extend(self._parse_datapoint(datapoint, timestamp))
+        logger.info('Parsed {} datapoints into {} rows'.format(
+            num_datapoints,
+            len(data)
+        ))
         return data
 
-    # Internal method for parsing a data blob from Honeycomb into a list of dictionaries
-    def parse_data_blob(
+    def iter_data(
         self,
-        data_blob
+        start_time=None,
+        end_time=None,
+        object_ids=None
     ):
-        data_dict_list=[]
-        if isinstance(data_blob, dict):
-            data_dict_list.append(data_blob)
-            return data_dict_list
-        if isinstance(data_blob, list):
-            for item in data_blob:
-                data_dict_list.extend(self.parse_data_blob(item))
-            return data_dict_list
-        try:
-            data_dict_list.extend(self.parse_data_blob(json.loads(data_blob)))
-            return data_dict_list
-        except:
-            pass
-        try:
-            for line in data_blob.split('\n'):
-                if len(line) > 0:
-                    data_dict_list.extend(self.parse_data_blob(line))
-            return data_dict_list
-        except:
-            pass
-        return data_dict_list
+        """
+        Iterate over data for a given timespan and set of object IDs.
 
-    # Internal method for deleting object time series data (Honeycomb-specific)
-    def _delete_data_object_time_series(
+        Arguments and rows are the same as for fetch_data_object_time_series(),
+        but rows are yielded in (timestamp, data ID) order as each page of
+        datapoints arrives from Honeycomb, so memory use is bounded by the read
+        chunk size rather than by the size of the result.
+
+        Parameters:
+            start_time (datetime or string): Beginning of timespan (default: None)
+            end_time (datetime or string): End of timespan (default: None)
+            object_ids (list of strings): Object IDs (default: None)
+
+        Returns:
+            (generator of dict): Data associated with specified time span and object IDs
+        """
+        if not self.time_series_database or not self.object_database:
+            raise ValueError('Fetching data by time interval and/or object ID only enabled for object time series databases')
+        if start_time is not None:
+            start_time = self._python_datetime_utc(start_time)
+        if end_time is not None:
+            end_time = self._python_datetime_utc(end_time)
+        for datapoints in self._iter_datapoint_pages_object_time_series(
+            start_time,
+            end_time,
+            object_ids
+        ):
+            for datapoint, timestamp in zip(datapoints, self._datapoint_timestamps(datapoints)):
+                yield from self._parse_datapoint(datapoint, timestamp)
+
+    def fetch_data_to_sink(
+        self,
+        sink,
+        start_time=None,
+        end_time=None,
+        object_ids=None,
+        checkpoint_path=None,
+        checkpoint_interval=1
+    ):
+        """
+        Fetch data for a given timespan and set of object IDs into a sink.
+
+        Arguments and rows are the same as for fetch_data_object_time_series(),
+        but rows are handed to the sink (a function called with a list of rows)
+        in (timestamp, data ID) order in batches of checkpoint_interval pages,
+        so memory use is bounded by the read chunk size rather than by the size
+        of the result.
+
+        If a checkpoint path is specified, the timestamp and data ID of the last
+        datapoint in each batch are recorded in that file as soon as the sink
+        returns. If the fetch is interrupted, calling this method again with the
+        same arguments and the same checkpoint path resumes the fetch after the
+        last recorded datapoint, so pages which were already handed to the sink
+        are neither fetched nor handed over again (only a batch whose sink call
+        returned just before the interruption can be handed over twice). Once
+        the fetch is complete, calling it again hands over nothing.
+
+        Parameters:
+            sink (function): Function called with each batch of rows (list of dict)
+            start_time (datetime or string): Beginning of timespan (default: None)
+            end_time (datetime or string): End of timespan (default: None)
+            object_ids (list of strings): Object IDs (default: None)
+            checkpoint_path (string): Path of a checkpoint file for the fetch (default is None, i.e., no checkpoint)
+            checkpoint_interval (int): Number of pages in each batch handed to the sink (default is 1)
+
+        Returns:
+            (int): Number of rows handed to the sink by this call
+        """
+        if not self.time_series_database or not self.object_database:
+            raise ValueError('Fetching data by time interval and/or object ID only enabled for object time series databases')
+        if checkpoint_interval < 1:
+            raise ValueError('Checkpoint interval must be at least one page')
+        if start_time is not None:
+            start_time = self._python_datetime_utc(start_time)
+        if end_time is not None:
+            end_time = self._python_datetime_utc(end_time)
+        sink_batcher = self._sink_batcher(
+            checkpoint_path,
+            start_time,
+            end_time,
+            object_ids,
+            checkpoint_interval
+        )
+        if sink_batcher.complete:
+            logger.info('Fetch in checkpoint {} is already complete'.format(checkpoint_path))
+            return 0
+        for datapoints in self._iter_datapoint_pages_object_time_series(
+            sink_batcher.start_time,
+            end_time,
+            object_ids
+        ):
+            for rows in sink_batcher.add_page(datapoints):
+                sink(rows)
+        for rows in sink_batcher.finish():
+            sink(rows)
+        logger.info('Handed {} rows to sink'.format(sink_batcher.num_rows))
+        return sink_batcher.num_rows
+
+    # Internal method for opening the checkpoint of a fetch into a sink (if a
+    # path is specified). Also returns the progress recorded in it.
+    def _load_fetch_checkpoint(
         self,
+        checkpoint_path,
         start_time,
         end_time,
         object_ids
     ):
-        data_ids = self._fetch_data_ids_object_time_series(
+        if checkpoint_path is None:
+            return None, None
+        checkpoint = FetchCheckpoint(
+            path=checkpoint_path,
+            start_time=self._datetime_honeycomb_string(start_time) if start_time is not None else None,
+            end_time=self._datetime_honeycomb_string(end_time) if end_time is not None else None,
+            object_ids=object_ids
+        )
+        progress = checkpoint.load()
+        if progress is not None and not progress['complete']:
+            logger.info('Resuming fetch from checkpoint {}: {} rows already handed to sink (through {})'.format(
+                checkpoint_path,
+                progress['num_rows'],
+                progress['timestamp']
+            ))
+        return checkpoint, progress
+
+    # Internal method for setting up the batching (and checkpointing, if a
+    # checkpoint path is specified) of a fetch into a sink
+    def _sink_batcher(
+        self,
+        checkpoint_path,
+        start_time,
+        end_time,
+        object_ids,
+        checkpoint_interval
+    ):
+        checkpoint, progress = self._load_fetch_checkpoint(
+            checkpoint_path,
             start_time,
             end_time,
             object_ids
         )
-        self._delete_datapoints(data_ids)
+        return SinkBatcher(
+            checkpoint=checkpoint,
+            progress=progress,
+            start_time=start_time,
+            checkpoint_interval=checkpoint_interval,
+            sink_rows=self._sink_rows,
+            sort_key=self._datapoint_sort_key,
+            parse_timestamp=self._python_datetime_utc,
+            format_timestamp=self._datetime_honeycomb_string
+        )
 
-    # Internal method for writing multiple datapoints of object time series data
-    # (Honeycomb-specific)
-    def _write_datapoints_object_time_series(
+    # Internal method for converting a batch of (unpacked) datapoints into the
+    # rows handed to a sink
+    def _sink_rows(
         self,
         datapoints
     ):
-        num_datapoints = len(datapoints)
-        parent_request_type = 'mutation'
-        parent_request_name = 'createDatapoints'
-        child_request_list = []
-        for datapoint_index, datapoint_dict in enumerate(datapoints):
-            timestamp = datapoint_dict.pop('timestamp')
-            object_id = datapoint_dict.pop('object_id')
-            assignment_id = self._lookup_assignment_id_object_time_series(timestamp, object_id)
-            timestamp_honeycomb_format = self._datetime_honeycomb_string(timestamp)
-            child_request_name = 'createDatapoint'
-            child_arguments = {
-                'datapoint': {
-                    'type': 'DatapointInput',
-                    'value': {
-                        'timestamp': timestamp_honeycomb_format,
-                        'format': 'application/json',
-                        'source_type': 'MEASURED',
-                        'source': assignment_id,
-                        'file': {
-                            'name': 'datapoint.json',
-                            'contentType': 'application/json',
-                            'data': datapoint_dict
-                        }
-                    }
-                }
-            }
-            child_return_object_name = 'data_id'
-            child_return_object = [
-                'data_id'
-            ]
-            child_request_list.append({
-                'name': child_request_name,
-                'arguments': child_arguments,
-                'return_object_name': child_return_object_name,
-                'return_object': child_return_object
-            })
-        createDatapoints_result = self.honeycomb_client.compound_request(
-            parent_request_type=parent_request_type,
-            parent_request_name=parent_request_name,
-            child_request_list=child_request_list
-        )
-        try:
-            data_ids = [createDatapoints_result['data_id_{}'.format(datapoint_index)]['data_id'] for datapoint_index in range(num_datapoints)]
-        except:
-            raise ValueError('Received unexpected response from Honeycomb: {}'.format(createDatapoints_result))
-        return data_ids
+        rows = []
+        for datapoint, timestamp in zip(datapoints, self._datapoint_timestamps(datapoints)):
+            rows.extend(self._parse_datapoint(datapoint, timestamp))
+        return rows
 
-    def _lookup_assignment_id_object_time_series(
+    def fetch_data_columns(
         self,
-        timestamp,
-        object_id
+        start_time=None,
+        end_time=None,
+        object_ids=None
     ):
         """
-        Look up the Honeycomb assignment ID for a given timestamp and object ID.
+        Fetch data for a given timespan and set of object IDs as NumPy columns.
+
+        Arguments are the same as for fetch_data_object_time_series(). Instead
+        of a list of dicts, returns a dict of equal-length NumPy arrays, one for
+        each key found in the data. Timestamps are returned as UTC
+        datetime64[us] values. Columns which contain only numbers are returned as
+        int64 or float64 arrays (with NaN for missing values); other columns are
+        returned as object arrays (with None for missing values).
+
+        Requires NumPy.
 
         Parameters:
-            # timestamp (string): Datetime at which we wish to know the assignment (as ISO-format string)
-            object_id (string): Object ID for which we wish to know the assignment
+            start_time (datetime or string): Beginning of timespan (default: None)
+            end_time (datetime or string): End of timespan (default: None)
+            object_ids (list of strings): Object IDs (default: None)
 
         Returns:
-            (string): Honeycomb assignment ID
+            (dict of array): Data associated with specified time span and object IDs
         """
-        if not self.time_series_database or not self.object_database or self.environment_name_honeycomb is None:
-            raise ValueError('Assignment ID lookup only enabled for object time series databases with Honeycomb environment specified')
-        for assignment in self.environment.get('assignments'):
-            if assignment.get('assigned_type') != self.object_type_honeycomb:
-                continue
-            if assignment.get('assigned').get(self.object_id_field_name_honeycomb) != object_id:
-                continue
-            timestamp_datetime = self._python_datetime_utc(timestamp)
-            start = assignment.get('start')
-            if start is not None and timestamp_datetime < self._python_datetime_utc(start):
-                continue
-            end = assignment.get('end')
-            if end is not None and timestamp_datetime > self._python_datetime_utc(end):
+        if np is None:
+            raise ImportError('NumPy must be installed to fetch data as columns')
+        if not self.time_series_database or not self.object_database:
+            raise ValueError('Fetching data by time interval and/or object ID only enabled for object time series databases')
+        if start_time is not None:
+            start_time = self._python_datetime_utc(start_time)
+        if end_time is not None:
+            end_time = self._python_datetime_utc(end_time)
+        column_builder = ColumnBuilder()
+        for datapoints in self._iter_datapoint_pages_object_time_series(
+            start_time,
+            end_time,
+            object_ids
+        ):
+            self._add_datapoints_to_column_builder(column_builder, datapoints)
+        return column_builder.columns()
+
+    def fetch_data_aggregates(
+        self,
+        window,
+        fields,
+        aggregations=None,
+        start_time=None,
+        end_time=None,
+        object_ids=None
+    ):
+        """
+        Fetch aggregates of numeric data for each object over fixed time windows.
+
+        Arguments for time span and object IDs are the same as for
+        fetch_data_object_time_series(). Instead of the rows themselves, returns
+        one dict for each object ID and window (aligned to the Unix epoch) in
+        which the object has data, with 'timestamp' (beginning of window) and
+        'object_id' elements and a '<field>_<aggregation>' element for each
+        field and aggregation (e.g., 'temperature_mean'). Aggregations are
+        'count' (number of numeric values), 'sum', 'mean', 'min', 'max', and
+        'last' (latest value). Values which are not numbers are ignored. If a
+        field has no numeric values in a window, its count is 0 and its other
+        aggregates are None.
+
+        Aggregates are updated as each page of datapoints arrives from
+        Honeycomb (see WindowAggregator), so only the aggregated series is held
+        in memory.
+
+        Requires NumPy.
+
+        Parameters:
+            window (timedelta or float): Length of each window (in seconds if float)
+            fields (list of string): Data keys to aggregate
+            aggregations (list of string): Aggregations to compute for each field (default is ['mean'])
+            start_time (datetime or string): Beginning of timespan (default: None)
+            end_time (datetime or string): End of timespan (default: None)
+            object_ids (list of strings): Object IDs (default: None)
+
+        Returns:
+            (list of dict): Aggregates for each window and object ID (sorted by window and object ID)
+        """
+        if np is None:
+            raise ImportError('NumPy must be installed to fetch data aggregates')
+        if not self.time_series_database or not self.object_database:
+            raise ValueError('Fetching data by time interval and/or object ID only enabled for object time series databases')
+        window_aggregator = WindowAggregator(
+            window=window,
+            fields=fields,
+            aggregations=aggregations if aggregations is not None else ['mean']
+        )
+        if start_time is not None:
+            start_time = self._python_datetime_utc(start_time)
+        if end_time is not None:
+            end_time = self._python_datetime_utc(end_time)
+        for datapoints in self._iter_datapoint_pages_object_time_series(
+            start_time,
+            end_time,
+            object_ids
+        ):
+            self._add_datapoints_to_column_builder(window_aggregator, datapoints)
+        return window_aggregator.aggregates()
+
+    # Internal method for adding a page of datapoints returned by Honeycomb to a
+    # ColumnBuilder (or a WindowAggregator)
+    def _add_datapoints_to_column_builder(
+        self,
+        column_builder,
+        datapoints
+    ):
+        for datapoint, timestamp in zip(datapoints, self._datapoint_timestamps(datapoints)):
+            source = datapoint.get('source')
+            data_blob = datapoint.get('file', {}).get('data')
+            if self.instrumentation is not None:
+                parse_start = time.perf_counter()
+                extracted_data_dict_list = self.parse_data_blob(data_blob)
+                self.instrumentation.observe('parse_seconds', time.perf_counter() - parse_start)
+                self.instrumentation.count('rows', len(extracted_data_dict_list))
+            else:
+                extracted_data_dict_list = self.parse_data_blob(data_blob)
+            column_builder.add_datapoint(
+                timestamp=timestamp,
+                environment_name=source.get('environment', {}).get('name'),
+                object_id=source.get('assigned', {}).get(self.object_id_field_name_honeycomb),
+                extracted_data_dict_list=extracted_data_dict_list
+            )
+        column_builder.end_page()
+
+    def fetch_data_frame(
+        self,
+        start_time=None,
+        end_time=None,
+        object_ids=None
+    ):
+        """
+        Fetch data for a given timespan and set of object IDs as a DataFrame.
+
+        Arguments are the same as for fetch_data_object_time_series(). Columns
+        are built as in fetch_data_columns(). Timestamps are returned as
+        timezone-aware (UTC) datetimes and object ID and environment name are
+        returned as categoricals.
+
+        Requires NumPy and pandas.
+
+        Parameters:
+            start_time (datetime or string): Beginning of timespan (default: None)
+            end_time (datetime or string): End of timespan (default: None)
+            object_ids (list of strings): Object IDs (default: None)
+
+        Returns:
+            (DataFrame): Data associated with specified time span and object IDs
+        """
+        if pd is None:
+            raise ImportError('pandas must be installed to fetch data as a DataFrame')
+        columns = self.fetch_data_columns(
+            start_time,
+            end_time,
+            object_ids
+        )
+        return self._data_frame_from_columns(columns)
+
+    def _data_frame_from_columns(self, columns):
+        columns['timestamp'] = pd.to_datetime(columns['timestamp'], utc=True)
+        columns['environment_name'] = pd.Categorical(columns['environment_name'])
+        columns['object_id'] = pd.Categorical(columns['object_id'])
+        data_frame = pd.DataFrame(columns)
+        return data_frame
+
+    # Internal method for converting a datapoint returned by Honeycomb into a
+    # list of data dictionaries (the datapoint's timestamp can be passed in if
+    # it has already been parsed)
+    def _parse_datapoint(
+        self,
+        datapoint,
+        timestamp=None
+    ):
+        source = datapoint.get('source')
+        if timestamp is None:
+            timestamp = self._python_datetime_utc(datapoint.get('timestamp'))
+        environment_name = source.get('environment', {}).get('name')
+        object_id = source.get('assigned', {}).get(self.object_id_field_name_honeycomb)
+        base_data_dict = {
+            'timestamp': timestamp,
+            'environment_name': environment_name,
+            'object_id': object_id
+        }
+        data_blob = datapoint.get('file', {}).get('data')
+        if self.instrumentation is not None:
+            parse_start = time.perf_counter()
+            extracted_data_dict_list = self.parse_data_blob(data_blob)
+            self.instrumentation.observe('parse_seconds', time.perf_counter() - parse_start)
+            self.instrumentation.count('rows', len(extracted_data_dict_list))
+        else:
+            extracted_data_dict_list = self.parse_data_blob(data_blob)
+        data = []
+        for extracted_data_dict in extracted_data_dict_list:
+            sanitized_extracted_data_dict = dict()
+            for key, value in extracted_data_dict.items():
+                if key in base_data_dict.keys():
+                    sanitized_extracted_data_dict[key + '_secondary'] = extracted_data_dict[key]
+                else:
+                    sanitized_extracted_data_dict[key] = extracted_data_dict[key]
+            complete_data_dict = {**base_data_dict, **sanitized_extracted_data_dict}
+            data.append(complete_data_dict)
+        return data
+
+    # Internal method for parsing a data blob from Honeycomb into a list of dictionaries
+    #
+    # Dicts are returned as is, lists are flattened, and strings (or bytes) are
+    # decoded as JSON (repeatedly, if the JSON encodes a string) or, failing
+    # that, split into lines which are decoded separately (NDJSON). Anything
+    # else yields no dictionaries. Strings which are clearly NDJSON (the first
+    # non-blank line is a complete JSON document and more content follows) are
+    # split without first attempting to decode the whole string.
+    def parse_data_blob(
+        self,
+        data_blob
+    ):
+        data_dict_list=[]
+        stack = [data_blob]
+        while len(stack) > 0:
+            item = stack.pop()
+            if isinstance(item, dict):
+                data_dict_list.append(item)
+                continue
+            if isinstance(item, list):
+                stack.extend(reversed(item))
+                continue
+            if isinstance(item, str) and '\n' in item:
+                lines = item.split('\n')
+                first_line_index = next((line_index for line_index, line in enumerate(lines) if len(line.strip(JSON_INLINE_WHITESPACE)) > 0), None)
+                if first_line_index is None:
+                    continue
+                safe_for_orjson = orjson_safe(item)
+                first_line_decoded, first_line_value = decode_json(lines[first_line_index], safe_for_orjson)
+                if not first_line_decoded:
+                    decoded, value = decode_json(item, safe_for_orjson)
+                    if decoded:
+                        stack.append(value)
+                        continue
+                line_values = []
+                if first_line_decoded:
+                    line_values.append(first_line_value)
+                for line in lines[(first_line_index + 1):]:
+                    if len(line) == 0:
+                        continue
+                    decoded, value = decode_json(line, safe_for_orjson)
+                    if decoded:
+                        line_values.append(value)
+                stack.extend(reversed(line_values))
+                continue
+            decoded, value = decode_json(item)
+            if decoded:
+                stack.append(value)
+        return data_dict_list
+
+    # Internal method for deleting object time series data (Honeycomb-specific).
+    # If a pack interval is specified, packs which hold measurements both
+    # inside and outside the time span are written again without the deleted
+    # measurements before the original packs are deleted (so a failure can
+    # leave measurements duplicated but never loses any).
+    def _delete_data_object_time_series(
+        self,
+        start_time,
+        end_time,
+        object_ids
+    ):
+        replacement_packs = []
+        if self.pack_interval is not None:
+            packed_delete_plan = self._packed_delete_plan(start_time, end_time)
+            for datapoints in self._iter_packed_datapoint_pages_object_time_series(
+                self._packed_query_start_time(start_time),
+                end_time,
+                object_ids,
+                return_object=LEAN_FETCH_DATA_RETURN_OBJECT
+            ):
+                packed_delete_plan.add_page(datapoints)
+            data_ids = packed_delete_plan.data_ids
+            replacement_packs = packed_delete_plan.replacement_packs
+        else:
+            data_ids = self._fetch_data_ids_object_time_series(
+                start_time,
+                end_time,
+                object_ids
+            )
+        try:
+            if len(replacement_packs) > 0:
+                self._process_chunks(
+                    items=replacement_packs,
+                    chunk_size=self.write_chunk_size,
+                    max_workers=self.write_max_workers,
+                    chunk_function=self._write_datapoints_object_time_series,
+                    max_retries=self.write_retries,
+                    retry_backoff=self.write_retry_backoff
+                )
+            self._delete_datapoints(data_ids)
+        finally:
+            if self.cache is not None:
+                self._invalidate_deleted_span(start_time, end_time, object_ids)
+
+    # Internal method for invalidating the cached coverage of a deleted time
+    # span (widened to cover packs which begin before the start time)
+    def _invalidate_deleted_span(
+        self,
+        start_time,
+        end_time,
+        object_ids
+    ):
+        start_time = self._packed_query_start_time(start_time)
+        self.cache.invalidate(
+            environment=self.environment_name_honeycomb,
+            assignment_ids=self._fetch_assignment_ids_object_time_series(
+                start_time,
+                end_time,
+                object_ids
+            ),
+            start=self._datetime_honeycomb_string(start_time) if start_time is not None else MIN_TIMESTAMP,
+            end=self._datetime_honeycomb_string(end_time) if end_time is not None else MAX_TIMESTAMP
+        )
+
+    # Internal method for starting the plan of a delete when datapoints may be
+    # packed (see PackedDeletePlan)
+    def _packed_delete_plan(
+        self,
+        start_time,
+        end_time
+    ):
+        return PackedDeletePlan(
+            start_time=start_time,
+            end_time=end_time,
+            parse_data_blob=self.parse_data_blob,
+            parse_timestamp=self._python_datetime_utc
+        )
+
+    # Internal method for writing multiple datapoints of object time series data
+    # (Honeycomb-specific)
+    def _write_datapoints_object_time_series(
+        self,
+        datapoints
+    ):
+        if self.pack_interval is not None and len(datapoints) > 0 and not isinstance(datapoints[0], DatapointPack):
+            packs, pack_indices = self._pack_datapoints(datapoints)
+            pack_data_ids = self._write_datapoints_object_time_series(packs)
+            return [pack_data_ids[pack_index] for pack_index in pack_indices]
+        num_datapoints = len(datapoints)
+        parent_request_type = 'mutation'
+        parent_request_name = 'createDatapoints'
+        child_request_list, assignment_timestamps = self._create_datapoints_child_request_list(datapoints)
+        createDatapoints_result = self.honeycomb_client.compound_request(
+            parent_request_type=parent_request_type,
+            parent_request_name=parent_request_name,
+            child_request_list=child_request_list
+        )
+        data_ids = self._parse_create_datapoints_result(createDatapoints_result, num_datapoints)
+        self._invalidate_cached_ranges(assignment_timestamps)
+        if self.instrumentation is not None:
+            self.instrumentation.count('datapoints_written', num_datapoints)
+        return data_ids
+
+    # Internal method for building the createDatapoint child requests of a
+    # createDatapoints compound request (for datapoint dicts or DatapointPacks).
+    # Also returns the (assignment ID, timestamp) pair of each datapoint.
+    def _create_datapoints_child_request_list(
+        self,
+        datapoints
+    ):
+        child_request_list = []
+        assignment_timestamps = []
+        timestamps_honeycomb_format = self._datetime_honeycomb_strings([
+            datapoint_dict.timestamp if isinstance(datapoint_dict, DatapointPack) else datapoint_dict['timestamp']
+            for datapoint_dict in datapoints
+        ])
+        for datapoint_dict, timestamp_honeycomb_format in zip(datapoints, timestamps_honeycomb_format):
+            if isinstance(datapoint_dict, DatapointPack):
+                assignment_id = datapoint_dict.assignment_id
+                file_name, content_type = PACKED_DATAPOINT_FILES[self.pack_format]
+                child_arguments = self._create_datapoint_arguments(
+                    timestamp_honeycomb_format,
+                    assignment_id,
+                    self._packed_data(datapoint_dict),
+                    file_name=file_name,
+                    content_type=content_type
+                )
+            else:
+                timestamp = datapoint_dict['timestamp']
+                object_id = datapoint_dict['object_id']
+                data = {key: value for key, value in datapoint_dict.items() if key != 'timestamp' and key != 'object_id'}
+                assignment_id = self._lookup_assignment_id_object_time_series(timestamp, object_id)
+                child_arguments = self._create_datapoint_arguments(
+                    timestamp_honeycomb_format,
+                    assignment_id,
+                    data
+                )
+            assignment_timestamps.append((assignment_id, timestamp_honeycomb_format))
+            child_request_name = 'createDatapoint'
+            child_return_object_name = 'data_id'
+            child_return_object = [
+                'data_id'
+            ]
+            child_request_list.append({
+                'name': child_request_name,
+                'arguments': child_arguments,
+                'return_object_name': child_return_object_name,
+                'return_object': child_return_object
+            })
+        return child_request_list, assignment_timestamps
+
+    # Internal method for building the file data of a packed datapoint: a list
+    # of measurements (each with its timestamp) or the same as NDJSON text
+    def _packed_data(
+        self,
+        pack
+    ):
+        measurements = sorted(pack.measurements, key=lambda measurement: measurement[0])
+        timestamps_honeycomb_format = self._datetime_honeycomb_strings([timestamp for timestamp, datapoint_dict in measurements])
+        records = []
+        for (timestamp, datapoint_dict), timestamp_honeycomb_format in zip(measurements, timestamps_honeycomb_format):
+            record = {key: value for key, value in datapoint_dict.items() if key != 'timestamp' and key != 'object_id'}
+            record['timestamp'] = timestamp_honeycomb_format
+            records.append(record)
+        if self.pack_format == 'ndjson':
+            return '\n'.join([json.dumps(record) for record in records])
+        return records
+
+    def _create_datapoint_arguments(
+        self,
+        timestamp_honeycomb_format,
+        assignment_id,
+        data,
+        file_name='datapoint.json',
+        content_type='application/json'
+    ):
+        arguments = {
+            'datapoint': {
+                'type': 'DatapointInput',
+                'value': {
+                    'timestamp': timestamp_honeycomb_format,
+                    'format': 'application/json',
+                    'source_type': 'MEASURED',
+                    'source': assignment_id,
+                    'file': {
+                        'name': file_name,
+                        'contentType': content_type,
+                        'data': data
+                    }
+                }
+            }
+        }
+        return arguments
+
+    def _parse_create_datapoints_result(
+        self,
+        createDatapoints_result,
+        num_datapoints
+    ):
+        try:
+            data_ids = [createDatapoints_result['data_id_{}'.format(datapoint_index)]['data_id'] for datapoint_index in range(num_datapoints)]
+        except:
+            raise ValueError('Received unexpected response from Honeycomb: {}'.format(createDatapoints_result))
+        return data_ids
+
+    # Internal method for dropping cached ranges which newly written datapoints
+    # fall into, so that they are fetched again (with the new datapoints) from
+    # Honeycomb
+    def _invalidate_cached_ranges(
+        self,
+        assignment_timestamps
+    ):
+        if self.cache is None:
+            return
+        assignment_time_ranges = dict()
+        for assignment_id, timestamp_honeycomb_format in assignment_timestamps:
+            if assignment_id is None:
                 continue
-            return assignment.get('assignment_id')
+            if assignment_id not in assignment_time_ranges.keys():
+                assignment_time_ranges[assignment_id] = (timestamp_honeycomb_format, timestamp_honeycomb_format)
+                continue
+            range_start, range_end = assignment_time_ranges[assignment_id]
+            assignment_time_ranges[assignment_id] = (
+                min(range_start, timestamp_honeycomb_format),
+                max(range_end, timestamp_honeycomb_format)
+            )
+        for assignment_id, (range_start, range_end) in assignment_time_ranges.items():
+            self.cache.invalidate(
+                environment=self.environment_name_honeycomb,
+                assignment_ids=[assignment_id],
+                start=range_start,
+                end=range_end
+            )
+
+    def _lookup_assignment_id_object_time_series(
+        self,
+        timestamp,
+        object_id
+    ):
+        """
+        Look up the Honeycomb assignment ID for a given timestamp and object ID.
+
+        Parameters:
+            # timestamp (string): Datetime at which we wish to know the assignment (as ISO-format string)
+            object_id (string): Object ID for which we wish to know the assignment
+
+        Returns:
+            (string): Honeycomb assignment ID
+        """
+        if not self.time_series_database or not self.object_database or self.environment_name_honeycomb is None:
+            raise ValueError('Assignment ID lookup only enabled for object time series databases with Honeycomb environment specified')
+        if self.instrumentation is not None:
+            lookup_start = time.perf_counter()
+            assignment_id = self._lookup_assignment_id_in_index(
+                self.assignment_index,
+                timestamp,
+                object_id
+            )
+            self.instrumentation.observe('lookup_seconds', time.perf_counter() - lookup_start)
+        else:
+            assignment_id = self._lookup_assignment_id_in_index(
+                self.assignment_index,
+                timestamp,
+                object_id
+            )
+        if assignment_id is not None:
+            return assignment_id
+        if self.instrumentation is not None:
+            self.instrumentation.count('lookup_misses')
+        if self.environment_refresh_on_miss and self._refresh_environment_on_miss():
+            assignment_id = self._lookup_assignment_id_in_index(
+                self.assignment_index,
+                timestamp,
+                object_id
+            )
+            if assignment_id is not None:
+                return assignment_id
         logger.warning('No assignment found for {} at {}'.format(
             object_id,
             timestamp
         ))
         return None
 
+    def _lookup_assignment_id_in_index(
+        self,
+        assignment_index,
+        timestamp,
+        object_id
+    ):
+        assignment_intervals = assignment_index.get((self.object_type_honeycomb, object_id))
+        if assignment_intervals is None:
+            return None
+        return assignment_intervals.lookup(self._python_datetime_utc(timestamp))
+
+    def _build_assignment_index(
+        self,
+        assignments
+    ):
+        """
+        Build an index of assignment intervals keyed by object type and object ID.
+
+        Assignment start and end times are parsed once here so that assignment
+        lookups on the write path reduce to a bisect over presorted intervals.
+
+        Parameters:
+            assignments (list of dict): Assignments as returned by getEnvironment
+
+        Returns:
+            (dict): Map from (object type, object ID) to AssignmentIntervals
+        """
+        assignment_index = dict()
+        if assignments is None:
+            return assignment_index
+        for assignment_position, assignment in enumerate(assignments):
+            if assignment.get('assigned_type') != self.object_type_honeycomb:
+                continue
+            object_id = assignment.get('assigned').get(self.object_id_field_name_honeycomb)
+            start = assignment.get('start')
+            end = assignment.get('end')
+            key = (self.object_type_honeycomb, object_id)
+            if key not in assignment_index.keys():
+                assignment_index[key] = AssignmentIntervals()
+            assignment_index[key].add(
+                assignment_id=assignment.get('assignment_id'),
+                start=self._python_datetime_utc(start) if start is not None else None,
+                end=self._python_datetime_utc(end) if end is not None else None,
+                position=assignment_position
+            )
+        for assignment_intervals in assignment_index.values():
+            assignment_intervals.finalize()
+        return assignment_index
+
     def _fetch_data_ids_object_time_series(
         self,
         start_time=None,
@@ -394,7 +1652,8 @@ class DatabaseConnectionHoneycomb(DatabaseConnection):
         datapoints = self._fetch_datapoints_object_time_series(
             start_time,
             end_time,
-            object_ids
+            object_ids,
+            return_object=FETCH_DATA_IDS_RETURN_OBJECT
         )
         data_ids = []
         for datapoint in datapoints:
@@ -405,235 +1664,1897 @@ class DatabaseConnectionHoneycomb(DatabaseConnection):
         self,
         start_time=None,
         end_time=None,
-        object_ids=None
+        object_ids=None,
+        return_object=None
+    ):
+        datapoints = []
+        for chunk_datapoints in self._iter_datapoint_pages_object_time_series(
+            start_time,
+            end_time,
+            object_ids,
+            return_object
+        ):
+            datapoints.extend(chunk_datapoints)
+        return datapoints
+
+    # Internal method for iterating over pages of datapoints in (timestamp, data
+    # ID) order. Datapoints repeated across page boundaries are dropped. When
+    # datapoint files are fetched, packed datapoints are unpacked (see
+    # _unpack_datapoints()) and their measurements merged back into
+    # (timestamp, data ID) order (see UnpackedDatapointMerger).
+    def _iter_datapoint_pages_object_time_series(
+        self,
+        start_time=None,
+        end_time=None,
+        object_ids=None,
+        return_object=None
+    ):
+        if return_object is not None and return_object is not FETCH_DATA_RETURN_OBJECT:
+            yield from self._iter_packed_datapoint_pages_object_time_series(
+                start_time,
+                end_time,
+                object_ids,
+                return_object
+            )
+            return
+        merger = self._unpacked_datapoint_merger(start_time, end_time)
+        for datapoints in self._iter_packed_datapoint_pages_object_time_series(
+            start_time,
+            end_time,
+            object_ids,
+            return_object
+        ):
+            datapoints = merger.add(datapoints)
+            if len(datapoints) > 0:
+                yield datapoints
+        datapoints = merger.finish()
+        if len(datapoints) > 0:
+            yield datapoints
+
+    def _unpacked_datapoint_merger(
+        self,
+        start_time=None,
+        end_time=None
+    ):
+        return UnpackedDatapointMerger(
+            unpack=lambda datapoints: self._unpack_datapoints(datapoints, start_time, end_time),
+            sort_key=self._datapoint_sort_key
+        )
+
+    def _iter_packed_datapoint_pages_object_time_series(
+        self,
+        start_time=None,
+        end_time=None,
+        object_ids=None,
+        return_object=None
     ):
         if not self.time_series_database or not self.object_database:
             raise ValueError('Fetching datapoints by time interval and/or object ID only enabled for object time series databases')
+        start_time = self._packed_query_start_time(start_time, return_object)
         assignment_ids = self._fetch_assignment_ids_object_time_series(
             start_time,
             end_time,
             object_ids
         )
         if len(assignment_ids) == 0:
-            return []
-        query_expression = self._combined_query_expression(
+            return
+        if self.cache is not None and (return_object is None or return_object is FETCH_DATA_RETURN_OBJECT):
+            yield from self._iter_cached_datapoint_pages(
+                assignment_ids,
+                start_time,
+                end_time,
+                object_ids
+            )
+            return
+        resolve_sources = self.read_lean_fetch and (return_object is None or return_object is FETCH_DATA_RETURN_OBJECT)
+        if resolve_sources:
+            return_object = LEAN_FETCH_DATA_RETURN_OBJECT
+        query_expressions, shards_time_ordered = self._shard_query_expressions(
             assignment_ids,
             start_time,
-            end_time
+            end_time,
+            object_ids
         )
-        datapoints = []
-        chunk_counter = 1
-        data_ids = set()
-        cursor = None
-        while True:
-            arguments = self._fetch_datapoints_arguments(
-                query_expression,
-                cursor
-            )
-            searchDatapoints_result = self.honeycomb_client.request(
-                request_type='query',
-                request_name='searchDatapoints',
-                arguments=arguments,
-                return_object=FETCH_DATA_RETURN_OBJECT
-            )
-            count = searchDatapoints_result.get('page_info').get('count')
-            cursor = searchDatapoints_result.get('page_info').get('cursor')
-            if cursor is None or count == 0:
-                break
-            chunk_datapoints = searchDatapoints_result.get('data')
-            first_timestamp = chunk_datapoints[0].get('timestamp')
-            last_timestamp = chunk_datapoints[-1].get('timestamp')
-            datapoints_added = 0
-            for datapoint in chunk_datapoints:
-                data_id = datapoint.get('data_id')
-                if data_id not in data_ids:
-                    data_ids.add(data_id)
-                    datapoints.append(datapoint)
-                    datapoints_added +=1
-            logger.info('Chunk {}: fetched {} results from {} to {} containing {} new datapoints'.format(
-                chunk_counter,
-                count,
-                first_timestamp,
-                last_timestamp,
-                datapoints_added
-            ))
-            chunk_counter += 1
-        return datapoints
+        for datapoints in self._iter_sharded_datapoint_pages(
+            query_expressions,
+            shards_time_ordered=shards_time_ordered,
+            return_object=return_object
+        ):
+            if resolve_sources:
+                self._resolve_datapoint_sources(datapoints)
+            yield datapoints
 
-    def _fetch_assignment_ids_object_time_series(
+    # Internal method for moving the start of a fetch back by the pack interval,
+    # so that packs which begin before the start time but hold later
+    # measurements are fetched (datapoints are only fetched with their files,
+    # and so unpacked, if no other return object is specified)
+    def _packed_query_start_time(
+        self,
+        start_time,
+        return_object=None
+    ):
+        if self.pack_interval is None or start_time is None:
+            return start_time
+        if return_object is not None and return_object is not FETCH_DATA_RETURN_OBJECT:
+            return start_time
+        return start_time - self.pack_interval
+
+    # Internal method for replacing each packed datapoint with one datapoint per
+    # measurement (with the measurement's timestamp and the pack's data ID and
+    # source). If the fetch was widened to catch earlier packs, measurements
+    # (and unpacked datapoints) outside the requested time span are dropped.
+    def _unpack_datapoints(
         self,
+        datapoints,
         start_time=None,
-        end_time=None,
-        object_ids=None
+        end_time=None
     ):
-        if not self.time_series_database or not self.object_database or self.environment_name_honeycomb is None:
-            raise ValueError('Assignment ID lookup only enabled for object time series databases with Honeycomb environment specified')
-        relevant_assignment_ids = []
-        for assignment in self.environment.get('assignments'):
-            if assignment.get('assigned_type') != self.object_type_honeycomb:
+        filter_times = self.pack_interval is not None and start_time is not None
+        unpacked_datapoints = []
+        for datapoint in datapoints:
+            if not is_packed_datapoint(datapoint):
+                if filter_times and self._python_datetime_utc(datapoint.get('timestamp')) < start_time:
+                    continue
+                unpacked_datapoints.append(datapoint)
+                continue
+            for record in self.parse_data_blob(datapoint['file'].get('data')):
+                record = dict(record)
+                timestamp = record.pop('timestamp', None)
+                if timestamp is None:
+                    timestamp = datapoint.get('timestamp')
+                if start_time is not None or end_time is not None:
+                    parsed_timestamp = self._python_datetime_utc(timestamp)
+                    if start_time is not None and parsed_timestamp < start_time:
+                        continue
+                    if end_time is not None and parsed_timestamp > end_time:
+                        continue
+                unpacked_datapoints.append({
+                    'data_id': datapoint.get('data_id'),
+                    'timestamp': timestamp,
+                    'source': datapoint.get('source'),
+                    'file': {
+                        'data': record,
+                        'name': 'datapoint.json',
+                        'contentType': 'application/json'
+                    }
+                })
+        return unpacked_datapoints
+
+    # Internal method for filling in the source of each datapoint fetched with
+    # LEAN_FETCH_DATA_RETURN_OBJECT (which returns only the assignment ID) with
+    # the environment name and assigned object fields that Honeycomb returns
+    # for FETCH_DATA_RETURN_OBJECT
+    def _resolve_datapoint_sources(self, datapoints):
+        assignment_sources = self._assignment_sources_by_id()
+        for datapoint in datapoints:
+            assignment_id = (datapoint.get('source') or {}).get('assignment_id')
+            datapoint['source'] = assignment_sources.get(assignment_id, {})
+        return datapoints
+
+    # Internal method for building (once per loaded environment) a map from
+    # assignment ID to datapoint source as Honeycomb would return it for
+    # FETCH_DATA_RETURN_OBJECT (see ASSIGNED_SOURCE_FIELDS)
+    def _assignment_sources_by_id(self):
+        environment = self.environment
+        assignment_sources = self._assignment_sources
+        if assignment_sources is not None and assignment_sources[0] is environment:
+            return assignment_sources[1]
+        assignment_sources_by_id = dict()
+        for assignment in environment.get('assignments') or []:
+            assigned = assignment.get('assigned') or {}
+            source_fields = ASSIGNED_SOURCE_FIELDS.get(assignment.get('assigned_type'), [])
+            source_assigned = {field: assigned.get(field) for field in source_fields}
+            assignment_sources_by_id[assignment.get('assignment_id')] = {
+                'assignment_id': assignment.get('assignment_id'),
+                'environment': {
+                    'name': environment.get('name')
+                },
+                'assigned': source_assigned
+            }
+        self._assignment_sources = (environment, assignment_sources_by_id)
+        return assignment_sources_by_id
+
+    # Internal method for building the query expressions for a fetch: one per
+    # shard if sharded fetches are enabled and otherwise a single expression,
+    # each split further by _planned_query_expressions(). Also returns a flag
+    # indicating whether the queries are consecutive time windows.
+    def _shard_query_expressions(
+        self,
+        assignment_ids,
+        start_time=None,
+        end_time=None,
+        object_ids=None
+    ):
+        if self.read_shard_mode == 'time' and start_time is not None and end_time is not None:
+            requested_assignment_ids = set(assignment_ids)
+            query_expressions = []
+            shards_time_ordered = True
+            for shard_start_time, shard_end_time in self._time_shards(start_time, end_time):
+                # Only the requested assignments which overlap the shard
+                shard_assignment_ids = [
+                    assignment_id for assignment_id in self._fetch_assignment_ids_object_time_series(
+                        shard_start_time,
+                        shard_end_time,
+                        object_ids
+                    )
+                    if assignment_id in requested_assignment_ids
+                ]
+                if len(shard_assignment_ids) == 0:
+                    continue
+                shard_query_expressions = self._planned_query_expressions(
+                    shard_assignment_ids,
+                    shard_start_time,
+                    shard_end_time
+                )
+                # Sub-queries of a time shard overlap in time, so their results
+                # have to be merged
+                if len(shard_query_expressions) > 1:
+                    shards_time_ordered = False
+                query_expressions.extend(shard_query_expressions)
+            return query_expressions, shards_time_ordered
+        if self.read_shard_mode == 'assignments' and len(assignment_ids) > 1:
+            num_shards = min(self.read_shard_count or self.read_max_workers, len(assignment_ids))
+            shard_size = math.ceil(len(assignment_ids) / num_shards)
+            query_expressions = []
+            for shard_beginning in range(0, len(assignment_ids), shard_size):
+                query_expressions.extend(self._planned_query_expressions(
+                    assignment_ids[shard_beginning:(shard_beginning + shard_size)],
+                    start_time,
+                    end_time
+                ))
+            return query_expressions, False
+        query_expressions = self._planned_query_expressions(
+            assignment_ids,
+            start_time,
+            end_time
+        )
+        return query_expressions, len(query_expressions) == 1
+
+    # Internal method for planning the queries for a set of assignments. The
+    # assignments are sorted by start time and split into groups of at most
+    # read_max_query_assignments (so that no single filter grows with the size
+    # of the environment), and the time bounds of each group's query are
+    # clipped to the span of its assignments' intervals. As in the datapoint
+    # cache, datapoints are assumed to fall within the interval of the
+    # assignment they are attached to.
+    def _planned_query_expressions(
+        self,
+        assignment_ids,
+        start_time=None,
+        end_time=None
+    ):
+        assignment_intervals = self._assignment_intervals_by_id()
+        assignment_ids = sorted(
+            assignment_ids,
+            key=lambda assignment_id: self._interval_start_sort_key(assignment_intervals.get(assignment_id))
+        )
+        group_size = self.read_max_query_assignments or len(assignment_ids)
+        query_expressions = []
+        for group_beginning in range(0, len(assignment_ids), group_size):
+            group_assignment_ids = assignment_ids[group_beginning:(group_beginning + group_size)]
+            group_start_time, group_end_time = self._clip_time_range(
+                [assignment_intervals.get(assignment_id) for assignment_id in group_assignment_ids],
+                start_time,
+                end_time
+            )
+            query_expressions.append(self._combined_query_expression(
+                group_assignment_ids,
+                group_start_time,
+                group_end_time
+            ))
+        return query_expressions
+
+    # Internal method for looking up the (parsed) start and end of each
+    # assignment in the assignment index
+    def _assignment_intervals_by_id(self):
+        assignment_intervals = dict()
+        for object_assignment_intervals in self.assignment_index.values():
+            for start, end, position, assignment_id in object_assignment_intervals.intervals:
+                assignment_intervals[assignment_id] = (start, end)
+        return assignment_intervals
+
+    def _interval_start_sort_key(self, interval):
+        if interval is None or interval[0] is None:
+            return (False, 0)
+        return (True, interval[0])
+
+    # Internal method for narrowing a time range to the span of a set of
+    # assignment intervals (a missing start or end leaves that side open)
+    def _clip_time_range(
+        self,
+        intervals,
+        start_time=None,
+        end_time=None
+    ):
+        interval_starts = [interval[0] if interval is not None else None for interval in intervals]
+        if len(interval_starts) > 0 and None not in interval_starts:
+            span_start = min(interval_starts)
+            if start_time is None or span_start > start_time:
+                start_time = span_start
+        interval_ends = [interval[1] if interval is not None else None for interval in intervals]
+        if len(interval_ends) > 0 and None not in interval_ends:
+            span_end = max(interval_ends)
+            if end_time is None or span_end < end_time:
+                end_time = span_end
+        return start_time, end_time
+
+    # Internal method for iterating over pages of datapoints through the local
+    # datapoint cache. The parts of the requested range which the cache does not
+    # cover are fetched from Honeycomb (sharded and planned as for uncached
+    # fetches) and stored first; everything is then read back from the cache.
+    # Coverage is recorded up to the end of each fetched range (even if it held
+    # no datapoints) but never within CACHE_SETTLE_MARGIN of the present, since
+    # datapoints may still arrive there; fetched datapoints outside the
+    # recorded coverage (including those of a fetch which failed partway) are
+    # discarded from the cache once they have been read.
+    def _iter_cached_datapoint_pages(
+        self,
+        assignment_ids,
+        start_time=None,
+        end_time=None,
+        object_ids=None
+    ):
+        range_start = self._datetime_honeycomb_string(start_time) if start_time is not None else MIN_TIMESTAMP
+        range_end = self._datetime_honeycomb_string(end_time) if end_time is not None else MAX_TIMESTAMP
+        assignments = {assignment.get('assignment_id'): assignment for assignment in self.environment.get('assignments')}
+        uncovered_range_assignment_ids = dict()
+        for assignment_id in assignment_ids:
+            assignment_start = assignments.get(assignment_id, {}).get('start')
+            assignment_end = assignments.get(assignment_id, {}).get('end')
+            assignment_range_start = range_start
+            if assignment_start is not None:
+                assignment_range_start = max(range_start, self._datetime_honeycomb_string(assignment_start))
+            assignment_range_end = range_end
+            if assignment_end is not None:
+                assignment_range_end = min(range_end, self._datetime_honeycomb_string(assignment_end))
+            if assignment_range_start > assignment_range_end:
+                continue
+            for uncovered_range in self.cache.uncovered_ranges(
+                self.environment_name_honeycomb,
+                assignment_id,
+                assignment_range_start,
+                assignment_range_end
+            ):
+                if uncovered_range not in uncovered_range_assignment_ids.keys():
+                    uncovered_range_assignment_ids[uncovered_range] = []
+                uncovered_range_assignment_ids[uncovered_range].append(assignment_id)
+        fetched_ranges = []
+        try:
+            for (uncovered_start, uncovered_end), uncovered_assignment_ids in uncovered_range_assignment_ids.items():
+                logger.info('Fetching uncovered range {} to {} for {} assignments'.format(
+                    uncovered_start,
+                    uncovered_end,
+                    len(uncovered_assignment_ids)
+                ))
+                fetched_ranges.append((uncovered_assignment_ids, uncovered_start, uncovered_end))
+                query_expressions, shards_time_ordered = self._shard_query_expressions(
+                    uncovered_assignment_ids,
+                    self._python_datetime_utc(uncovered_start) if uncovered_start != MIN_TIMESTAMP else None,
+                    self._python_datetime_utc(uncovered_end) if uncovered_end != MAX_TIMESTAMP else None,
+                    object_ids
+                )
+                cache_return_object = LEAN_FETCH_DATA_RETURN_OBJECT if self.read_lean_fetch else CACHE_FETCH_DATA_RETURN_OBJECT
+                for chunk_datapoints in self._iter_sharded_datapoint_pages(
+                    query_expressions,
+                    shards_time_ordered=shards_time_ordered,
+                    return_object=cache_return_object
+                ):
+                    if self.read_lean_fetch:
+                        self._resolve_datapoint_sources(chunk_datapoints)
+                    cache_datapoints = []
+                    for datapoint in chunk_datapoints:
+                        cache_datapoints.append((
+                            datapoint.get('source').get('assignment_id'),
+                            self._datetime_honeycomb_string(datapoint.get('timestamp')),
+                            datapoint.get('data_id'),
+                            datapoint
+                        ))
+                    self.cache.add_datapoints(
+                        self.environment_name_honeycomb,
+                        cache_datapoints
+                    )
+                settled_timestamp = self._datetime_honeycomb_string(
+                    datetime.datetime.now(datetime.timezone.utc) - CACHE_SETTLE_MARGIN
+                )
+                covered_end = min(uncovered_end, settled_timestamp)
+                if covered_end < uncovered_start:
+                    continue
+                self.cache.add_coverage(
+                    self.environment_name_honeycomb,
+                    uncovered_assignment_ids,
+                    uncovered_start,
+                    covered_end
+                )
+            yield from self.cache.iter_datapoint_pages(
+                self.environment_name_honeycomb,
+                assignment_ids,
+                range_start,
+                range_end,
+                self.read_chunk_size
+            )
+        finally:
+            for fetched_assignment_ids, fetched_start, fetched_end in fetched_ranges:
+                self.cache.discard_uncovered_datapoints(
+                    self.environment_name_honeycomb,
+                    fetched_assignment_ids,
+                    fetched_start,
+                    fetched_end
+                )
+            self.cache.evict()
+
+    # Internal method for iterating over deduplicated pages of datapoints for a
+    # single query expression
+    def _iter_query_datapoint_pages(
+        self,
+        query_expression,
+        return_object=None
+    ):
+        pages = self._search_datapoints_pages(query_expression, return_object)
+        if self.read_ahead_pages is None or self.read_ahead_pages < 1:
+            yield from self._deduplicated_datapoint_pages(pages)
+            return
+        pages = read_ahead(pages, self.read_ahead_pages)
+        try:
+            yield from self._deduplicated_datapoint_pages(pages)
+        finally:
+            pages.close()
+
+    # Internal method for dropping datapoints which have already appeared in
+    # earlier pages (and pages which are left empty)
+    def _deduplicated_datapoint_pages(
+        self,
+        pages
+    ):
+        deduplicator = DatapointDeduplicator(self._python_datetime_utc)
+        chunk_counter = 1
+        for chunk_datapoints in pages:
+            new_chunk_datapoints = deduplicator.filter(chunk_datapoints)
+            logger.info('Chunk {}: fetched {} results from {} to {} containing {} new datapoints'.format(
+                chunk_counter,
+                len(chunk_datapoints),
+                chunk_datapoints[0].get('timestamp'),
+                chunk_datapoints[-1].get('timestamp'),
+                len(new_chunk_datapoints)
+            ))
+            chunk_counter += 1
+            if len(new_chunk_datapoints) > 0:
+                yield new_chunk_datapoints
+
+    # Internal method for running several query expressions at once and merging
+    # their datapoints back into (timestamp, data ID) order. The pages of each
+    # shard are fetched by a background thread into a bounded buffer (see
+    # read_ahead()), with at most read_max_workers requests in flight across
+    # all shards, so memory use is bounded by the number of shards being read
+    # and the read chunk size rather than by the size of the shards. If the
+    # shards are consecutive time windows, they are yielded one after another
+    # (with up to read_max_workers shards fetched ahead); otherwise their
+    # datapoints are merged lazily as pages arrive. Datapoints which fall on a
+    # shard boundary (and so are returned by both neighboring shards) are
+    # dropped the second time they appear. Stopping early stops the background
+    # threads without waiting for them.
+    def _iter_sharded_datapoint_pages(
+        self,
+        query_expressions,
+        shards_time_ordered,
+        return_object=None
+    ):
+        if len(query_expressions) == 0:
+            return
+        if len(query_expressions) == 1:
+            yield from self._iter_query_datapoint_pages(query_expressions[0], return_object)
+            return
+        logger.info('Fetching datapoints in {} shards'.format(len(query_expressions)))
+        deduplicator = DatapointDeduplicator(self._python_datetime_utc)
+        request_semaphore = threading.BoundedSemaphore(self.read_max_workers)
+        shard_depth = max(self.read_ahead_pages or 0, 1)
+        shard_pages_list = []
+        def start_shard(query_expression):
+            shard_pages_list.append(read_ahead(
+                self._deduplicated_datapoint_pages(self._search_datapoints_pages(
+                    query_expression,
+                    return_object,
+                    request_semaphore
+                )),
+                shard_depth
+            ))
+        try:
+            if shards_time_ordered:
+                for shard_index in range(len(query_expressions)):
+                    while len(shard_pages_list) < min(shard_index + self.read_max_workers, len(query_expressions)):
+                        start_shard(query_expressions[len(shard_pages_list)])
+                    for datapoints in shard_pages_list[shard_index]:
+                        new_datapoints = deduplicator.filter(datapoints)
+                        if len(new_datapoints) > 0:
+                            yield new_datapoints
+            else:
+                for query_expression in query_expressions:
+                    start_shard(query_expression)
+                for datapoints in self._merge_datapoint_pages(shard_pages_list):
+                    new_datapoints = deduplicator.filter(datapoints)
+                    if len(new_datapoints) > 0:
+                        yield new_datapoints
+        finally:
+            for shard_pages in shard_pages_list:
+                shard_pages.close()
+
+    # Internal method for merging several streams of sorted pages of datapoints
+    # into pages of (at most) read_chunk_size datapoints in (timestamp, data ID)
+    # order (see DatapointPageMerger)
+    def _merge_datapoint_pages(
+        self,
+        streams
+    ):
+        merger = DatapointPageMerger(
+            num_streams=len(streams),
+            page_size=self.read_chunk_size,
+            sort_key=self._datapoint_sort_key
+        )
+        stream_index = merger.next_stream()
+        while stream_index is not None:
+            yield from merger.add_page(stream_index, next(streams[stream_index], None))
+            stream_index = merger.next_stream()
+        datapoints = merger.finish()
+        if len(datapoints) > 0:
+            yield datapoints
+
+    def _datapoint_sort_key(
+        self,
+        datapoint
+    ):
+        return (
+            self._python_datetime_utc(datapoint.get('timestamp')),
+            datapoint.get('data_id')
+        )
+
+    # Internal method for splitting a time span into consecutive shards. Shard
+    # bounds are inclusive, so neighboring shards share their boundary.
+    def _time_shards(
+        self,
+        start_time,
+        end_time
+    ):
+        if end_time <= start_time:
+            return [(start_time, end_time)]
+        if self.read_shard_duration is not None:
+            num_shards = max(math.ceil((end_time - start_time) / self.read_shard_duration), 1)
+        else:
+            num_shards = self.read_shard_count or self.read_max_workers
+        shard_duration = (end_time - start_time) / num_shards
+        shard_boundaries = [start_time + shard_index * shard_duration for shard_index in range(num_shards)]
+        shard_boundaries.append(end_time)
+        time_shards = []
+        for shard_start_time, shard_end_time in zip(shard_boundaries[:-1], shard_boundaries[1:]):
+            time_shards.append((shard_start_time, shard_end_time))
+        return time_shards
+
+    # Internal method for walking the searchDatapoints cursor for a query
+    # expression, yielding the raw datapoints of each (nonempty) page
+    def _search_datapoints_pages(
+        self,
+        query_expression,
+        return_object=None,
+        request_semaphore=None
+    ):
+        if return_object is None:
+            return_object = FETCH_DATA_RETURN_OBJECT
+        cursor = None
+        while True:
+            arguments = self._fetch_datapoints_arguments(
+                query_expression,
+                cursor
+            )
+            if request_semaphore is not None:
+                request_semaphore.acquire()
+            try:
+                searchDatapoints_result = self.honeycomb_client.request(
+                    request_type='query',
+                    request_name='searchDatapoints',
+                    arguments=arguments,
+                    return_object=return_object
+                )
+            finally:
+                if request_semaphore is not None:
+                    request_semaphore.release()
+            count = searchDatapoints_result.get('page_info').get('count')
+            cursor = searchDatapoints_result.get('page_info').get('cursor')
+            if cursor is None or count == 0:
+                break
+            if self.instrumentation is not None:
+                self.instrumentation.count('pages')
+                self.instrumentation.count('datapoints_fetched', count)
+            yield searchDatapoints_result.get('data')
+
+    def _fetch_assignment_ids_object_time_series(
+        self,
+        start_time=None,
+        end_time=None,
+        object_ids=None
+    ):
+        if not self.time_series_database or not self.object_database or self.environment_name_honeycomb is None:
+            raise ValueError('Assignment ID lookup only enabled for object time series databases with Honeycomb environment specified')
+        if start_time is not None:
+            start_time = self._python_datetime_utc(start_time)
+        if end_time is not None:
+            end_time = self._python_datetime_utc(end_time)
+        relevant_assignment_ids = []
+        for assignment in self.environment.get('assignments'):
+            if assignment.get('assigned_type') != self.object_type_honeycomb:
                 continue
             if object_ids is not None and assignment.get('assigned').get(self.object_id_field_name_honeycomb) not in object_ids:
                 continue
             assignment_end = assignment.get('end')
-            if start_time is not None and assignment_end is not None and self._python_datetime_utc(start_time) > self._python_datetime_utc(assignment_end):
+            if start_time is not None and assignment_end is not None and start_time > self._python_datetime_utc(assignment_end):
                 continue
             assignment_start = assignment.get('start')
-            if end_time is not None and assignment_start is not None and self._python_datetime_utc(end_time) < self._python_datetime_utc(assignment_start):
+            if end_time is not None and assignment_start is not None and end_time < self._python_datetime_utc(assignment_start):
                 continue
             relevant_assignment_ids.append(assignment.get('assignment_id'))
         return relevant_assignment_ids
 
-    def _combined_query_expression(
+    def _combined_query_expression(
+        self,
+        assignment_ids,
+        start_time=None,
+        end_time=None
+    ):
+        combined_query_expression_list = []
+        combined_query_expression_list.append(self._assignment_ids_query_expression(assignment_ids))
+        if start_time is not None:
+            combined_query_expression_list.append(self._start_time_query_expression(start_time))
+        if end_time is not None:
+            combined_query_expression_list.append(self._end_time_query_expression(end_time))
+        combined_query_expression = self._query_expression(
+            operator='AND',
+            children_query_expression_list=combined_query_expression_list
+        )
+        return combined_query_expression
+
+    def _assignment_ids_query_expression(self, assignment_ids):
+        assignment_ids_query_expression_list = []
+        for assignment_id in assignment_ids:
+            assigment_id_query_expression = self._query_expression(
+                field='source',
+                operator='EQ',
+                value=assignment_id
+            )
+            assignment_ids_query_expression_list.append(assigment_id_query_expression)
+        assignment_ids_query_expression = self._query_expression(
+            operator='OR',
+            children_query_expression_list=assignment_ids_query_expression_list
+        )
+        return assignment_ids_query_expression
+
+    def _start_time_query_expression(self, start_time):
+        start_time_honeycomb_string = self._datetime_honeycomb_string(start_time)
+        start_time_query_expression = self._query_expression(
+            field='timestamp',
+            operator='GTE',
+            value=start_time_honeycomb_string
+        )
+        return start_time_query_expression
+
+    def _end_time_query_expression(self, end_time):
+        end_time_honeycomb_string = self._datetime_honeycomb_string(end_time)
+        end_time_query_expression = self._query_expression(
+            field='timestamp',
+            operator='LTE',
+            value=end_time_honeycomb_string
+        )
+        return end_time_query_expression
+
+    def _query_expression(
+        self,
+        field=None,
+        operator=None,
+        value=None,
+        children_query_expression_list=None
+    ):
+        query_expression = dict()
+        if field is not None:
+            query_expression['field'] = field
+        if operator is not None:
+            query_expression['operator'] = operator
+        if value is not None:
+            query_expression['value'] = value
+        if children_query_expression_list is not None:
+            query_expression['children'] = children_query_expression_list
+        return query_expression
+
+    def _fetch_datapoints_arguments(
+        self,
+        query_expression,
+        cursor = None
+    ):
+        if cursor is not None:
+            arguments = {
+                'query': {
+                    'type': 'QueryExpression!',
+                    'value': query_expression
+                },
+                'page': {
+                    'type': 'PaginationInput',
+                    'value': {
+                        'cursor': cursor,
+                        'max': self.read_chunk_size,
+                        'sort': [
+                            {
+                                'direction': 'ASC',
+                                'field': 'timestamp'
+                            },
+                            {
+                                'direction': 'ASC',
+                                'field': 'data_id'
+                            },
+                        ]
+                    }
+                }
+            }
+        else:
+            arguments = {
+                'query': {
+                    'type': 'QueryExpression!',
+                    'value': query_expression
+                },
+                'page': {
+                    'type': 'PaginationInput',
+                    'value': {
+                        'max': self.read_chunk_size,
+                        'sort': [
+                            {
+                                'direction': 'ASC',
+                                'field': 'timestamp'
+                            },
+                            {
+                                'direction': 'ASC',
+                                'field': 'data_id'
+                            },
+                        ]
+                    }
+                }
+            }
+        return arguments
+
+    def _delete_datapoints(self, data_ids):
+        statuses = self._process_chunks(
+            items=data_ids,
+            chunk_size=self.delete_chunk_size,
+            max_workers=self.delete_max_workers,
+            chunk_function=self._delete_datapoints_chunk
+        )
+        return statuses
+
+    # Internal method for deleting multiple datapoints in a single compound
+    # request (Honeycomb-specific)
+    def _delete_datapoints_chunk(self, data_ids):
+        num_data_ids = len(data_ids)
+        deleteDatapoints_result = self.honeycomb_client.compound_request(
+            parent_request_type='mutation',
+            parent_request_name='deleteDatapoints',
+            child_request_list=self._delete_datapoints_child_request_list(data_ids)
+        )
+        statuses = self._parse_delete_datapoints_result(deleteDatapoints_result, num_data_ids)
+        if self.instrumentation is not None:
+            self.instrumentation.count('datapoints_deleted', num_data_ids)
+        return statuses
+
+    def _delete_datapoints_child_request_list(self, data_ids):
+        child_request_list = []
+        for data_id in data_ids:
+            child_request_list.append({
+                'name': 'deleteDatapoint',
+                'arguments': {
+                    'data_id': {
+                        'type': 'ID',
+                        'value': data_id
+                    }
+                },
+                'return_object_name': 'status',
+                'return_object': [
+                    'status'
+                ]
+            })
+        return child_request_list
+
+    def _parse_delete_datapoints_result(
+        self,
+        deleteDatapoints_result,
+        num_data_ids
+    ):
+        try:
+            statuses = [deleteDatapoints_result['status_{}'.format(data_id_index)]['status'] for data_id_index in range(num_data_ids)]
+        except:
+            raise ValueError('Received unexpected response from Honeycomb: {}'.format(deleteDatapoints_result))
+        return statuses
+
+    def _delete_datapoint(self, data_id):
+        deleteDatapoint_results = self.honeycomb_client.request(
+            request_type='mutation',
+            request_name='deleteDatapoint',
+            arguments={
+                'data_id': {
+                    'type': 'ID',
+                    'value': data_id
+                }
+            },
+            return_object = [
+                'status'
+            ]
+        )
+        try:
+            status = deleteDatapoint_results.get('status')
+        except:
+            raise ValueError('Received unexpected response from Honeycomb')
+        return status
+
+    def _datetime_honeycomb_string(self, timestamp):
+        return datetime_honeycomb_string(timestamp)
+
+    def _datetime_honeycomb_strings(self, timestamps):
+        return datetime_honeycomb_strings(timestamps)
+
+    # Same as DatabaseConnection._python_datetime_utc(), but with fast paths
+    # for Honeycomb-format strings (see timestamps.py)
+    def _python_datetime_utc(self, timestamp):
+        return python_datetime_utc(timestamp)
+
+    def _python_datetimes_utc(self, timestamps):
+        return python_datetimes_utc(timestamps)
+
+    # Internal method for parsing the timestamps of a page of datapoints in one
+    # batch
+    def _datapoint_timestamps(self, datapoints):
+        return self._python_datetimes_utc([datapoint.get('timestamp') for datapoint in datapoints])
+
+def iter_chunks(
+    items,
+    chunk_size
+):
+    """
+    Split a list (or any other iterable) into consecutive chunks.
+
+    Items are consumed one chunk at a time, so an iterator is never held in
+    memory all at once.
+
+    Parameters:
+        items (iterable): Items to split
+        chunk_size (int): Maximum number of items in each chunk
+
+    Returns:
+        (generator of tuple): Index of the first item, index after the last item, and list of items for each chunk
+    """
+    iterator = iter(items)
+    chunk_beginning = 0
+    while True:
+        chunk_items = list(itertools.islice(iterator, chunk_size))
+        if len(chunk_items) == 0:
+            return
+        chunk_end = chunk_beginning + len(chunk_items)
+        yield chunk_beginning, chunk_end, chunk_items
+        chunk_beginning = chunk_end
+
+def read_ahead(
+    iterable,
+    depth
+):
+    """
+    Iterate over an iterable while a background thread fetches items ahead.
+
+    Up to depth items are requested from the iterable before the caller asks
+    for them, so the time spent producing items (e.g., waiting on Honeycomb)
+    overlaps with the time the caller spends handling earlier items. Items are
+    returned in their original order and exceptions raised by the iterable are
+    re-raised in the caller.
+
+    The background thread starts as soon as this function is called. Call
+    close() on the returned iterator to stop it early (e.g., if the caller stops
+    before the iterable is exhausted); this does not wait for the thread, which
+    finishes the item it is producing and exits.
+
+    Parameters:
+        iterable (iterable): Source of items
+        depth (int): Maximum number of items fetched ahead of the caller
+
+    Returns:
+        (ReadAhead): Iterator over the items from the iterable
+    """
+    return ReadAhead(iterable, depth)
+
+class ReadAhead:
+    """
+    Class to define an iterator over items fetched ahead by a background thread
+    (see read_ahead()).
+    """
+
+    def __init__(
+        self,
+        iterable,
+        depth
+    ):
+        """
+        Constructor for ReadAhead.
+
+        Parameters:
+            iterable (iterable): Source of items
+            depth (int): Maximum number of items fetched ahead of the caller
+        """
+        item_queue = queue.Queue(maxsize=depth)
+        stop_event = threading.Event()
+        def put(entry):
+            while not stop_event.is_set():
+                try:
+                    item_queue.put(entry, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        def produce():
+            try:
+                for item in iterable:
+                    if not put((True, item)):
+                        return
+            except BaseException as exception:
+                put((False, exception))
+                return
+            put((False, None))
+        self._item_queue = item_queue
+        self._stop_event = stop_event
+        self._done = False
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._done:
+            raise StopIteration
+        is_item, value = self._item_queue.get()
+        if not is_item:
+            self.close()
+            if value is not None:
+                raise value
+            raise StopIteration
+        return value
+
+    def __del__(self):
+        self._stop_event.set()
+
+    def close(self):
+        """
+        Stop fetching items.
+        """
+        self._done = True
+        self._stop_event.set()
+
+class ChunkedRequestError(ValueError):
+    """
+    Exception raised when one or more chunks of a chunked request fail.
+
+    Attributes:
+        results (list): Results for all input items in input order (None for items whose chunk did not complete)
+        failed_chunks (list of tuple): Beginning index, end index (exclusive), and exception for each chunk that did not complete (exception is None for chunks that were never sent)
+    """
+
+    def __init__(
+        self,
+        results,
+        failed_chunks
+    ):
+        self.results = results
+        self.failed_chunks = failed_chunks
+        failed_ranges_string = ', '.join(['{}-{}'.format(chunk_beginning, chunk_end - 1) for chunk_beginning, chunk_end, exception in failed_chunks])
+        first_exception = next((exception for chunk_beginning, chunk_end, exception in failed_chunks if exception is not None), None)
+        super().__init__('Requests failed for items {} (first error: {})'.format(
+            failed_ranges_string,
+            first_exception
+        ))
+
+# Whitespace allowed in JSON documents, other than newline
+JSON_INLINE_WHITESPACE = ' \t\r'
+
+# orjson converts integers outside the 64-bit range to floats where the json
+# module returns exact integers, so documents containing runs of 19 or more
+# digits are always decoded with the json module. Runs are found by mapping
+# every digit to zero and searching for a run of zeros, which is much faster
+# than a regular expression.
+DIGIT_TO_ZERO_TABLE = bytes.maketrans(b'123456789', b'000000000')
+LONG_DIGIT_RUN = b'0' * 19
+
+def orjson_safe(document):
+    """
+    Check whether orjson will decode a JSON document exactly as json.loads() does.
+
+    Parameters:
+        document (string or bytes): JSON document
+
+    Returns:
+        (bool): Boolean indicating whether document can be decoded with orjson
+    """
+    if orjson is None or not isinstance(document, (str, bytes)):
+        return False
+    if isinstance(document, str):
+        document = document.encode('utf-8', 'surrogatepass')
+    return LONG_DIGIT_RUN not in document.translate(DIGIT_TO_ZERO_TABLE)
+
+def decode_json(
+    document,
+    safe_for_orjson=None
+):
+    """
+    Decode a JSON document, using orjson if it is installed.
+
+    Results are identical to json.loads(). Documents which orjson rejects
+    (e.g., because they contain NaN or lone surrogates) are decoded with the
+    json module.
+
+    Parameters:
+        document (string or bytes): JSON document
+        safe_for_orjson (bool): Result of orjson_safe() for the document or a document containing it (default: None, i.e., check here)
+
+    Returns:
+        (bool): Boolean indicating whether document could be decoded
+        (object): Decoded document (None if document could not be decoded)
+    """
+    if safe_for_orjson is None:
+        safe_for_orjson = orjson_safe(document)
+    if safe_for_orjson:
+        try:
+            return True, orjson.loads(document)
+        except Exception:
+            pass
+    try:
+        return True, json.loads(document)
+    except Exception:
+        return False, None
+
+class ColumnBuilder:
+    """
+    Class to define a builder which assembles fetched data into NumPy columns.
+
+    Rows are appended to per-page Python lists which are converted to typed
+    NumPy arrays at the end of each page, so no per-row dicts are created.
+    The renaming of data keys which collide with the base fields (timestamp,
+    environment_name, object_id) is computed once for each distinct set of
+    keys rather than once for each row.
+    """
+
+    BASE_FIELD_NAMES = ('timestamp', 'environment_name', 'object_id')
+
+    def __init__(self):
+        self.column_names = list(self.BASE_FIELD_NAMES)
+        self.column_chunks = {column_name: [] for column_name in self.column_names}
+        self.num_rows = 0
+        self.schemas = dict()
+        self.page_columns = dict()
+        self.page_num_rows = 0
+
+    def add_datapoint(
+        self,
+        timestamp,
+        environment_name,
+        object_id,
+        extracted_data_dict_list
+    ):
+        for extracted_data_dict in extracted_data_dict_list:
+            schema = self._schema(tuple(extracted_data_dict.keys()))
+            self._append('timestamp', timestamp.replace(tzinfo=None))
+            self._append('environment_name', environment_name)
+            self._append('object_id', object_id)
+            if len(schema) > 0:
+                values = list(extracted_data_dict.values())
+                for column_name, key_index in schema:
+                    self._append(column_name, values[key_index])
+            self.page_num_rows += 1
+
+    def end_page(self):
+        if self.page_num_rows == 0:
+            return
+        for column_name in self.column_names:
+            page_column = self.page_columns.get(column_name)
+            if page_column is None:
+                self.column_chunks[column_name].append(self.page_num_rows)
+                continue
+            if len(page_column) < self.page_num_rows:
+                page_column.extend([None] * (self.page_num_rows - len(page_column)))
+            if column_name == 'timestamp':
+                self.column_chunks[column_name].append(np.array(page_column, dtype='datetime64[us]'))
+            else:
+                self.column_chunks[column_name].append(self._array(page_column))
+        self.num_rows += self.page_num_rows
+        self.page_columns = dict()
+        self.page_num_rows = 0
+
+    def columns(self):
+        self.end_page()
+        columns = dict()
+        for column_name in self.column_names:
+            chunks = self.column_chunks[column_name]
+            if column_name == 'timestamp':
+                columns[column_name] = np.concatenate(chunks) if len(chunks) > 0 else np.array([], dtype='datetime64[us]')
+                continue
+            columns[column_name] = self._concatenate(chunks)
+        return columns
+
+    # Map each key in a data dict to its column name, keeping (as the dict merge
+    # in _parse_datapoint does) the last value for keys which map to the same
+    # column name
+    def _schema(self, keys):
+        schema = self.schemas.get(keys)
+        if schema is not None:
+            return schema
+        key_indices = dict()
+        for key_index, key in enumerate(keys):
+            if key in self.BASE_FIELD_NAMES:
+                column_name = key + '_secondary'
+            else:
+                column_name = key
+            key_indices[column_name] = key_index
+            if column_name not in self.column_chunks.keys():
+                self.column_names.append(column_name)
+                self.column_chunks[column_name] = []
+                if self.num_rows > 0:
+                    self.column_chunks[column_name].append(self.num_rows)
+        schema = list(key_indices.items())
+        self.schemas[keys] = schema
+        return schema
+
+    def _append(self, column_name, value):
+        page_column = self.page_columns.get(column_name)
+        if page_column is None:
+            page_column = [None] * self.page_num_rows
+            self.page_columns[column_name] = page_column
+        elif len(page_column) < self.page_num_rows:
+            page_column.extend([None] * (self.page_num_rows - len(page_column)))
+        page_column.append(value)
+
+    def _array(self, values):
+        value_types = set(type(value) for value in values)
+        has_missing = type(None) in value_types
+        value_types.discard(type(None))
+        if len(value_types) == 0:
+            return np.full(len(values), None, dtype=object)
+        if value_types == {bool} and not has_missing:
+            return np.array(values, dtype=bool)
+        if value_types == {int} and not has_missing:
+            try:
+                return np.array(values, dtype=np.int64)
+            except OverflowError:
+                return self._object_array(values)
+        if value_types <= {int, float}:
+            try:
+                return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+            except OverflowError:
+                return self._object_array(values)
+        return self._object_array(values)
+
+    def _object_array(self, values):
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        return array
+
+    # Chunks are arrays, or integers standing in for runs of missing values
+    def _concatenate(self, chunks):
+        arrays = [chunk for chunk in chunks if not isinstance(chunk, int)]
+        dtypes = set(array.dtype for array in arrays)
+        has_missing = len(arrays) < len(chunks)
+        if len(dtypes) == 0:
+            dtype = np.dtype(object)
+        elif dtypes <= {np.dtype(np.int64), np.dtype(np.float64)} and (has_missing or len(dtypes) > 1):
+            dtype = np.dtype(np.float64)
+        elif len(dtypes) == 1 and not has_missing:
+            dtype = dtypes.pop()
+        else:
+            dtype = np.dtype(object)
+        filled_chunks = []
+        for chunk in chunks:
+            if isinstance(chunk, int):
+                if dtype == np.dtype(np.float64):
+                    filled_chunks.append(np.full(chunk, np.nan))
+                else:
+                    filled_chunks.append(np.full(chunk, None, dtype=object))
+            else:
+                filled_chunks.append(chunk.astype(dtype, copy=False))
+        if len(filled_chunks) == 0:
+            return np.array([], dtype=dtype)
+        return np.concatenate(filled_chunks)
+
+class WindowAggregator:
+    """
+    Class to define an aggregator which reduces fetched data to aggregates of
+    numeric values for each object over fixed time windows.
+
+    Has the same interface as ColumnBuilder. Values are appended to per-page
+    Python lists which are reduced at the end of each page with vectorized
+    NumPy operations (grouped by object ID and window), so only the running
+    aggregates for each (object ID, window) pair are retained across pages.
+    Windows are aligned to the Unix epoch. Values which are not numbers
+    (including missing values) are ignored, and numbers are aggregated as
+    floats.
+    """
+
+    def __init__(
+        self,
+        window,
+        fields,
+        aggregations
+    ):
+        if not isinstance(window, datetime.timedelta):
+            window = datetime.timedelta(seconds=window)
+        self.window_microseconds = window // datetime.timedelta(microseconds=1)
+        if self.window_microseconds < 1:
+            raise ValueError('Window must be at least one microsecond')
+        if len(fields) == 0:
+            raise ValueError('At least one field must be specified')
+        for aggregation in aggregations:
+            if aggregation not in AGGREGATIONS:
+                raise ValueError('Aggregations must be among {}'.format(AGGREGATIONS))
+        self.fields = list(fields)
+        self.aggregations = list(aggregations)
+        self.object_ids = []
+        self.object_codes = dict()
+        self.states = dict()
+        self.page_timestamps = []
+        self.page_object_codes = []
+        self.page_values = {field: [] for field in self.fields}
+
+    def add_datapoint(
+        self,
+        timestamp,
+        environment_name,
+        object_id,
+        extracted_data_dict_list
+    ):
+        object_code = self.object_codes.get(object_id)
+        if object_code is None:
+            object_code = len(self.object_ids)
+            self.object_codes[object_id] = object_code
+            self.object_ids.append(object_id)
+        timestamp = timestamp.replace(tzinfo=None)
+        for extracted_data_dict in extracted_data_dict_list:
+            self.page_timestamps.append(timestamp)
+            self.page_object_codes.append(object_code)
+            for field in self.fields:
+                value = extracted_data_dict.get(field)
+                # Booleans are not counted as numbers
+                if type(value) is not float and type(value) is not int:
+                    value = np.nan
+                self.page_values[field].append(value)
+
+    def end_page(self):
+        if len(self.page_timestamps) == 0:
+            return
+        timestamps = np.array(self.page_timestamps, dtype='datetime64[us]').astype(np.int64)
+        object_codes = np.array(self.page_object_codes, dtype=np.int64)
+        windows = timestamps // self.window_microseconds
+        # Sort by object and window (and by timestamp within each window, so
+        # that the last value in each group is the latest one)
+        order = np.lexsort((timestamps, windows, object_codes))
+        timestamps = timestamps[order]
+        object_codes = object_codes[order]
+        windows = windows[order]
+        new_group = np.ones(len(order), dtype=bool)
+        new_group[1:] = (object_codes[1:] != object_codes[:-1]) | (windows[1:] != windows[:-1])
+        group_starts = np.flatnonzero(new_group)
+        group_keys = list(zip(object_codes[group_starts].tolist(), windows[group_starts].tolist()))
+        for group_key in group_keys:
+            if group_key not in self.states.keys():
+                self.states[group_key] = dict()
+        positions = np.arange(len(order))
+        for field in self.fields:
+            values = np.array(self.page_values[field], dtype=np.float64)[order]
+            present = ~np.isnan(values)
+            counts = np.add.reduceat(present.astype(np.int64), group_starts).tolist()
+            sums = np.add.reduceat(np.where(present, values, 0.0), group_starts).tolist()
+            minimums = np.fmin.reduceat(values, group_starts).tolist()
+            maximums = np.fmax.reduceat(values, group_starts).tolist()
+            last_positions = np.maximum.reduceat(np.where(present, positions, -1), group_starts).tolist()
+            for group_index, group_key in enumerate(group_keys):
+                if counts[group_index] == 0:
+                    continue
+                last_position = last_positions[group_index]
+                last_timestamp = int(timestamps[last_position])
+                last_value = float(values[last_position])
+                field_state = self.states[group_key].get(field)
+                if field_state is None:
+                    self.states[group_key][field] = [
+                        counts[group_index],
+                        sums[group_index],
+                        minimums[group_index],
+                        maximums[group_index],
+                        last_timestamp,
+                        last_value
+                    ]
+                    continue
+                field_state[0] += counts[group_index]
+                field_state[1] += sums[group_index]
+                field_state[2] = min(field_state[2], minimums[group_index])
+                field_state[3] = max(field_state[3], maximums[group_index])
+                if last_timestamp >= field_state[4]:
+                    field_state[4] = last_timestamp
+                    field_state[5] = last_value
+        self.page_timestamps = []
+        self.page_object_codes = []
+        self.page_values = {field: [] for field in self.fields}
+
+    def aggregates(self):
+        self.end_page()
+        rows = []
+        for (object_code, window), field_states in self.states.items():
+            row = {
+                'timestamp': np.datetime64(window * self.window_microseconds, 'us').item().replace(tzinfo=datetime.timezone.utc),
+                'object_id': self.object_ids[object_code]
+            }
+            for field in self.fields:
+                field_state = field_states.get(field)
+                for aggregation in self.aggregations:
+                    row['{}_{}'.format(field, aggregation)] = self._aggregate(field_state, aggregation)
+            rows.append(row)
+        rows.sort(key=lambda row: (row['timestamp'], row['object_id'] is not None, row['object_id'] or ''))
+        return rows
+
+    def _aggregate(
+        self,
+        field_state,
+        aggregation
+    ):
+        if field_state is None:
+            return 0 if aggregation == 'count' else None
+        count, total, minimum, maximum, last_timestamp, last_value = field_state
+        if aggregation == 'count':
+            return count
+        if aggregation == 'sum':
+            return total
+        if aggregation == 'mean':
+            return total / count
+        if aggregation == 'min':
+            return minimum
+        if aggregation == 'max':
+            return maximum
+        return last_value
+
+class DatapointDeduplicator:
+    """
+    Class to define a filter which drops datapoints already seen in a stream
+    sorted by (timestamp, data ID).
+
+    Only the latest timestamp and the data IDs which share it are retained, so
+    memory use does not grow with the number of datapoints.
+    """
+
+    def __init__(self, parse_timestamp):
+        self.parse_timestamp = parse_timestamp
+        self.last_timestamp = None
+        self.last_timestamp_data_ids = set()
+
+    def filter(self, datapoints):
+        """
+        Drop datapoints which precede or repeat datapoints already seen.
+
+        Parameters:
+            datapoints (list of dict): Datapoints sorted by (timestamp, data ID)
+
+        Returns:
+            (list of dict): Datapoints not seen before
+        """
+        if len(datapoints) == 0:
+            return []
+        first_new_index = 0
+        new_datapoints = []
+        if self.last_timestamp is not None:
+            first_new_index = len(datapoints)
+            for datapoint_index, datapoint in enumerate(datapoints):
+                timestamp = self.parse_timestamp(datapoint.get('timestamp'))
+                if timestamp > self.last_timestamp:
+                    first_new_index = datapoint_index
+                    break
+                if timestamp == self.last_timestamp and datapoint.get('data_id') not in self.last_timestamp_data_ids:
+                    new_datapoints.append(datapoint)
+                    self.last_timestamp_data_ids.add(datapoint.get('data_id'))
+        if first_new_index < len(datapoints):
+            new_datapoints.extend(datapoints[first_new_index:])
+            self.last_timestamp = self.parse_timestamp(datapoints[-1].get('timestamp'))
+            self.last_timestamp_data_ids = set()
+            for datapoint in reversed(datapoints[first_new_index:]):
+                if self.parse_timestamp(datapoint.get('timestamp')) != self.last_timestamp:
+                    break
+                self.last_timestamp_data_ids.add(datapoint.get('data_id'))
+        return new_datapoints
+
+class UnpackedDatapointMerger:
+    """
+    Class to define a merger which puts the measurements unpacked from a
+    stream of (possibly packed) datapoints back into (timestamp, data ID)
+    order.
+
+    Datapoints arrive sorted by (timestamp, data ID), and a pack's timestamp is
+    that of its earliest measurement, so no datapoint still to come can hold a
+    measurement earlier than the timestamp of the latest datapoint seen.
+    Unpacked measurements are held back until that timestamp has moved past
+    them, so at most about one pack interval of measurements is held at once.
+    Pages without packed datapoints pass straight through when nothing is held.
+    """
+
+    def __init__(
+        self,
+        unpack,
+        sort_key
+    ):
+        self.unpack = unpack
+        self.sort_key = sort_key
+        self.held_datapoints = []
+        self.counter = itertools.count()
+
+    def add(self, datapoints):
+        """
+        Add a page of datapoints and return the measurements which are ready.
+
+        Parameters:
+            datapoints (list of dict): Datapoints (some possibly packed) sorted by (timestamp, data ID)
+
+        Returns:
+            (list of dict): Unpacked datapoints sorted by (timestamp, data ID)
+        """
+        if len(datapoints) == 0:
+            return []
+        if len(self.held_datapoints) == 0 and not any(is_packed_datapoint(datapoint) for datapoint in datapoints):
+            return self.unpack(datapoints)
+        for datapoint in self.unpack(datapoints):
+            heapq.heappush(self.held_datapoints, (self.sort_key(datapoint), next(self.counter), datapoint))
+        watermark = self.sort_key(datapoints[-1])[0]
+        ready_datapoints = []
+        while len(self.held_datapoints) > 0 and self.held_datapoints[0][0][0] < watermark:
+            ready_datapoints.append(heapq.heappop(self.held_datapoints)[2])
+        return ready_datapoints
+
+    def finish(self):
+        """
+        Return the measurements still held once the stream is exhausted.
+
+        Returns:
+            (list of dict): Unpacked datapoints sorted by (timestamp, data ID)
+        """
+        ready_datapoints = []
+        while len(self.held_datapoints) > 0:
+            ready_datapoints.append(heapq.heappop(self.held_datapoints)[2])
+        return ready_datapoints
+
+class DatapointPageMerger:
+    """
+    Class to define a merge of several streams of pages of datapoints, each
+    sorted by (timestamp, data ID), into pages of at most page_size datapoints
+    in (timestamp, data ID) order.
+
+    The merger does no I/O, so the same merge serves threads and coroutines:
+    next_stream() names the stream whose next page is needed, and add_page()
+    hands that page over and returns the merged pages which are complete. Only
+    the current page of each stream is held.
+    """
+
+    def __init__(
+        self,
+        num_streams,
+        page_size,
+        sort_key
+    ):
+        self.page_size = page_size
+        self.sort_key = sort_key
+        self.pages = [None] * num_streams
+        self.positions = [0] * num_streams
+        self.heap = []
+        self.waiting_stream_indices = list(range(num_streams))
+        self.merged_datapoints = []
+
+    def next_stream(self):
+        """
+        Return the index of the stream whose next page is needed.
+
+        Returns:
+            (int): Stream index (or None once every stream is exhausted)
+        """
+        if len(self.waiting_stream_indices) == 0:
+            return None
+        return self.waiting_stream_indices[0]
+
+    def add_page(
+        self,
+        stream_index,
+        datapoints
+    ):
+        """
+        Hand over the next page of a stream and return the merged pages which are complete.
+
+        Parameters:
+            stream_index (int): Stream index (as returned by next_stream())
+            datapoints (list of dict): Next page of the stream, sorted by (timestamp, data ID) (or None if the stream is exhausted)
+
+        Returns:
+            (list of list of dict): Complete merged pages
+        """
+        if datapoints is not None and len(datapoints) == 0:
+            return []
+        self.waiting_stream_indices.remove(stream_index)
+        if datapoints is not None:
+            self.pages[stream_index] = datapoints
+            self.positions[stream_index] = 0
+            heapq.heappush(self.heap, (self.sort_key(datapoints[0]), stream_index))
+        merged_pages = []
+        while len(self.waiting_stream_indices) == 0 and len(self.heap) > 0:
+            sort_key, stream_index = heapq.heappop(self.heap)
+            page = self.pages[stream_index]
+            self.merged_datapoints.append(page[self.positions[stream_index]])
+            self.positions[stream_index] += 1
+            if self.positions[stream_index] < len(page):
+                heapq.heappush(self.heap, (self.sort_key(page[self.positions[stream_index]]), stream_index))
+            else:
+                # The next datapoint of this stream may precede every datapoint
+                # still held, so nothing more is merged until its next page
+                self.pages[stream_index] = None
+                self.waiting_stream_indices.append(stream_index)
+            if len(self.merged_datapoints) >= self.page_size:
+                merged_pages.append(self.merged_datapoints)
+                self.merged_datapoints = []
+        return merged_pages
+
+    def finish(self):
+        """
+        Return the last (partial) merged page once every stream is exhausted.
+
+        Returns:
+            (list of dict): Datapoints sorted by (timestamp, data ID)
+        """
+        merged_datapoints = self.merged_datapoints
+        self.merged_datapoints = []
+        return merged_datapoints
+
+class SinkBatcher:
+    """
+    Class to define the batching and checkpointing of a fetch into a sink.
+
+    Pages of (unpacked) datapoints in (timestamp, data ID) order are handed to
+    add_page() and finish(), which are generators of the rows of each complete
+    batch. A batch is recorded in the checkpoint (if any) when the generator is
+    resumed after its rows have been handed to the sink, so the batcher serves
+    any caller, whether it calls the sink or awaits it. If the checkpoint
+    records progress, start_time is where the fetch resumes, and datapoints up
+    to the last recorded datapoint are dropped.
+    """
+
+    def __init__(
+        self,
+        checkpoint,
+        progress,
+        start_time,
+        checkpoint_interval,
+        sink_rows,
+        sort_key,
+        parse_timestamp,
+        format_timestamp
+    ):
+        self.checkpoint = checkpoint
+        self.checkpoint_interval = checkpoint_interval
+        self.sink_rows = sink_rows
+        self.sort_key = sort_key
+        self.format_timestamp = format_timestamp
+        self.complete = progress is not None and progress['complete']
+        self.previous_num_rows = progress['num_rows'] if progress is not None else 0
+        self.resume_key = None
+        if progress is not None and progress['timestamp'] is not None:
+            self.resume_key = (
+                parse_timestamp(progress['timestamp']),
+                progress['data_id']
+            )
+            # Datapoints sharing the resume timestamp are fetched again and
+            # then dropped by add_page()
+            if start_time is None or start_time < self.resume_key[0]:
+                start_time = self.resume_key[0]
+        self.start_time = start_time
+        self.num_rows = 0
+        self.batch_datapoints = []
+        self.num_batch_pages = 0
+
+    def add_page(self, datapoints):
+        """
+        Add a page of datapoints.
+
+        Parameters:
+            datapoints (list of dict): Datapoints sorted by (timestamp, data ID)
+
+        Returns:
+            (generator of list of dict): Rows of the batch completed by this page (if any)
+        """
+        if self.resume_key is not None:
+            datapoints = [datapoint for datapoint in datapoints if self.sort_key(datapoint) > self.resume_key]
+            if len(datapoints) == 0:
+                return
+            # Pages arrive in (timestamp, data ID) order, so no later datapoint
+            # can precede the resume point
+            self.resume_key = None
+        self.batch_datapoints.extend(datapoints)
+        self.num_batch_pages += 1
+        if self.num_batch_pages >= self.checkpoint_interval:
+            yield from self._end_batch()
+
+    def finish(self):
+        """
+        End the fetch, marking the checkpoint (if any) complete.
+
+        Returns:
+            (generator of list of dict): Rows of the last (partial) batch (if any)
+        """
+        if len(self.batch_datapoints) > 0:
+            yield from self._end_batch()
+        if self.checkpoint is not None:
+            self.checkpoint.complete()
+
+    def _end_batch(self):
+        rows = self.sink_rows(self.batch_datapoints)
+        if len(rows) > 0:
+            yield rows
+        self.num_rows += len(rows)
+        if self.checkpoint is not None:
+            last_datapoint = self.batch_datapoints[-1]
+            self.checkpoint.record(
+                timestamp=self.format_timestamp(last_datapoint.get('timestamp')),
+                data_id=last_datapoint.get('data_id'),
+                num_rows=self.previous_num_rows + self.num_rows
+            )
+        self.batch_datapoints = []
+        self.num_batch_pages = 0
+
+class PackedDeletePlan:
+    """
+    Class to define the plan of a delete when datapoints may be packed.
+
+    Pages of the datapoints fetched (with LEAN_FETCH_DATA_RETURN_OBJECT) from
+    one pack interval before the start time through the end time are handed to
+    add_page(). The plan collects the data IDs of the unpacked datapoints within
+    the time span and of the packs holding any measurement within it, and a
+    DatapointPack of the remaining measurements of each of those packs which
+    also holds measurements outside the time span (to be written before the
+    original packs are deleted).
+    """
+
+    def __init__(
         self,
-        assignment_ids,
-        start_time=None,
-        end_time=None
+        start_time,
+        end_time,
+        parse_data_blob,
+        parse_timestamp
     ):
-        combined_query_expression_list = []
-        combined_query_expression_list.append(self._assignment_ids_query_expression(assignment_ids))
-        if start_time is not None:
-            combined_query_expression_list.append(self._start_time_query_expression(start_time))
-        if end_time is not None:
-            combined_query_expression_list.append(self._end_time_query_expression(end_time))
-        combined_query_expression = self._query_expression(
-            operator='AND',
-            children_query_expression_list=combined_query_expression_list
-        )
-        return combined_query_expression
+        self.start_time = start_time
+        self.end_time = end_time
+        self.parse_data_blob = parse_data_blob
+        self.parse_timestamp = parse_timestamp
+        self.data_ids = []
+        self.replacement_packs = []
 
-    def _assignment_ids_query_expression(self, assignment_ids):
-        assignment_ids_query_expression_list = []
-        for assignment_id in assignment_ids:
-            assigment_id_query_expression = self._query_expression(
-                field='source',
-                operator='EQ',
-                value=assignment_id
+    def add_page(self, datapoints):
+        """
+        Add a page of fetched datapoints to the plan.
+
+        Parameters:
+            datapoints (list of dict): Datapoints (some possibly packed)
+        """
+        for datapoint in datapoints:
+            if not is_packed_datapoint(datapoint):
+                if self.start_time is None or self.parse_timestamp(datapoint.get('timestamp')) >= self.start_time:
+                    self.data_ids.append(datapoint.get('data_id'))
+                continue
+            replacement_pack = DatapointPack(
+                object_id=None,
+                assignment_id=(datapoint.get('source') or {}).get('assignment_id')
             )
-            assignment_ids_query_expression_list.append(assigment_id_query_expression)
-        assignment_ids_query_expression = self._query_expression(
-            operator='OR',
-            children_query_expression_list=assignment_ids_query_expression_list
-        )
-        return assignment_ids_query_expression
+            num_deleted_measurements = 0
+            for record in self.parse_data_blob(datapoint['file'].get('data')):
+                timestamp = self.parse_timestamp(record.get('timestamp') or datapoint.get('timestamp'))
+                if (
+                    (self.start_time is None or timestamp >= self.start_time) and
+                    (self.end_time is None or timestamp <= self.end_time)
+                ):
+                    num_deleted_measurements += 1
+                    continue
+                replacement_pack.add(
+                    timestamp=timestamp,
+                    datapoint=record
+                )
+            if num_deleted_measurements == 0:
+                continue
+            self.data_ids.append(datapoint.get('data_id'))
+            if len(replacement_pack.measurements) > 0:
+                self.replacement_packs.append(replacement_pack)
 
-    def _start_time_query_expression(self, start_time):
-        start_time_honeycomb_string = self._datetime_honeycomb_string(start_time)
-        start_time_query_expression = self._query_expression(
-            field='timestamp',
-            operator='GTE',
-            value=start_time_honeycomb_string
-        )
-        return start_time_query_expression
+class DatapointPack:
+    """
+    Class to define a group of measurements for a single assignment which are
+    written as one packed datapoint.
 
-    def _end_time_query_expression(self, end_time):
-        end_time_honeycomb_string = self._datetime_honeycomb_string(end_time)
-        end_time_query_expression = self._query_expression(
-            field='timestamp',
-            operator='LTE',
-            value=end_time_honeycomb_string
-        )
-        return end_time_query_expression
+    Each measurement is held as its parsed timestamp and the datapoint dict it
+    came from (not copied; its timestamp and object ID elements are dropped
+    when the pack is written). The pack's timestamp is that of its earliest
+    measurement.
+    """
 
-    def _query_expression(
+    def __init__(
         self,
-        field=None,
-        operator=None,
-        value=None,
-        children_query_expression_list=None
+        object_id,
+        assignment_id
     ):
-        query_expression = dict()
-        if field is not None:
-            query_expression['field'] = field
-        if operator is not None:
-            query_expression['operator'] = operator
-        if value is not None:
-            query_expression['value'] = value
-        if children_query_expression_list is not None:
-            query_expression['children'] = children_query_expression_list
-        return query_expression
+        self.object_id = object_id
+        self.assignment_id = assignment_id
+        self.measurements = []
+        self.timestamp = None
 
-    def _fetch_datapoints_arguments(
+    def add(
         self,
-        query_expression,
-        cursor = None
+        timestamp,
+        datapoint
     ):
-        if cursor is not None:
-            arguments = {
-                'query': {
-                    'type': 'QueryExpression!',
-                    'value': query_expression
-                },
-                'page': {
-                    'type': 'PaginationInput',
-                    'value': {
-                        'cursor': cursor,
-                        'max': self.read_chunk_size,
-                        'sort': [
-                            {
-                                'direction': 'ASC',
-                                'field': 'timestamp'
-                            },
-                            {
-                                'direction': 'ASC',
-                                'field': 'data_id'
-                            },
-                        ]
-                    }
-                }
-            }
-        else:
-            arguments = {
-                'query': {
-                    'type': 'QueryExpression!',
-                    'value': query_expression
-                },
-                'page': {
-                    'type': 'PaginationInput',
-                    'value': {
-                        'max': self.read_chunk_size,
-                        'sort': [
-                            {
-                                'direction': 'ASC',
-                                'field': 'timestamp'
-                            },
-                            {
-                                'direction': 'ASC',
-                                'field': 'data_id'
-                            },
-                        ]
-                    }
-                }
-            }
-        return arguments
+        self.measurements.append((timestamp, datapoint))
+        if self.timestamp is None or timestamp < self.timestamp:
+            self.timestamp = timestamp
 
-    def _delete_datapoints(self, data_ids):
-        statuses = [self._delete_datapoint(data_id) for data_id in data_ids]
-        return statuses
+class AssignmentIntervals:
+    """
+    Class to define a sorted set of assignment intervals for a single object.
 
-    def _delete_datapoint(self, data_id):
-        deleteDatapoint_results = self.honeycomb_client.request(
-            request_type='mutation',
-            request_name='deleteDatapoint',
-            arguments={
-                'data_id': {
-                    'type': 'ID',
-                    'value': data_id
-                }
-            },
-            return_object = [
-                'status'
-            ]
-        )
-        try:
-            status = deleteDatapoint_results.get('status')
-        except:
-            raise ValueError('Received unexpected response from Honeycomb')
-        return status
+    Lookups return the assignment that the original linear scan over the
+    environment assignments would have returned: among all assignments whose
+    (inclusive) interval contains the timestamp, the one that appears first in
+    the environment.
+    """
 
-    def _datetime_honeycomb_string(self, timestamp):
-        datetime_utc = self._python_datetime_utc(timestamp)
-        datetime_honeycomb_string = datetime_utc.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-        return datetime_honeycomb_string
+    def __init__(self):
+        self.intervals = []
+        self.starts = []
+        self.num_open_start = 0
+        self.overlapping = False
+
+    def add(
+        self,
+        assignment_id,
+        start,
+        end,
+        position
+    ):
+        self.intervals.append((start, end, position, assignment_id))
+
+    def finalize(self):
+        # Intervals with no start time sort first and are candidates for every timestamp
+        self.intervals.sort(key=lambda interval: (
+            interval[0] is not None,
+            interval[0] if interval[0] is not None else 0,
+            interval[2]
+        ))
+        self.starts = [interval[0] for interval in self.intervals if interval[0] is not None]
+        self.num_open_start = len(self.intervals) - len(self.starts)
+        self.overlapping = False
+        for previous_interval, interval in zip(self.intervals[:-1], self.intervals[1:]):
+            previous_end = previous_interval[1]
+            if previous_end is None or interval[0] is None or interval[0] <= previous_end:
+                self.overlapping = True
+                break
+
+    def lookup(self, timestamp):
+        """
+        Find the assignment ID whose interval contains the specified timestamp.
+
+        Parameters:
+            timestamp (datetime): Timezone-aware timestamp
+
+        Returns:
+            (string): Assignment ID (or None if no assignment matches)
+        """
+        num_candidates = self.num_open_start + bisect.bisect_right(self.starts, timestamp)
+        if num_candidates == 0:
+            return None
+        if not self.overlapping:
+            start, end, position, assignment_id = self.intervals[num_candidates - 1]
+            if end is not None and timestamp > end:
+                return None
+            return assignment_id
+        matching_position = None
+        matching_assignment_id = None
+        for start, end, position, assignment_id in self.intervals[:num_candidates]:
+            if end is not None and timestamp > end:
+                continue
+            if matching_position is None or position < matching_position:
+                matching_position = position
+                matching_assignment_id = assignment_id
+        return matching_assignment_id
+
+FIND_ENVIRONMENT_RETURN_OBJECT = [
+    {'data': [
+        'environment_id'
+    ]}
+]
+
+GET_ENVIRONMENT_RETURN_OBJECT = [
+    'name',
+    {'assignments': [
+        'assignment_id',
+        'start',
+        'end',
+        'assigned_type',
+        {'assigned': [
+            {'... on Device': [
+                'device_id',
+                'device_type',
+                'part_number',
+                'serial_number',
+                'name',
+                'mac_address',
+                'tag_id'
+            ]},
+            {'... on Person': [
+                'person_id',
+                'name',
+                'first_name',
+                'last_name',
+                'nickname',
+                'short_name',
+                'person_type',
+                'transparent_classroom_id'
+            ]},
+            {'... on Material': [
+                'material_id',
+                'name',
+                'transparent_classroom_id'
+            ]},
+            {'... on Tray': [
+                'tray_id',
+                'part_number',
+                'name',
+                'serial_number'
+            ]}
+        ]}
+    ]}
+]
+
+FETCH_DATA_IDS_RETURN_OBJECT = [
+    {'data': [
+        'data_id',
+        'timestamp'
+    ]},
+    {'page_info': [
+        'count',
+        'cursor'
+    ]}
+]
+
+# Same as FETCH_DATA_RETURN_OBJECT, plus the assignment ID of each datapoint so
+# that datapoints can be cached by assignment
+CACHE_FETCH_DATA_RETURN_OBJECT = [
+    {'data': [
+        'data_id',
+        'timestamp',
+        {'source': [
+            {'... on Assignment': [
+                'assignment_id',
+                {'environment': [
+                    'name'
+                ]},
+                {'assigned': [
+                    {'... on Device': [
+                        'part_number',
+                        'tag_id'
+                    ]},
+                    {'... on Person': [
+                        'name'
+                    ]}
+                ]}
+            ]}
+        ]},
+        {'file': [
+            'data',
+            'name',
+            'contentType'
+        ]}
+    ]},
+    {'page_info': [
+        'count',
+        'cursor'
+    ]}
+]
 
 FETCH_DATA_RETURN_OBJECT = [
     {'data': [
@@ -666,3 +3587,82 @@ FETCH_DATA_RETURN_OBJECT = [
         'cursor'
     ]}
 ]
+
+# Same as FETCH_DATA_RETURN_OBJECT, but with only the assignment ID of each
+# datapoint's source (the rest is filled in from the loaded environment)
+LEAN_FETCH_DATA_RETURN_OBJECT = [
+    {'data': [
+        'data_id',
+        'timestamp',
+        {'source': [
+            {'... on Assignment': [
+                'assignment_id'
+            ]}
+        ]},
+        {'file': [
+            'data',
+            'name',
+            'contentType'
+        ]}
+    ]},
+    {'page_info': [
+        'count',
+        'cursor'
+    ]}
+]
+
+# Internal function for finding the fields of each type of assigned object
+# (keyed by assigned type, e.g., 'DEVICE') which a return object requests for
+# the assigned object of each datapoint's source
+def _assigned_source_fields(return_object):
+    selection = return_object
+    for field_name in ['data', 'source', '... on Assignment', 'assigned']:
+        selection = next(
+            item[field_name]
+            for item in selection
+            if isinstance(item, dict) and field_name in item.keys()
+        )
+    assigned_source_fields = dict()
+    for item in selection:
+        for fragment_name, fields in item.items():
+            assigned_type = fragment_name[len('... on '):].upper()
+            assigned_source_fields[assigned_type] = [field for field in fields if isinstance(field, str)]
+    return assigned_source_fields
+
+# Fields of each type of assigned object which Honeycomb returns in the source
+# of each datapoint fetched with FETCH_DATA_RETURN_OBJECT (filled in from the
+# loaded environment for datapoints fetched with LEAN_FETCH_DATA_RETURN_OBJECT)
+ASSIGNED_SOURCE_FIELDS = _assigned_source_fields(FETCH_DATA_RETURN_OBJECT)
+
+# File name and content type of packed datapoints for each pack format (the
+# file name marks a datapoint as packed when it is read back)
+PACKED_DATAPOINT_FILES = {
+    'json': ('packed_datapoints.json', 'application/json'),
+    'ndjson': ('packed_datapoints.ndjson', 'application/x-ndjson')
+}
+
+PACKED_DATAPOINT_FILE_NAMES = set([file_name for file_name, content_type in PACKED_DATAPOINT_FILES.values()])
+
+def is_packed_datapoint(datapoint):
+    """
+    Check whether a datapoint returned by Honeycomb holds packed measurements.
+
+    Parameters:
+        datapoint (dict): Datapoint (with its file name, if fetched)
+
+    Returns:
+        (bool): Boolean indicating whether datapoint is packed
+    """
+    return (datapoint.get('file') or {}).get('name') in PACKED_DATAPOINT_FILE_NAMES
+
+PACK_INTERVAL_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+# Maximum number of datapoints held in open packs while packing datapoints
+# consumed from an iterable
+PACK_BUFFER_SIZE = 10000
+
+AGGREGATIONS = ['count', 'sum', 'mean', 'min', 'max', 'last']
+
+# Datapoints may still be written for recent timestamps, so the datapoint cache
+# never records coverage closer than this to the present
+CACHE_SETTLE_MARGIN = datetime.timedelta(minutes=10)
@@ -0,0 +1,1401 @@
+from database_connection import DataQueue
+import minimal_honeycomb
+from database_connection_honeycomb import (
+    DatabaseConnectionHoneycomb,
+    ChunkedRequestError,
+    ColumnBuilder,
+    WindowAggregator,
+    DatapointDeduplicator,
+    DatapointPageMerger,
+    FIND_ENVIRONMENT_RETURN_OBJECT,
+    GET_ENVIRONMENT_RETURN_OBJECT,
+    FETCH_DATA_IDS_RETURN_OBJECT,
+    FETCH_DATA_RETURN_OBJECT,
+    LEAN_FETCH_DATA_RETURN_OBJECT,
+    iter_chunks
+)
+from database_connection_honeycomb.client_pool import access_token_expires_at
+from gqlpycgen.client import FileUpload, exponential_retry, DEFAULT_HTTP_REQUEST_TIMEOUT
+from gqlpycgen.utils import json_dumps
+from collections import OrderedDict
+from uuid import uuid4
+import asyncio
+import inspect
+import json
+import time
+import logging
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+logger = logging.getLogger(__name__)
+
+class AsyncDatabaseConnectionHoneycomb(DatabaseConnectionHoneycomb):
+    """
+    Class to define an asyncio counterpart of DatabaseConnectionHoneycomb.
+
+    Writes, fetches, deletes, and environment loads are coroutines, so they can
+    be awaited from an event loop without blocking it. Requests are built, and
+    fetched pages planned, merged, and parsed, by the same methods and helper
+    classes as in DatabaseConnectionHoneycomb, so results match those of the
+    synchronous class.
+
+    This class subclasses DatabaseConnectionHoneycomb only to share those
+    methods. It is not a substitute for it (or for any DatabaseConnection): the
+    public methods of the synchronous class which send requests are coroutines
+    here (iter_data() is an async generator), so code written against the
+    synchronous interface (e.g., export_data()) cannot be handed an instance of
+    this class. The environment must be loaded (by await load_environment() or
+    by any of the coroutines) before the environment and assignment_index
+    properties can be read, and buffered_writer() is not available.
+    """
+
+    def __init__(
+        self,
+        time_series_database=True,
+        object_database=True,
+        environment_name_honeycomb=None,
+        object_type_honeycomb=None,
+        object_id_field_name_honeycomb=None,
+        write_chunk_size=20,
+        read_chunk_size=1000,
+        pack_interval=None,
+        pack_format='json',
+        read_shard_mode=None,
+        read_shard_count=None,
+        read_shard_duration=None,
+        read_max_query_assignments=None,
+        read_lean_fetch=False,
+        delete_chunk_size=100,
+        max_concurrent_requests=8,
+        environment_snapshot_directory=None,
+        environment_snapshot_ttl=3600,
+        transport=None,
+        honeycomb_uri=None,
+        honeycomb_token_uri=None,
+        honeycomb_audience=None,
+        honeycomb_client_id=None,
+        honeycomb_client_secret=None
+    ):
+        """
+        Constructor for AsyncDatabaseConnectionHoneycomb.
+
+        Arguments are the same as for DatabaseConnectionHoneycomb, except that
+        chunks of writes and deletes and shards of fetches are all sent
+        concurrently, with at most max_concurrent_requests requests in flight at
+        once. The local datapoint cache, read-ahead, background environment
+        refreshes, and buffered writes are not available.
+
+        Requests are sent through the specified transport (see AiohttpTransport
+        for the interface). If no transport is specified, an AiohttpTransport is
+        created (which requires aiohttp).
+
+        Parameters:
+            time_series_database (bool): Boolean indicating whether database is a time series database (default is True)
+            object_database (bool): Boolean indicating whether database is an object database (default is True)
+            environment_name_honeycomb (string): Name of the Honeycomb environment that the data is associated with
+            object_type_honeycomb (string): Honeycomb object type that the data is associated with (e.g. DEVICE, PERSON)
+            object_id_field_name_honeycomb (string): Honeycomb field name that holds the object ID (e.g., part_number)
+            write_chunk_size (int): Number of datapoints to write in each request (default is 20)
+            read_chunk_size (int): Number of datapoints to read in each request (default is 1000)
+            pack_interval (timedelta or float): Interval for packing measurements into shared datapoints (in seconds if float) (default is None, i.e., one datapoint per measurement)
+            pack_format (string): Format of packed datapoints, 'json' (a JSON list) or 'ndjson' (default is 'json')
+            read_shard_mode (string): Split fetches into parallel queries by 'time' or by 'assignments' (default is None, i.e., a single query)
+            read_shard_count (int): Number of shards for sharded fetches (default is max_concurrent_requests)
+            read_shard_duration (timedelta or float): Duration of each time shard (in seconds if float); overrides read_shard_count
+            read_max_query_assignments (int): Maximum number of assignments in the filter of a single query; larger sets are split into concurrent sub-queries (default is None, i.e., no limit)
+            read_lean_fetch (bool): Boolean indicating whether to request only the source assignment ID of each datapoint and fill in environment name and object ID from the loaded environment (default is False)
+            delete_chunk_size (int): Number of datapoints to delete in each request (default is 100)
+            max_concurrent_requests (int): Maximum number of requests to Honeycomb in flight at once (default is 8)
+            environment_snapshot_directory (string): Directory for persisted snapshots of the Honeycomb environment (default is None, i.e., no snapshots)
+            environment_snapshot_ttl (float): Maximum age of a usable environment snapshot in seconds (default is 3600)
+            transport (AiohttpTransport or compatible): Transport for HTTP requests (default is None, i.e., a new AiohttpTransport)
+            honeycomb_uri (string): Honeycomb URI
+            honeycomb_token_uri (string): Honeycomb token URI
+            honeycomb_audience (string): Honeycomb audience
+            honeycomb_client_id (string): Honeycomb client ID
+            honeycomb_client_secret (string): Honeycomb client secret
+        """
+        super().__init__(
+            time_series_database=time_series_database,
+            object_database=object_database,
+            environment_name_honeycomb=environment_name_honeycomb,
+            object_type_honeycomb=object_type_honeycomb,
+            object_id_field_name_honeycomb=object_id_field_name_honeycomb,
+            write_chunk_size=write_chunk_size,
+            read_chunk_size=read_chunk_size,
+            pack_interval=pack_interval,
+            pack_format=pack_format,
+            read_shard_mode=read_shard_mode,
+            read_shard_count=read_shard_count,
+            read_shard_duration=read_shard_duration,
+            read_max_workers=max_concurrent_requests,
+            read_max_query_assignments=read_max_query_assignments,
+            read_lean_fetch=read_lean_fetch,
+            delete_chunk_size=delete_chunk_size,
+            environment_snapshot_directory=environment_snapshot_directory,
+            environment_snapshot_ttl=environment_snapshot_ttl,
+            honeycomb_uri=honeycomb_uri,
+            honeycomb_token_uri=honeycomb_token_uri,
+            honeycomb_audience=honeycomb_audience,
+            honeycomb_client_id=honeycomb_client_id,
+            honeycomb_client_secret=honeycomb_client_secret
+        )
+        self.max_concurrent_requests = max_concurrent_requests
+        self.honeycomb_client = AsyncHoneycombClient(
+            uri=honeycomb_uri,
+            token_uri=honeycomb_token_uri,
+            audience=honeycomb_audience,
+            client_id=honeycomb_client_id,
+            client_secret=honeycomb_client_secret,
+            transport=transport,
+            max_concurrent_requests=max_concurrent_requests
+        )
+        self._environment_load_lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        """
+        Close the HTTP transport for this connection.
+        """
+        await self.honeycomb_client.close()
+
+    # Internal method for returning the loaded environment and assignment index.
+    # Unlike the synchronous class, the environment cannot be loaded here (that
+    # requires awaiting requests), so the public coroutines load it first.
+    def _ensure_environment_state(self):
+        if self._environment_state is None:
+            if self.environment_name_honeycomb is None:
+                return (None, dict())
+            raise ValueError('Environment {} has not been loaded (await load_environment() first)'.format(self.environment_name_honeycomb))
+        return self._environment_state
+
+    async def load_environment(self):
+        """
+        Load the Honeycomb environment (if it has not been loaded already).
+
+        Returns:
+            (dict): Honeycomb environment (name and assignments)
+        """
+        if self.environment_name_honeycomb is None:
+            raise ValueError('Loading environment only enabled when Honeycomb environment is specified')
+        async with self._environment_load_lock:
+            if self._environment_state is None:
+                environment = await self._load_environment()
+                self._environment_state = (
+                    environment,
+                    self._build_assignment_index(environment.get('assignments'))
+                )
+                self._environment_refreshed_at = time.time()
+        return self._environment_state[0]
+
+    async def refresh_environment(self):
+        """
+        Reload the Honeycomb environment (e.g., to pick up new assignments).
+
+        The new environment and its assignment index are swapped in together
+        once both are complete.
+        """
+        if self.environment_name_honeycomb is None:
+            raise ValueError('Refreshing environment only enabled when Honeycomb environment is specified')
+        async with self._environment_load_lock:
+            environment = await self._load_environment(use_snapshot=False)
+            environment_state = (
+                environment,
+                self._build_assignment_index(environment.get('assignments'))
+            )
+            self._environment_state = environment_state
+            self._environment_refreshed_at = time.time()
+        logger.info('Refreshed environment {} ({} assignments)'.format(
+            self.environment_name_honeycomb,
+            len(environment.get('assignments') or [])
+        ))
+
+    async def _ensure_environment_loaded(self):
+        if self._environment_state is None and self.environment_name_honeycomb is not None:
+            await self.load_environment()
+
+    async def _load_environment(self, use_snapshot=True):
+        if use_snapshot and self.environment_snapshot_directory is not None:
+            environment = self._read_environment_snapshot()
+            if environment is not None:
+                return environment
+        if self._environment_id is None:
+            findEnvironment_result = await self.honeycomb_client.request(
+                request_type='query',
+                request_name='findEnvironment',
+                arguments=self._find_environment_arguments(),
+                return_object=FIND_ENVIRONMENT_RETURN_OBJECT
+            )
+            self._environment_id = self._parse_find_environment_result(findEnvironment_result)
+        environment = await self.honeycomb_client.request(
+            request_type='query',
+            request_name='getEnvironment',
+            arguments=self._get_environment_arguments(self._environment_id),
+            return_object=GET_ENVIRONMENT_RETURN_OBJECT
+        )
+        if self.environment_snapshot_directory is not None:
+            self._write_environment_snapshot(environment)
+        return environment
+
+    async def write_datapoint_object_time_series(
+        self,
+        timestamp,
+        object_id,
+        data
+    ):
+        """
+        Write a single datapoint for a given timestamp and object ID.
+
+        Arguments are the same as for
+        DatabaseConnectionHoneycomb.write_datapoint_object_time_series().
+
+        Parameters:
+            timestamp (datetime or string): Timestamp associated with data
+            object_id (string): Object ID associated with data
+            data (dict): Data to be written
+
+        Returns:
+            (string): Honeycomb data ID of the new datapoint
+        """
+        if not self.time_series_database or not self.object_database:
+            raise ValueError('Writing datapoint by timestamp and object ID only enabled for object time series databases')
+        timestamp = self._python_datetime_utc(timestamp)
+        await self._ensure_environment_loaded()
+        return_value = await self._write_datapoint_object_time_series(
+            timestamp,
+            object_id,
+            data
+        )
+        return return_value
+
+    async def write_data_object_time_series(
+        self,
+        datapoints
+    ):
+        """
+        Write multiple datapoints with timestamps and object IDs.
+
+        Arguments are the same as for
+        DatabaseConnectionHoneycomb.write_data_object_time_series(). Chunks are
+        written concurrently. If any chunk fails, a ChunkedRequestError is
+        raised once all chunks have completed.
+
+        Parameters:
+            datapoints (iterable of dict): Datapoints to be written
+
+        Returns:
+            (list of string): Honeycomb data IDs of the new datapoints (in input order)
+        """
+        if not self.time_series_database or not self.object_database:
+            raise ValueError('Writing datapoint by timestamp and object ID only enabled for object time series databases')
+        if isinstance(datapoints, (list, tuple)):
+            # Check every datapoint before anything is written
+            for datapoint in datapoints:
+                self._validate_datapoint(datapoint)
+        else:
+            datapoints = self._validated_datapoints(datapoints)
+        await self._ensure_environment_loaded()
+        return_value = await self._write_data_object_time_series(
+            datapoints
+        )
+        return return_value
+
+    async def fetch_data_object_time_series(
+        self,
+        start_time=None,
+        end_time=None,
+        object_ids=None
+    ):
+        """
+        Fetch data for a given timespan and set of object IDs.
+
+        Arguments and returned rows are the same as for
+        DatabaseConnectionHoneycomb.fetch_data_object_time_series().
+
+        Parameters:
+            start_time (datetime or string): Beginning of timespan (default: None)
+            end_time (datetime or string): End of timespan (default: None)
+            object_ids (list of strings): Object IDs (default: None)
+
+        Returns:
+            (list of dict): All data associated with specified time span and object IDs
+        """
+        if not self.time_series_database or not self.object_database:
+            raise ValueError('Fetching data by time interval and/or object ID only enabled for object time series databases')
+        if start_time is not None:
+            start_time = self._python_datetime_utc(start_time)
+        if end_time is not None:
+            end_time = self._python_datetime_utc(end_time)
+        await self._ensure_environment_loaded()
+        data = await self._fetch_data_object_time_series(
+            start_time,
+            end_time,
+            object_ids
+        )
+        return data
+
+    async def iter_data(
+        self,
+        start_time=None,
+        end_time=None,
+        object_ids=None
+    ):
+        """
+        Iterate asynchronously over data for a given timespan and set of object IDs.
+
+        Arguments and rows are the same as for
+        DatabaseConnectionHoneycomb.iter_data().
+
+        Parameters:
+            start_time (datetime or string): Beginning of timespan (default: None)
+            end_time (datetime or string): End of timespan (default: None)
+            object_ids (list of strings): Object IDs (default: None)
+
+        Returns:
+            (async generator of dict): Data associated with specified time span and object IDs
+        """
+        if not self.time_series_database or not self.object_database:
+            raise ValueError('Fetching data by time interval and/or object ID only enabled for object time series databases')
+        if start_time is not None:
+            start_time = self._python_datetime_utc(start_time)
+        if end_time is not None:
+            end_time = self._python_datetime_utc(end_time)
+        await self._ensure_environment_loaded()
+        async for datapoints in self._iter_datapoint_pages_object_time_series(
+            start_time,
+            end_time,
+            object_ids
+        ):
+            for datapoint, timestamp in zip(datapoints, self._datapoint_timestamps(datapoints)):
+                for data_dict in self._parse_datapoint(datapoint, timestamp):
+                    yield data_dict
+
+    async def fetch_data_to_sink(
+        self,
+        sink,
+        start_time=None,
+        end_time=None,
+        object_ids=None,
+        checkpoint_path=None,
+        checkpoint_interval=1
+    ):
+        """
+        Fetch data for a given timespan and set of object IDs into a sink.
+
+        Arguments, checkpoints, and returned value are the same as for
+        DatabaseConnectionHoneycomb.fetch_data_to_sink(). The sink can be a
+        function or a coroutine function.
+
+        Parameters:
+            sink (function): Function (or coroutine function) called with each batch of rows (list of dict)
+            start_time (datetime or string): Beginning of timespan (default: None)
+            end_time (datetime or string): End of timespan (default: None)
+            object_ids (list of strings): Object IDs (default: None)
+            checkpoint_path (string): Path of a checkpoint file for the fetch (default is None, i.e., no checkpoint)
+            checkpoint_interval (int): Number of pages in each batch handed to the sink (default is 1)
+
+        Returns:
+            (int): Number of rows handed to the sink by this call
+        """
+        if not self.time_series_database or not self.object_database:
+            raise ValueError('Fetching data by time interval and/or object ID only enabled for object time series databases')
+        if checkpoint_interval < 1:
+            raise ValueError('Checkpoint interval must be at least one page')
+        if start_time is not None:
+            start_time = self._python_datetime_utc(start_time)
+        if end_time is not None:
+            end_time = self._python_datetime_utc(end_time)
+        sink_batcher = self._sink_batcher(
+            checkpoint_path,
+            start_time,
+            end_time,
+            object_ids,
+            checkpoint_interval
+        )
+        if sink_batcher.complete:
+            logger.info('Fetch in checkpoint {} is already complete'.format(checkpoint_path))
+            return 0
+        await self._ensure_environment_loaded()
+        async for datapoints in self._iter_datapoint_pages_object_time_series(
+            sink_batcher.start_time,
+            end_time,
+            object_ids
+        ):
+            for rows in sink_batcher.add_page(datapoints):
+                await self._call_sink(sink, rows)
+        for rows in sink_batcher.finish():
+            await self._call_sink(sink, rows)
+        logger.info('Handed {} rows to sink'.format(sink_batcher.num_rows))
+        return sink_batcher.num_rows
+
+    async def _call_sink(
+        self,
+        sink,
+        rows
+    ):
+        result = sink(rows)
+        if inspect.isawaitable(result):
+            await result
+
+    async def fetch_data_columns(
+        self,
+        start_time=None,
+        end_time=None,
+        object_ids=None
+    ):
+        """
+        Fetch data for a given timespan and set of object IDs as NumPy columns.
+
+        Arguments and columns are the same as for
+        DatabaseConnectionHoneycomb.fetch_data_columns().
+
+        Requires NumPy.
+
+        Parameters:
+            start_time (datetime or string): Beginning of timespan (default: None)
+            end_time (datetime or string): End of timespan (default: None)
+            object_ids (list of strings): Object IDs (default: None)
+
+        Returns:
+            (dict of array): Data associated with specified time span and object IDs
+        """
+        if np is None:
+            raise ImportError('NumPy must be installed to fetch data as columns')
+        if not self.time_series_database or not self.object_database:
+            raise ValueError('Fetching data by time interval and/or object ID only enabled for object time series databases')
+        if start_time is not None:
+            start_time = self._python_datetime_utc(start_time)
+        if end_time is not None:
+            end_time = self._python_datetime_utc(end_time)
+        await self._ensure_environment_loaded()
+        column_builder = ColumnBuilder()
+        async for datapoints in self._iter_datapoint_pages_object_time_series(
+            start_time,
+            end_time,
+            object_ids
+        ):
+            self._add_datapoints_to_column_builder(column_builder, datapoints)
+        return column_builder.columns()
+
+    async def fetch_data_aggregates(
+        self,
+        window,
+        fields,
+        aggregations=None,
+        start_time=None,
+        end_time=None,
+        object_ids=None
+    ):
+        """
+        Fetch aggregates of numeric data for each object over fixed time windows.
+
+        Arguments and aggregates are the same as for
+        DatabaseConnectionHoneycomb.fetch_data_aggregates().
+
+        Requires NumPy.
+
+        Parameters:
+            window (timedelta or float): Length of each window (in seconds if float)
+            fields (list of string): Data keys to aggregate
+            aggregations (list of string): Aggregations to compute for each field (default is ['mean'])
+            start_time (datetime or string): Beginning of timespan (default: None)
+            end_time (datetime or string): End of timespan (default: None)
+            object_ids (list of strings): Object IDs (default: None)
+
+        Returns:
+            (list of dict): Aggregates for each window and object ID (sorted by window and object ID)
+        """
+        if np is None:
+            raise ImportError('NumPy must be installed to fetch data aggregates')
+        if not self.time_series_database or not self.object_database:
+            raise ValueError('Fetching data by time interval and/or object ID only enabled for object time series databases')
+        window_aggregator = WindowAggregator(
+            window=window,
+            fields=fields,
+            aggregations=aggregations if aggregations is not None else ['mean']
+        )
+        if start_time is not None:
+            start_time = self._python_datetime_utc(start_time)
+        if end_time is not None:
+            end_time = self._python_datetime_utc(end_time)
+        await self._ensure_environment_loaded()
+        async for datapoints in self._iter_datapoint_pages_object_time_series(
+            start_time,
+            end_time,
+            object_ids
+        ):
+            self._add_datapoints_to_column_builder(window_aggregator, datapoints)
+        return window_aggregator.aggregates()
+
+    async def fetch_data_frame(
+        self,
+        start_time=None,
+        end_time=None,
+        object_ids=None
+    ):
+        """
+        Fetch data for a given timespan and set of object IDs as a DataFrame.
+
+        Arguments and columns are the same as for
+        DatabaseConnectionHoneycomb.fetch_data_frame().
+
+        Requires NumPy and pandas.
+
+        Parameters:
+            start_time (datetime or string): Beginning of timespan (default: None)
+            end_time (datetime or string): End of timespan (default: None)
+            object_ids (list of strings): Object IDs (default: None)
+
+        Returns:
+            (DataFrame): Data associated with specified time span and object IDs
+        """
+        if pd is None:
+            raise ImportError('pandas must be installed to fetch data as a DataFrame')
+        columns = await self.fetch_data_columns(
+            start_time,
+            end_time,
+            object_ids
+        )
+        return self._data_frame_from_columns(columns)
+
+    async def delete_data_object_time_series(
+        self,
+        start_time,
+        end_time,
+        object_ids
+    ):
+        """
+        Delete data for a given timespan and set of object IDs.
+
+        Arguments are the same as for
+        DatabaseConnectionHoneycomb.delete_data_object_time_series(). Chunks are
+        deleted concurrently.
+
+        Parameters:
+            start_time (datetime or string): Beginning of timespan
+            end_time (datetime or string): End of timespan
+            object_ids (list of strings): Object IDs
+        """
+        if not self.time_series_database or not self.object_database:
+            raise ValueError('Deleting data by time interval and/or object ID only enabled for object time series databases')
+        if start_time is None:
+            raise ValueError('Start time must be specified for delete data operation')
+        if end_time is None:
+            raise ValueError('End time must be specified for delete data operation')
+        if object_ids is None:
+            raise ValueError('Object IDs must be specified for delete data operation')
+        start_time = self._python_datetime_utc(start_time)
+        end_time = self._python_datetime_utc(end_time)
+        await self._ensure_environment_loaded()
+        await self._delete_data_object_time_series(
+            start_time,
+            end_time,
+            object_ids
+        )
+
+    def buffered_writer(
+        self,
+        *args,
+        **kwargs
+    ):
+        """
+        Not available for the asyncio connection.
+
+        BufferedWriter writes from a background thread through the synchronous
+        write methods, which are coroutines here. Use a DatabaseConnectionHoneycomb
+        for buffered writes, or batch datapoints and await
+        write_data_object_time_series().
+        """
+        raise TypeError('Buffered writes are not available for AsyncDatabaseConnectionHoneycomb (use DatabaseConnectionHoneycomb)')
+
+    async def to_data_queue(
+        self,
+        start_time=None,
+        end_time=None,
+        object_ids=None
+    ):
+        """
+        Create an iterable which returns datapoints from the database in time order.
+
+        Arguments are the same as for fetch_data_object_time_series().
+
+        Parameters:
+            start_time (datetime or string): Beginning of timespan (default: None)
+            end_time (datetime or string): End of timespan (default: None)
+            object_ids (list of strings): Object IDs (default: None)
+
+        Returns:
+            (DataQueue): Iterator which contains the requested data
+        """
+        data = await self.fetch_data_object_time_series(
+            start_time,
+            end_time,
+            object_ids
+        )
+        data_queue = DataQueue(
+            data = data
+        )
+        return data_queue
+
+    async def _write_datapoint_object_time_series(
+        self,
+        timestamp,
+        object_id,
+        data
+    ):
+        assignment_id = self._lookup_assignment_id_object_time_series(timestamp, object_id)
+        timestamp_honeycomb_format = self._datetime_honeycomb_string(timestamp)
+        createDatapoint_result = await self.honeycomb_client.request(
+            request_type='mutation',
+            request_name='createDatapoint',
+            arguments=self._create_datapoint_arguments(
+                timestamp_honeycomb_format,
+                assignment_id,
+                data
+            ),
+            return_object = [
+                'data_id'
+            ]
+        )
+        data_id = createDatapoint_result.get('data_id')
+        return data_id
+
+    async def _write_data_object_time_series(
+        self,
+        datapoints
+    ):
+        pack_indices = None
+        if self.pack_interval is not None:
+            pack_indices = []
+            datapoints = self._iter_packs(datapoints, pack_indices)
+        try:
+            data_ids = await self._process_chunks(
+                items=datapoints,
+                chunk_size=self.write_chunk_size,
+                chunk_function=self._write_datapoints_object_time_series
+            )
+        except ChunkedRequestError as error:
+            if pack_indices is None:
+                raise
+            raise self._unpacked_chunked_request_error(error, pack_indices) from error
+        if pack_indices is not None:
+            data_ids = [data_ids[pack_index] for pack_index in pack_indices]
+        return data_ids
+
+    async def _write_datapoints_object_time_series(
+        self,
+        datapoints
+    ):
+        num_datapoints = len(datapoints)
+        child_request_list, assignment_timestamps = self._create_datapoints_child_request_list(datapoints)
+        createDatapoints_result = await self.honeycomb_client.compound_request(
+            parent_request_type='mutation',
+            parent_request_name='createDatapoints',
+            child_request_list=child_request_list
+        )
+        data_ids = self._parse_create_datapoints_result(createDatapoints_result, num_datapoints)
+        return data_ids
+
+    # Internal method for sending chunks of a list (or any other iterable) of
+    # items to Honeycomb concurrently (the client bounds the number of requests
+    # in flight). Items are consumed one chunk at a time, and at most twice as
+    # many chunks as max_concurrent_requests are held at once. Results are
+    # returned in input order. If any chunk fails, a ChunkedRequestError is
+    # raised which identifies the index range of every chunk that did not
+    # complete.
+    async def _process_chunks(
+        self,
+        items,
+        chunk_size,
+        chunk_function
+    ):
+        results = []
+        failed_chunks = []
+        task_chunk_ranges = dict()
+        def collect(tasks):
+            for task in tasks:
+                chunk_beginning, chunk_end = task_chunk_ranges.pop(task)
+                try:
+                    results[chunk_beginning:chunk_end] = task.result()
+                except Exception as exception:
+                    logger.warning('Chunk of items {} to {} failed: {}'.format(
+                        chunk_beginning,
+                        chunk_end - 1,
+                        exception
+                    ))
+                    failed_chunks.append((chunk_beginning, chunk_end, exception))
+        try:
+            for chunk_beginning, chunk_end, chunk_items in iter_chunks(items, chunk_size):
+                results.extend([None] * (chunk_end - chunk_beginning))
+                if len(task_chunk_ranges) >= 2 * self.max_concurrent_requests:
+                    done_tasks, pending_tasks = await asyncio.wait(
+                        task_chunk_ranges.keys(),
+                        return_when=asyncio.FIRST_COMPLETED
+                    )
+                    collect(done_tasks)
+                task = asyncio.ensure_future(chunk_function(chunk_items))
+                task_chunk_ranges[task] = (chunk_beginning, chunk_end)
+            if len(task_chunk_ranges) > 0:
+                done_tasks, pending_tasks = await asyncio.wait(task_chunk_ranges.keys())
+                collect(done_tasks)
+        finally:
+            for task in task_chunk_ranges.keys():
+                task.cancel()
+        if len(failed_chunks) > 0:
+            failed_chunks.sort(key=lambda failed_chunk: failed_chunk[0])
+            raise ChunkedRequestError(
+                results=results,
+                failed_chunks=failed_chunks
+            )
+        return results
+
+    async def _fetch_data_object_time_series(
+        self,
+        start_time,
+        end_time,
+        object_ids
+    ):
+        logger.info('Fetching datapoints between {} and {}'.format(
+            start_time,
+            end_time
+        ))
+        data=[]
+        num_datapoints = 0
+        async for datapoints in self._iter_datapoint_pages_object_time_series(
+            start_time,
+            end_time,
+            object_ids
+        ):
+            num_datapoints += len(datapoints)
+            for datapoint, timestamp in zip(datapoints, self._datapoint_timestamps(datapoints)):
+                data.extend(self._parse_datapoint(datapoint, timestamp))
+        logger.info('Parsed {} datapoints into {} rows'.format(
+            num_datapoints,
+            len(data)
+        ))
+        return data
+
+    # Internal method for deleting object time series data (see
+    # DatabaseConnectionHoneycomb._delete_data_object_time_series())
+    async def _delete_data_object_time_series(
+        self,
+        start_time,
+        end_time,
+        object_ids
+    ):
+        replacement_packs = []
+        if self.pack_interval is not None:
+            packed_delete_plan = self._packed_delete_plan(start_time, end_time)
+            async for datapoints in self._iter_packed_datapoint_pages_object_time_series(
+                self._packed_query_start_time(start_time),
+                end_time,
+                object_ids,
+                return_object=LEAN_FETCH_DATA_RETURN_OBJECT
+            ):
+                packed_delete_plan.add_page(datapoints)
+            data_ids = packed_delete_plan.data_ids
+            replacement_packs = packed_delete_plan.replacement_packs
+        else:
+            data_ids = await self._fetch_data_ids_object_time_series(
+                start_time,
+                end_time,
+                object_ids
+            )
+        if len(replacement_packs) > 0:
+            await self._process_chunks(
+                items=replacement_packs,
+                chunk_size=self.write_chunk_size,
+                chunk_function=self._write_datapoints_object_time_series
+            )
+        await self._delete_datapoints(data_ids)
+
+    async def _delete_datapoints(self, data_ids):
+        statuses = await self._process_chunks(
+            items=data_ids,
+            chunk_size=self.delete_chunk_size,
+            chunk_function=self._delete_datapoints_chunk
+        )
+        return statuses
+
+    async def _delete_datapoints_chunk(self, data_ids):
+        num_data_ids = len(data_ids)
+        deleteDatapoints_result = await self.honeycomb_client.compound_request(
+            parent_request_type='mutation',
+            parent_request_name='deleteDatapoints',
+            child_request_list=self._delete_datapoints_child_request_list(data_ids)
+        )
+        statuses = self._parse_delete_datapoints_result(deleteDatapoints_result, num_data_ids)
+        return statuses
+
+    async def _fetch_data_ids_object_time_series(
+        self,
+        start_time=None,
+        end_time=None,
+        object_ids=None
+    ):
+        data_ids = []
+        async for datapoints in self._iter_datapoint_pages_object_time_series(
+            start_time,
+            end_time,
+            object_ids,
+            return_object=FETCH_DATA_IDS_RETURN_OBJECT
+        ):
+            for datapoint in datapoints:
+                data_ids.append(datapoint.get('data_id'))
+        return data_ids
+
+    # Internal method for iterating over pages of datapoints in (timestamp, data
+    # ID) order. Datapoints repeated across page boundaries are dropped, and
+    # packed datapoints are unpacked and merged as in
+    # DatabaseConnectionHoneycomb._iter_datapoint_pages_object_time_series().
+    async def _iter_datapoint_pages_object_time_series(
+        self,
+        start_time=None,
+        end_time=None,
+        object_ids=None,
+        return_object=None
+    ):
+        if return_object is not None and return_object is not FETCH_DATA_RETURN_OBJECT:
+            async for datapoints in self._iter_packed_datapoint_pages_object_time_series(
+                start_time,
+                end_time,
+                object_ids,
+                return_object
+            ):
+                yield datapoints
+            return
+        merger = self._unpacked_datapoint_merger(start_time, end_time)
+        async for datapoints in self._iter_packed_datapoint_pages_object_time_series(
+            start_time,
+            end_time,
+            object_ids,
+            return_object
+        ):
+            datapoints = merger.add(datapoints)
+            if len(datapoints) > 0:
+                yield datapoints
+        datapoints = merger.finish()
+        if len(datapoints) > 0:
+            yield datapoints
+
+    async def _iter_packed_datapoint_pages_object_time_series(
+        self,
+        start_time=None,
+        end_time=None,
+        object_ids=None,
+        return_object=None
+    ):
+        if not self.time_series_database or not self.object_database:
+            raise ValueError('Fetching datapoints by time interval and/or object ID only enabled for object time series databases')
+        start_time = self._packed_query_start_time(start_time, return_object)
+        assignment_ids = self._fetch_assignment_ids_object_time_series(
+            start_time,
+            end_time,
+            object_ids
+        )
+        if len(assignment_ids) == 0:
+            return
+        resolve_sources = self.read_lean_fetch and (return_object is None or return_object is FETCH_DATA_RETURN_OBJECT)
+        if resolve_sources:
+            return_object = LEAN_FETCH_DATA_RETURN_OBJECT
+        query_expressions, shards_time_ordered = self._shard_query_expressions(
+            assignment_ids,
+            start_time,
+            end_time,
+            object_ids
+        )
+        async for datapoints in self._iter_sharded_datapoint_pages(
+            query_expressions,
+            shards_time_ordered=shards_time_ordered,
+            return_object=return_object
+        ):
+            if resolve_sources:
+                self._resolve_datapoint_sources(datapoints)
+            yield datapoints
+
+    async def _iter_query_datapoint_pages(
+        self,
+        query_expression,
+        return_object=None
+    ):
+        deduplicator = DatapointDeduplicator(self._python_datetime_utc)
+        chunk_counter = 1
+        async for chunk_datapoints in self._search_datapoints_pages(query_expression, return_object):
+            new_chunk_datapoints = deduplicator.filter(chunk_datapoints)
+            logger.info('Chunk {}: fetched {} results from {} to {} containing {} new datapoints'.format(
+                chunk_counter,
+                len(chunk_datapoints),
+                chunk_datapoints[0].get('timestamp'),
+                chunk_datapoints[-1].get('timestamp'),
+                len(new_chunk_datapoints)
+            ))
+            chunk_counter += 1
+            if len(new_chunk_datapoints) > 0:
+                yield new_chunk_datapoints
+
+    # Internal method for running several query expressions concurrently and
+    # merging their datapoints back into (timestamp, data ID) order (see
+    # DatabaseConnectionHoneycomb._iter_sharded_datapoint_pages()). The pages of
+    # each shard are fetched by a background task into a bounded queue (see
+    # AsyncReadAhead); the client's semaphore limits the requests in flight.
+    async def _iter_sharded_datapoint_pages(
+        self,
+        query_expressions,
+        shards_time_ordered,
+        return_object=None
+    ):
+        if len(query_expressions) == 0:
+            return
+        if len(query_expressions) == 1:
+            async for datapoints in self._iter_query_datapoint_pages(query_expressions[0], return_object):
+                yield datapoints
+            return
+        logger.info('Fetching datapoints in {} shards'.format(len(query_expressions)))
+        deduplicator = DatapointDeduplicator(self._python_datetime_utc)
+        shard_depth = max(self.read_ahead_pages or 0, 1)
+        shard_pages_list = []
+        def start_shard(query_expression):
+            shard_pages_list.append(AsyncReadAhead(
+                self._iter_query_datapoint_pages(query_expression, return_object),
+                shard_depth
+            ))
+        try:
+            if shards_time_ordered:
+                for shard_index in range(len(query_expressions)):
+                    while len(shard_pages_list) < min(shard_index + self.max_concurrent_requests, len(query_expressions)):
+                        start_shard(query_expressions[len(shard_pages_list)])
+                    async for datapoints in shard_pages_list[shard_index]:
+                        new_datapoints = deduplicator.filter(datapoints)
+                        if len(new_datapoints) > 0:
+                            yield new_datapoints
+            else:
+                for query_expression in query_expressions:
+                    start_shard(query_expression)
+                async for datapoints in self._merge_datapoint_pages(shard_pages_list):
+                    new_datapoints = deduplicator.filter(datapoints)
+                    if len(new_datapoints) > 0:
+                        yield new_datapoints
+        finally:
+            for shard_pages in shard_pages_list:
+                shard_pages.close()
+
+    # Internal method for merging several streams of sorted pages of datapoints
+    # into pages of (at most) read_chunk_size datapoints in (timestamp, data ID)
+    # order (see DatapointPageMerger)
+    async def _merge_datapoint_pages(
+        self,
+        streams
+    ):
+        merger = DatapointPageMerger(
+            num_streams=len(streams),
+            page_size=self.read_chunk_size,
+            sort_key=self._datapoint_sort_key
+        )
+        stream_index = merger.next_stream()
+        while stream_index is not None:
+            try:
+                datapoints = await streams[stream_index].__anext__()
+            except StopAsyncIteration:
+                datapoints = None
+            for merged_datapoints in merger.add_page(stream_index, datapoints):
+                yield merged_datapoints
+            stream_index = merger.next_stream()
+        datapoints = merger.finish()
+        if len(datapoints) > 0:
+            yield datapoints
+
+    async def _search_datapoints_pages(
+        self,
+        query_expression,
+        return_object=None
+    ):
+        if return_object is None:
+            return_object = FETCH_DATA_RETURN_OBJECT
+        cursor = None
+        while True:
+            arguments = self._fetch_datapoints_arguments(
+                query_expression,
+                cursor
+            )
+            searchDatapoints_result = await self.honeycomb_client.request(
+                request_type='query',
+                request_name='searchDatapoints',
+                arguments=arguments,
+                return_object=return_object
+            )
+            count = searchDatapoints_result.get('page_info').get('count')
+            cursor = searchDatapoints_result.get('page_info').get('cursor')
+            if cursor is None or count == 0:
+                break
+            yield searchDatapoints_result.get('data')
+
+class AsyncHoneycombClient(minimal_honeycomb.MinimalHoneycombClient):
+    """
+    Class to define an asyncio counterpart of MinimalHoneycombClient.
+
+    request() and compound_request() are coroutines which build the same
+    GraphQL request strings as MinimalHoneycombClient and send them through an
+    asynchronous transport, with at most max_concurrent_requests requests in
+    flight at once. Failed requests are retried with exponential backoff, as in
+    the synchronous client.
+    """
+
+    def __init__(
+        self,
+        uri=None,
+        token_uri=None,
+        audience=None,
+        client_id=None,
+        client_secret=None,
+        transport=None,
+        max_concurrent_requests=8,
+        timeout=DEFAULT_HTTP_REQUEST_TIMEOUT
+    ):
+        """
+        Constructor for AsyncHoneycombClient.
+
+        Honeycomb access parameters are resolved as in MinimalHoneycombClient.
+
+        Parameters:
+            uri (string): Honeycomb URI
+            token_uri (string): Honeycomb token URI
+            audience (string): Honeycomb audience
+            client_id (string): Honeycomb client ID
+            client_secret (string): Honeycomb client secret
+            transport (AiohttpTransport or compatible): Transport for HTTP requests (default is None, i.e., a new AiohttpTransport)
+            max_concurrent_requests (int): Maximum number of requests in flight at once (default is 8)
+            timeout (float): HTTP request timeout in seconds (default is 30)
+        """
+        super().__init__(
+            uri=uri,
+            token_uri=token_uri,
+            audience=audience,
+            client_id=client_id,
+            client_secret=client_secret
+        )
+        if transport is None:
+            if aiohttp is None:
+                raise ImportError('aiohttp must be installed to use the default async transport')
+            transport = AiohttpTransport(
+                timeout=timeout,
+                max_connections=max_concurrent_requests
+            )
+        self.uri = self.client.uri
+        self.client_credentials = self.client.client_credentials
+        self.transport = transport
+        self.semaphore = asyncio.BoundedSemaphore(max_concurrent_requests)
+        self._access_token = None
+        self._access_token_expires_at = None
+        self._access_token_lock = asyncio.Lock()
+
+    async def close(self):
+        """
+        Close the transport.
+        """
+        await self.transport.close()
+
+    async def request(
+        self,
+        request_type,
+        request_name,
+        arguments,
+        return_object
+    ):
+        request_string = self.request_string(
+            request_type,
+            request_name,
+            arguments,
+            return_object
+        )
+        if arguments is not None:
+            variables = {argument_name: argument_info['value'] for argument_name, argument_info in arguments.items()}
+        else:
+            variables = None
+        files = None
+        if request_name == 'createDatapoint':
+            # Prepare upload package
+            filename = uuid4().hex
+            try:
+                data = variables.get('datapoint').get('file').get('data')
+            except:
+                raise ValueError('createDatapoint arguments do not contain datapoint.file.data field')
+            try:
+                content_type = variables.get('datapoint').get('file').get('contentType')
+            except:
+                raise ValueError('createDatapoint arguments do not contain datapoint.file.contentType field')
+            files = FileUpload()
+            data_json = json.dumps(data)
+            files.add_file("variables.datapoint.file.data", filename, data_json, content_type)
+            # Replace data with filename
+            variables['datapoint']['file'] = {**variables['datapoint']['file'], 'data': filename}
+        response = await self.execute(request_string, variables, files)
+        try:
+            return_value = response[request_name]
+        except:
+            raise ValueError('Received unexpected response from Honeycomb: {}'.format(response))
+        return return_value
+
+    async def compound_request(
+        self,
+        parent_request_type,
+        parent_request_name,
+        child_request_list
+    ):
+        request_string = self.compound_request_string(
+            parent_request_type,
+            parent_request_name,
+            child_request_list
+        )
+        variables = dict()
+        files = FileUpload()
+        for child_request_index, child_request in enumerate(child_request_list):
+            child_request_name = child_request['name']
+            child_arguments = child_request['arguments']
+            if child_arguments is not None:
+                child_variables = dict()
+                for child_argument_name, child_argument_info in child_arguments.items():
+                    child_variables[child_argument_name] = child_argument_info['value']
+                if child_request_name == 'createDatapoint':
+                    # Prepare upload package
+                    filename = uuid4().hex
+                    try:
+                        data = child_variables.get('datapoint').get('file').get('data')
+                    except:
+                        raise ValueError('createDatapoint arguments do not contain datapoint.file.data field')
+                    try:
+                        content_type = child_variables.get('datapoint').get('file').get('contentType')
+                    except:
+                        raise ValueError('createDatapoint arguments do not contain datapoint.file.contentType field')
+                    data_json = json.dumps(data)
+                    files.add_file(
+                        'variables.datapoint_{}.file.data'.format(child_request_index),
+                        filename,
+                        data_json,
+                        content_type
+                    )
+                    # Replace data with filename
+                    child_variables['datapoint'] = {
+                        **child_variables['datapoint'],
+                        'file': {**child_variables['datapoint']['file'], 'data': filename}
+                    }
+                for child_variable_name, child_variable_value in child_variables.items():
+                    variables['{}_{}'.format(child_variable_name, child_request_index)] = child_variable_value
+        response = await self.execute(request_string, variables, files)
+        return response
+
+    @exponential_retry
+    async def execute(
+        self,
+        query,
+        variables=None,
+        files=None
+    ):
+        async with self.semaphore:
+            headers = {
+                'Authorization': 'Bearer {}'.format(await self._get_access_token())
+            }
+            payload = OrderedDict({
+                'query': query,
+                'variables': variables or {}
+            })
+            if files is not None and files.containsFiles:
+                result = await self.transport.post(
+                    self.uri,
+                    data={
+                        'operations': json_dumps(payload),
+                        'map': json_dumps(files.map)
+                    },
+                    files=files.list,
+                    headers=headers
+                )
+            else:
+                result = await self.transport.post(
+                    self.uri,
+                    data=json_dumps(payload),
+                    headers={**headers, 'Content-Type': 'application/json'}
+                )
+        if 'errors' in result:
+            return result.get('errors')
+        return result.get('data')
+
+    # Internal method for returning a current access token, requesting a new one
+    # (once, however many requests are waiting) when none has been issued yet or
+    # the current one is about to expire (see access_token_expires_at())
+    async def _get_access_token(self):
+        async with self._access_token_lock:
+            if self._access_token is None or time.time() >= self._access_token_expires_at:
+                auth_response = await self.transport.post(
+                    self.client_credentials['token_uri'],
+                    data={
+                        'audience': self.client_credentials['audience'],
+                        'grant_type': 'client_credentials',
+                        'client_id': self.client_credentials['client_id'],
+                        'client_secret': self.client_credentials['client_secret']
+                    }
+                )
+                access_token = auth_response.get('access_token')
+                if access_token is None:
+                    raise ValueError('Token request returned no access token (invalid client credentials?)')
+                self._access_token = access_token
+                self._access_token_expires_at = access_token_expires_at(auth_response)
+            return self._access_token
+
+class AsyncReadAhead:
+    """
+    Class to define an asynchronous iterator over items fetched ahead by a
+    background task (the asynchronous counterpart of read_ahead()).
+
+    Up to depth items are requested from the asynchronous iterable before the
+    caller asks for them. The background task starts as soon as the iterator is
+    created (so it must be created inside a running event loop); call close() to
+    cancel it if the caller stops before the iterable is exhausted.
+    """
+
+    def __init__(
+        self,
+        iterable,
+        depth
+    ):
+        """
+        Constructor for AsyncReadAhead.
+
+        Parameters:
+            iterable (asynchronous iterable): Source of items
+            depth (int): Maximum number of items fetched ahead of the caller
+        """
+        self._item_queue = asyncio.Queue(maxsize=depth)
+        self._done = False
+        self._task = asyncio.ensure_future(self._produce(iterable))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._done:
+            raise StopAsyncIteration
+        is_item, value = await self._item_queue.get()
+        if not is_item:
+            self._done = True
+            if value is not None:
+                raise value
+            raise StopAsyncIteration
+        return value
+
+    def close(self):
+        """
+        Stop fetching items.
+        """
+        self._done = True
+        self._task.cancel()
+
+    async def _produce(self, iterable):
+        try:
+            async for item in iterable:
+                await self._item_queue.put((True, item))
+        except asyncio.CancelledError:
+            raise
+        except Exception as exception:
+            await self._item_queue.put((False, exception))
+            return
+        await self._item_queue.put((False, None))
+
+class AiohttpTransport:
+    """
+    Class to define an asynchronous HTTP transport based on aiohttp.
+
+    A transport needs two coroutines: post() and close(). Other transports
+    (e.g., for testing against a local stand-in server, or based on a different
+    HTTP library) can be passed to AsyncDatabaseConnectionHoneycomb as long as
+    they provide the same interface.
+    """
+
+    def __init__(
+        self,
+        timeout=DEFAULT_HTTP_REQUEST_TIMEOUT,
+        max_connections=None
+    ):
+        """
+        Constructor for AiohttpTransport.
+
+        The underlying aiohttp session is created on first use, within the
+        running event loop.
+
+        Parameters:
+            timeout (float): HTTP request timeout in seconds (default is 30)
+            max_connections (int): Maximum number of open connections (default is None, i.e., aiohttp default)
+        """
+        if aiohttp is None:
+            raise ImportError('aiohttp must be installed to use AiohttpTransport')
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.session = None
+
+    async def post(
+        self,
+        url,
+        data=None,
+        files=None,
+        headers=None
+    ):
+        """
+        Send a POST request and return the decoded JSON response.
+
+        If data is a string, it is sent as the request body. If data is a dict,
+        it is sent form-encoded or, if files are specified, as multipart form
+        data along with the files.
+
+        Parameters:
+            url (string): URL for the request
+            data (string or dict): Request body or form fields (default is None)
+            files (list of tuple): Files as (field name, (filename, content, content type)) tuples (default is None)
+            headers (dict): Request headers (default is None)
+
+        Returns:
+            (dict): Decoded JSON response
+        """
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections or 100),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        if files is not None:
+            form_data = aiohttp.FormData()
+            for field_name, field_value in data.items():
+                form_data.add_field(field_name, field_value)
+            for field_name, (filename, content, content_type) in files:
+                form_data.add_field(
+                    field_name,
+                    content,
+                    filename=filename,
+                    content_type=content_type
+                )
+            data = form_data
+        async with self.session.post(url, data=data, headers=headers) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def close(self):
+        """
+        Close the underlying aiohttp session.
+        """
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
@@ -0,0 +1,279 @@
+import json
+import inspect
+import time
+import threading
+import queue
+import logging
+
+logger = logging.getLogger(__name__)
+
+class BufferedWriter:
+    """
+    Class to define a write-behind buffer for object time series datapoints.
+
+    Datapoints are appended one at a time and written in the background in
+    batches (one createDatapoints request per batch). A batch is written as
+    soon as it reaches the maximum count or the maximum size (in bytes of
+    JSON-encoded data) or once its oldest datapoint has waited for the maximum
+    latency. If the queue of datapoints waiting to be batched is full, append()
+    blocks until there is room (backpressure).
+
+    Batches are written in append order by a single background thread. If a
+    callback is specified, it is called with the list of data IDs returned for
+    each batch (in append order). Failed batches are retried as set by the
+    connection's write_retries and write_retry_backoff. If a batch still fails,
+    its datapoints and the exception are passed to the error callback (if
+    specified) or otherwise collected and raised as a BufferedWriteError by the
+    next call to flush() or close().
+
+    Callbacks are called on the background thread, so they must not call
+    append(), flush(), or close(): with a full queue, the background thread
+    would wait for room that only it can make. Such calls raise a ValueError
+    (which is logged, as for any other exception raised by a callback).
+
+    Use as a context manager (or call close()) to make sure that all appended
+    datapoints are written.
+    """
+
+    def __init__(
+        self,
+        connection,
+        max_count=None,
+        max_bytes=1000000,
+        max_latency=1.0,
+        max_queue_size=10000,
+        callback=None,
+        error_callback=None
+    ):
+        """
+        Constructor for BufferedWriter.
+
+        Parameters:
+            connection (DatabaseConnectionHoneycomb): Connection to write through
+            max_count (int): Maximum number of datapoints in each batch (default is the connection's write chunk size)
+            max_bytes (int): Maximum size of the data in each batch in bytes (default is 1000000)
+            max_latency (float): Maximum time a datapoint waits before its batch is written in seconds (default is 1.0; None means no limit)
+            max_queue_size (int): Maximum number of datapoints waiting to be batched before append() blocks (default is 10000)
+            callback (function): Function called with the data IDs of each written batch (default is None)
+            error_callback (function): Function called with the datapoints and exception of each failed batch (default is None)
+        """
+        if not connection.time_series_database or not connection.object_database:
+            raise ValueError('Buffered writes only enabled for object time series databases')
+        if inspect.iscoroutinefunction(connection._write_datapoints_object_time_series):
+            raise TypeError('Buffered writes require a synchronous connection')
+        self.connection = connection
+        self.max_count = max_count if max_count is not None else connection.write_chunk_size
+        self.max_bytes = max_bytes
+        self.max_latency = max_latency
+        self.callback = callback
+        self.error_callback = error_callback
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._failed_batches = []
+        self._failed_batches_lock = threading.Lock()
+        self._closed = False
+        self._close_lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run,
+            name='honeycomb-buffered-writer',
+            daemon=True
+        )
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def append(
+        self,
+        timestamp,
+        object_id,
+        data,
+        timeout=None
+    ):
+        """
+        Append a single datapoint for a given timestamp and object ID.
+
+        Arguments are the same as for write_datapoint_object_time_series(), but
+        the data cannot contain 'timestamp' or 'object_id' keys. If the queue is
+        full, blocks until there is room or until the timeout expires (in which
+        case queue.Full is raised).
+
+        Parameters:
+            timestamp (datetime or string): Timestamp associated with data
+            object_id (string): Object ID associated with data
+            data (dict): Data to be written
+            timeout (float): Maximum time to wait for room in the queue in seconds (default is None, i.e., wait indefinitely)
+        """
+        reserved_keys = [key for key in RESERVED_KEYS if key in data.keys()]
+        if len(reserved_keys) > 0:
+            raise ValueError('Data cannot contain the keys {} (pass them as arguments instead)'.format(reserved_keys))
+        timestamp = self.connection._python_datetime_utc(timestamp)
+        num_bytes = len(json.dumps(data))
+        self._put(
+            (timestamp, object_id, data, num_bytes),
+            timeout=timeout
+        )
+
+    def flush(self):
+        """
+        Write all datapoints appended so far and wait for the writes to complete.
+        """
+        flushed = threading.Event()
+        self._put(_Flush(flushed))
+        flushed.wait()
+        self._raise_failed_batches()
+
+    def close(self):
+        """
+        Write all datapoints appended so far and stop the background thread.
+        """
+        self._check_not_background_thread()
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_Flush(None))
+        self._thread.join()
+        self._raise_failed_batches()
+
+    # Internal method for queueing an item unless the writer is closed. The
+    # check and the put happen under the close lock, so no item can be queued
+    # behind the final flush marker (and so be silently dropped). If the queue
+    # is full, the lock is held until there is room; the background thread
+    # keeps draining the queue meanwhile, so this cannot deadlock (unless called
+    # from the background thread itself, which is rejected).
+    def _put(
+        self,
+        item,
+        timeout=None
+    ):
+        self._check_not_background_thread()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        if not self._close_lock.acquire(timeout=timeout if timeout is not None else -1):
+            raise queue.Full
+        try:
+            if self._closed:
+                raise ValueError('Buffered writer is closed')
+            self._queue.put(
+                item,
+                timeout=max(deadline - time.monotonic(), 0) if deadline is not None else None
+            )
+        finally:
+            self._close_lock.release()
+
+    # Internal method for rejecting calls from a callback, which runs on the
+    # background thread
+    def _check_not_background_thread(self):
+        if threading.get_ident() == self._thread.ident:
+            raise ValueError('Buffered writer cannot be used from its own callbacks')
+
+    def _run(self):
+        batch = []
+        batch_bytes = 0
+        batch_deadline = None
+        while True:
+            if len(batch) > 0 and batch_deadline is not None:
+                timeout = max(batch_deadline - time.monotonic(), 0)
+            else:
+                timeout = None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._write_batch(batch)
+                batch = []
+                batch_bytes = 0
+                continue
+            if isinstance(item, _Flush):
+                self._write_batch(batch)
+                batch = []
+                batch_bytes = 0
+                if item.event is None:
+                    return
+                item.event.set()
+                continue
+            timestamp, object_id, data, num_bytes = item
+            if len(batch) == 0 and self.max_latency is not None:
+                batch_deadline = time.monotonic() + self.max_latency
+            batch.append({**data, 'timestamp': timestamp, 'object_id': object_id})
+            batch_bytes += num_bytes
+            if (
+                len(batch) >= self.max_count or
+                (self.max_bytes is not None and batch_bytes >= self.max_bytes) or
+                (batch_deadline is not None and time.monotonic() >= batch_deadline)
+            ):
+                self._write_batch(batch)
+                batch = []
+                batch_bytes = 0
+
+    def _write_batch(self, batch):
+        if len(batch) == 0:
+            return
+        try:
+            data_ids = self.connection._call_with_retries(
+                self.connection._write_datapoints_object_time_series,
+                batch,
+                self.connection.write_retries,
+                self.connection.write_retry_backoff,
+                'Buffered write of {} datapoints'.format(len(batch))
+            )
+        except Exception as exception:
+            logger.warning('Buffered write of {} datapoints failed: {}'.format(
+                len(batch),
+                exception
+            ))
+            if self.error_callback is not None:
+                self._call(self.error_callback, batch, exception)
+            else:
+                with self._failed_batches_lock:
+                    self._failed_batches.append((batch, exception))
+            return
+        if self.callback is not None:
+            self._call(self.callback, data_ids)
+
+    # Internal method for calling a user callback without letting its
+    # exceptions stop the background thread
+    def _call(self, function, *args):
+        try:
+            function(*args)
+        except Exception as exception:
+            logger.warning('Buffered writer callback raised an exception: {}'.format(exception))
+
+    def _raise_failed_batches(self):
+        with self._failed_batches_lock:
+            failed_batches = self._failed_batches
+            self._failed_batches = []
+        if len(failed_batches) > 0:
+            raise BufferedWriteError(failed_batches)
+
+class BufferedWriteError(ValueError):
+    """
+    Exception raised when batches of a buffered write fail.
+
+    The failed_batches attribute holds a (datapoints, exception) tuple for each
+    failed batch, where datapoints is the list of datapoint dicts (including
+    timestamp and object ID) in the batch.
+    """
+
+    def __init__(
+        self,
+        failed_batches
+    ):
+        self.failed_batches = failed_batches
+        num_datapoints = sum([len(datapoints) for datapoints, exception in failed_batches])
+        super().__init__('{} buffered write batches ({} datapoints) failed; first error: {}'.format(
+            len(failed_batches),
+            num_datapoints,
+            failed_batches[0][1]
+        ))
+
+class _Flush:
+    # Queue marker requesting that the current batch be written (and, if the
+    # event is None, that the background thread stop)
+    def __init__(self, event):
+        self.event = event
+
+# Keys which hold the timestamp and object ID of each datapoint in a batch, and
+# so cannot appear in appended data
+RESERVED_KEYS = ['timestamp', 'object_id']
@@ -0,0 +1,359 @@
+import sqlite3
+import datetime
+import threading
+import hashlib
+import json
+import time
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+# Timestamps are stored as Honeycomb-format strings with microsecond precision,
+# which sort in time order
+MIN_TIMESTAMP = '0001-01-01T00:00:00.000000Z'
+MAX_TIMESTAMP = '9999-12-31T23:59:59.999999Z'
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS datapoints (
+        environment TEXT NOT NULL,
+        assignment_id TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        data_id TEXT NOT NULL,
+        datapoint TEXT NOT NULL,
+        PRIMARY KEY (environment, assignment_id, timestamp, data_id)
+    )''',
+    '''CREATE INDEX IF NOT EXISTS datapoints_timestamp
+        ON datapoints (environment, timestamp, data_id)''',
+    '''CREATE TABLE IF NOT EXISTS coverage (
+        environment TEXT NOT NULL,
+        assignment_id TEXT NOT NULL,
+        start TEXT NOT NULL,
+        end TEXT NOT NULL,
+        num_bytes INTEGER NOT NULL,
+        last_access REAL NOT NULL
+    )''',
+    '''CREATE INDEX IF NOT EXISTS coverage_assignment
+        ON coverage (environment, assignment_id, start)'''
+]
+
+def shift_timestamp(timestamp, microseconds):
+    """
+    Shift a Honeycomb-format timestamp by a number of microseconds.
+
+    Parameters:
+        timestamp (string): Timestamp (Honeycomb format)
+        microseconds (int): Number of microseconds to shift by
+
+    Returns:
+        (string): Shifted timestamp (Honeycomb format)
+    """
+    if timestamp in [MIN_TIMESTAMP, MAX_TIMESTAMP]:
+        return timestamp
+    shifted_datetime = datetime.datetime.strptime(timestamp, TIMESTAMP_FORMAT) + datetime.timedelta(microseconds=microseconds)
+    return shifted_datetime.strftime(TIMESTAMP_FORMAT)
+
+class DatapointCache:
+    """
+    Class to define a persistent local cache of Honeycomb datapoints.
+
+    Datapoints are stored in a SQLite database, keyed by environment,
+    assignment ID, timestamp, and data ID, together with the time ranges
+    (coverage) for which the cache holds every datapoint of an assignment. Only
+    time ranges outside the coverage need to be fetched from Honeycomb.
+
+    When the total size of the cached datapoints exceeds the maximum size, the
+    least recently used coverage ranges (and their datapoints) are evicted.
+    """
+
+    def __init__(
+        self,
+        cache_directory,
+        honeycomb_uri=None,
+        max_bytes=1000000000
+    ):
+        """
+        Constructor for DatapointCache.
+
+        A separate database file is used for each Honeycomb URI, so a single
+        cache directory can be shared across Honeycomb deployments.
+
+        Parameters:
+            cache_directory (string): Directory in which to store the cache database
+            honeycomb_uri (string): Honeycomb URI that the cached data comes from (default: None)
+            max_bytes (int): Maximum total size of cached datapoints in bytes (default is 1000000000)
+        """
+        os.makedirs(cache_directory, exist_ok=True)
+        uri_hash = hashlib.sha1((honeycomb_uri or '').encode('utf-8')).hexdigest()[:16]
+        self.path = os.path.join(cache_directory, 'datapoints_{}.sqlite'.format(uri_hash))
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            isolation_level=None
+        )
+        with self.lock:
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+
+    def uncovered_ranges(
+        self,
+        environment,
+        assignment_id,
+        start,
+        end
+    ):
+        """
+        Find the parts of a time range not covered by the cache for an assignment.
+
+        Parameters:
+            environment (string): Honeycomb environment name
+            assignment_id (string): Honeycomb assignment ID
+            start (string): Beginning of range (Honeycomb format)
+            end (string): End of range (Honeycomb format)
+
+        Returns:
+            (list of tuple): Start and end of each uncovered range (bounds inclusive)
+        """
+        with self.lock:
+            covered_ranges = self.connection.execute(
+                'SELECT start, end FROM coverage WHERE environment = ? AND assignment_id = ? AND end >= ? AND start <= ? ORDER BY start',
+                (environment, assignment_id, start, end)
+            ).fetchall()
+        uncovered_ranges = []
+        uncovered_start = start
+        for covered_start, covered_end in covered_ranges:
+            if covered_start > uncovered_start:
+                uncovered_ranges.append((uncovered_start, covered_start))
+            if covered_end > uncovered_start:
+                uncovered_start = covered_end
+        if uncovered_start < end or (uncovered_start == end and len(covered_ranges) == 0):
+            uncovered_ranges.append((uncovered_start, end))
+        return uncovered_ranges
+
+    def add_datapoints(
+        self,
+        environment,
+        datapoints
+    ):
+        """
+        Store datapoints in the cache.
+
+        Parameters:
+            environment (string): Honeycomb environment name
+            datapoints (list of tuple): Assignment ID, timestamp (Honeycomb format), data ID, and datapoint (dict) for each datapoint
+        """
+        rows = [
+            (environment, assignment_id, timestamp, data_id, json.dumps(datapoint))
+            for assignment_id, timestamp, data_id, datapoint in datapoints
+        ]
+        with self.lock:
+            self.connection.execute('BEGIN')
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO datapoints (environment, assignment_id, timestamp, data_id, datapoint) VALUES (?, ?, ?, ?, ?)',
+                rows
+            )
+            self.connection.execute('COMMIT')
+
+    def add_coverage(
+        self,
+        environment,
+        assignment_ids,
+        start,
+        end
+    ):
+        """
+        Record that the cache holds every datapoint in a time range for a set of assignments.
+
+        Parameters:
+            environment (string): Honeycomb environment name
+            assignment_ids (list of string): Honeycomb assignment IDs
+            start (string): Beginning of range (Honeycomb format)
+            end (string): End of range (Honeycomb format)
+        """
+        now = time.time()
+        with self.lock:
+            self.connection.execute('BEGIN')
+            for assignment_id in assignment_ids:
+                overlapping_ranges = self.connection.execute(
+                    'SELECT rowid, start, end FROM coverage WHERE environment = ? AND assignment_id = ? AND end >= ? AND start <= ?',
+                    (environment, assignment_id, start, end)
+                ).fetchall()
+                merged_start = min([start] + [overlapping_range[1] for overlapping_range in overlapping_ranges])
+                merged_end = max([end] + [overlapping_range[2] for overlapping_range in overlapping_ranges])
+                self.connection.executemany(
+                    'DELETE FROM coverage WHERE rowid = ?',
+                    [(overlapping_range[0],) for overlapping_range in overlapping_ranges]
+                )
+                num_bytes = self.connection.execute(
+                    'SELECT COALESCE(SUM(LENGTH(datapoint)), 0) FROM datapoints WHERE environment = ? AND assignment_id = ? AND timestamp BETWEEN ? AND ?',
+                    (environment, assignment_id, merged_start, merged_end)
+                ).fetchone()[0]
+                self.connection.execute(
+                    'INSERT INTO coverage (environment, assignment_id, start, end, num_bytes, last_access) VALUES (?, ?, ?, ?, ?, ?)',
+                    (environment, assignment_id, merged_start, merged_end, num_bytes, now)
+                )
+            self.connection.execute('COMMIT')
+
+    def iter_datapoint_pages(
+        self,
+        environment,
+        assignment_ids,
+        start,
+        end,
+        page_size
+    ):
+        """
+        Iterate over cached datapoints in (timestamp, data ID) order.
+
+        Parameters:
+            environment (string): Honeycomb environment name
+            assignment_ids (list of string): Honeycomb assignment IDs
+            start (string): Beginning of range (Honeycomb format)
+            end (string): End of range (Honeycomb format)
+            page_size (int): Number of datapoints in each page
+
+        Returns:
+            (generator of list of dict): Pages of datapoints
+        """
+        assignment_ids_json = json.dumps(list(assignment_ids))
+        with self.lock:
+            self.connection.execute(
+                'UPDATE coverage SET last_access = ? WHERE environment = ? AND assignment_id IN (SELECT value FROM json_each(?)) AND end >= ? AND start <= ?',
+                (time.time(), environment, assignment_ids_json, start, end)
+            )
+        last_key = None
+        while True:
+            with self.lock:
+                if last_key is None:
+                    rows = self.connection.execute(
+                        'SELECT timestamp, data_id, datapoint FROM datapoints WHERE environment = ? AND assignment_id IN (SELECT value FROM json_each(?)) AND timestamp BETWEEN ? AND ? ORDER BY timestamp, data_id LIMIT ?',
+                        (environment, assignment_ids_json, start, end, page_size)
+                    ).fetchall()
+                else:
+                    rows = self.connection.execute(
+                        'SELECT timestamp, data_id, datapoint FROM datapoints WHERE environment = ? AND assignment_id IN (SELECT value FROM json_each(?)) AND (timestamp, data_id) > (?, ?) AND timestamp <= ? ORDER BY timestamp, data_id LIMIT ?',
+                        (environment, assignment_ids_json, last_key[0], last_key[1], end, page_size)
+                    ).fetchall()
+            if len(rows) == 0:
+                return
+            last_key = (rows[-1][0], rows[-1][1])
+            yield [json.loads(row[2]) for row in rows]
+            if len(rows) < page_size:
+                return
+
+    def invalidate(
+        self,
+        environment,
+        assignment_ids,
+        start,
+        end
+    ):
+        """
+        Remove datapoints and coverage in a time range for a set of assignments.
+
+        Parameters:
+            environment (string): Honeycomb environment name
+            assignment_ids (list of string): Honeycomb assignment IDs
+            start (string): Beginning of range (Honeycomb format)
+            end (string): End of range (Honeycomb format)
+        """
+        with self.lock:
+            self.connection.execute('BEGIN')
+            for assignment_id in assignment_ids:
+                self.connection.execute(
+                    'DELETE FROM datapoints WHERE environment = ? AND assignment_id = ? AND timestamp BETWEEN ? AND ?',
+                    (environment, assignment_id, start, end)
+                )
+                overlapping_ranges = self.connection.execute(
+                    'SELECT rowid, start, end, last_access FROM coverage WHERE environment = ? AND assignment_id = ? AND end >= ? AND start <= ?',
+                    (environment, assignment_id, start, end)
+                ).fetchall()
+                for rowid, covered_start, covered_end, last_access in overlapping_ranges:
+                    self.connection.execute('DELETE FROM coverage WHERE rowid = ?', (rowid,))
+                    # Keep the parts of the coverage outside the invalidated range
+                    remaining_ranges = []
+                    if covered_start < start:
+                        remaining_ranges.append((covered_start, shift_timestamp(start, -1)))
+                    if covered_end > end:
+                        remaining_ranges.append((shift_timestamp(end, 1), covered_end))
+                    for remaining_start, remaining_end in remaining_ranges:
+                        num_bytes = self.connection.execute(
+                            'SELECT COALESCE(SUM(LENGTH(datapoint)), 0) FROM datapoints WHERE environment = ? AND assignment_id = ? AND timestamp BETWEEN ? AND ?',
+                            (environment, assignment_id, remaining_start, remaining_end)
+                        ).fetchone()[0]
+                        self.connection.execute(
+                            'INSERT INTO coverage (environment, assignment_id, start, end, num_bytes, last_access) VALUES (?, ?, ?, ?, ?, ?)',
+                            (environment, assignment_id, remaining_start, remaining_end, num_bytes, last_access)
+                        )
+            self.connection.execute('COMMIT')
+
+    def discard_uncovered_datapoints(
+        self,
+        environment,
+        assignment_ids,
+        start,
+        end
+    ):
+        """
+        Remove datapoints in a time range which no coverage range covers for a set of assignments.
+
+        Datapoints are stored before their coverage is recorded, so this removes
+        the datapoints left behind by a fetch which failed partway (or whose
+        coverage was cut short).
+
+        Parameters:
+            environment (string): Honeycomb environment name
+            assignment_ids (list of string): Honeycomb assignment IDs
+            start (string): Beginning of range (Honeycomb format)
+            end (string): End of range (Honeycomb format)
+        """
+        with self.lock:
+            self.connection.execute(
+                'DELETE FROM datapoints WHERE environment = ? AND assignment_id IN (SELECT value FROM json_each(?)) AND timestamp BETWEEN ? AND ? AND NOT EXISTS (SELECT 1 FROM coverage WHERE coverage.environment = datapoints.environment AND coverage.assignment_id = datapoints.assignment_id AND datapoints.timestamp BETWEEN coverage.start AND coverage.end)',
+                (environment, json.dumps(list(assignment_ids)), start, end)
+            )
+
+    def evict(self):
+        """
+        Evict least recently used coverage ranges until the cache fits within its maximum size.
+
+        Called after each read completes, so that a read larger than the cache
+        is still served in full.
+        """
+        with self.lock:
+            total_bytes = self.connection.execute('SELECT COALESCE(SUM(num_bytes), 0) FROM coverage').fetchone()[0]
+            if total_bytes <= self.max_bytes:
+                return
+            self.connection.execute('BEGIN')
+            coverage_rows = self.connection.execute(
+                'SELECT rowid, environment, assignment_id, start, end, num_bytes FROM coverage ORDER BY last_access'
+            ).fetchall()
+            num_evicted = 0
+            for rowid, environment, assignment_id, start, end, num_bytes in coverage_rows:
+                if total_bytes <= self.max_bytes:
+                    break
+                self.connection.execute('DELETE FROM coverage WHERE rowid = ?', (rowid,))
+                self.connection.execute(
+                    'DELETE FROM datapoints WHERE environment = ? AND assignment_id = ? AND timestamp BETWEEN ? AND ?',
+                    (environment, assignment_id, start, end)
+                )
+                total_bytes -= num_bytes
+                num_evicted += 1
+            self.connection.execute('COMMIT')
+        logger.info('Evicted {} cached ranges'.format(num_evicted))
+
+    def clear(self):
+        """
+        Remove all datapoints and coverage from the cache.
+        """
+        with self.lock:
+            self.connection.execute('DELETE FROM datapoints')
+            self.connection.execute('DELETE FROM coverage')
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,293 @@
+import json
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class WriteCheckpoint:
+    """
+    Class to define a checkpoint file for a chunked bulk write.
+
+    The file records each completed chunk (its index range and the data IDs
+    that Honeycomb returned for it) as one JSON line, so that a restarted job
+    can skip the chunks that have already been written. The first line
+    identifies the job by its number of datapoints and chunk size; a checkpoint
+    can only be resumed by a write of the same datapoints with the same chunk
+    size. The number of datapoints is None for a write from an iterable of
+    unknown length, in which case the iterable must yield the same datapoints
+    in the same order when the write is resumed.
+
+    Each record is handed to the operating system as soon as its chunk
+    completes, so it survives a crash of the job. By default it is also synced
+    to disk (so that it survives a crash of the machine); with a sync interval,
+    the file is synced at most once per interval and when the write ends, so a
+    crash of the machine can lose the latest records and their chunks are
+    written again when the write is resumed.
+    """
+
+    def __init__(
+        self,
+        path,
+        num_items,
+        chunk_size,
+        sync_interval=0.0
+    ):
+        """
+        Constructor for WriteCheckpoint.
+
+        Parameters:
+            path (string): Path of the checkpoint file (created if it does not exist)
+            num_items (int): Number of datapoints in the write (None if not known in advance)
+            chunk_size (int): Number of datapoints in each chunk
+            sync_interval (float): Minimum time between syncs of the file to disk in seconds (default is 0.0, i.e., sync every record; None means only when sync() is called)
+        """
+        self.path = path
+        self.num_items = num_items
+        self.chunk_size = chunk_size
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._last_sync_time = time.monotonic()
+        self._unsynced = False
+
+    def load(self):
+        """
+        Read the completed chunks from the checkpoint file.
+
+        Returns:
+            (dict): Map from (chunk beginning, chunk end) to the list of data IDs written for the chunk
+        """
+        completed_chunks = dict()
+        if not os.path.exists(self.path):
+            return completed_chunks
+        with open(self.path, 'r') as checkpoint_file:
+            lines = checkpoint_file.read().split('\n')
+        if len(lines[0]) == 0:
+            return completed_chunks
+        header = json.loads(lines[0])
+        if header.get('num_items') != self.num_items or header.get('chunk_size') != self.chunk_size:
+            raise ValueError('Checkpoint {} is for a write of {} items in chunks of {} but this write has {} items in chunks of {}'.format(
+                self.path,
+                header.get('num_items'),
+                header.get('chunk_size'),
+                self.num_items,
+                self.chunk_size
+            ))
+        for line in lines[1:]:
+            if len(line) == 0:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by an interrupted job
+                logger.warning('Ignoring incomplete record in checkpoint {}'.format(self.path))
+                continue
+            completed_chunks[(record['beginning'], record['end'])] = record['data_ids']
+        return completed_chunks
+
+    def record(
+        self,
+        chunk_beginning,
+        chunk_end,
+        data_ids
+    ):
+        """
+        Append a completed chunk to the checkpoint file.
+
+        Safe to call from several threads at once. The record is written to the
+        file before returning, and synced to disk if the sync interval has
+        elapsed since the last sync.
+
+        Parameters:
+            chunk_beginning (int): Index of the first datapoint in the chunk
+            chunk_end (int): Index after the last datapoint in the chunk
+            data_ids (list of string): Data IDs written for the chunk
+        """
+        with self._lock:
+            sync = self.sync_interval is not None and time.monotonic() - self._last_sync_time >= self.sync_interval
+            _append_record(
+                self.path,
+                {
+                    'num_items': self.num_items,
+                    'chunk_size': self.chunk_size
+                },
+                {
+                    'beginning': chunk_beginning,
+                    'end': chunk_end,
+                    'data_ids': data_ids
+                },
+                sync=sync
+            )
+            if sync:
+                self._last_sync_time = time.monotonic()
+            self._unsynced = not sync
+
+    def sync(self):
+        """
+        Sync any records which have not yet been synced to disk.
+        """
+        with self._lock:
+            if not self._unsynced:
+                return
+            with open(self.path, 'a') as checkpoint_file:
+                os.fsync(checkpoint_file.fileno())
+            self._last_sync_time = time.monotonic()
+            self._unsynced = False
+
+class FetchCheckpoint:
+    """
+    Class to define a checkpoint file for a long fetch whose rows are handed to
+    a sink.
+
+    Each time a batch of rows has been handed to the sink, the file records the
+    timestamp and data ID of the last datapoint in the batch (and the total
+    number of rows so far) as one JSON line, so that a restarted fetch can skip
+    the datapoints which have already been handed over. A final line marks the
+    fetch as complete. The first line identifies the fetch by its time span and
+    object IDs; a checkpoint can only be resumed by a fetch with the same
+    arguments.
+    """
+
+    def __init__(
+        self,
+        path,
+        start_time,
+        end_time,
+        object_ids
+    ):
+        """
+        Constructor for FetchCheckpoint.
+
+        Parameters:
+            path (string): Path of the checkpoint file (created if it does not exist)
+            start_time (string): Beginning of timespan in Honeycomb format (None if not specified)
+            end_time (string): End of timespan in Honeycomb format (None if not specified)
+            object_ids (list of string): Object IDs (None if not specified)
+        """
+        self.path = path
+        self.start_time = start_time
+        self.end_time = end_time
+        self.object_ids = sorted(object_ids) if object_ids is not None else None
+
+    def load(self):
+        """
+        Read the progress of the fetch from the checkpoint file.
+
+        Returns:
+            (dict): Latest record, with 'timestamp', 'data_id', 'num_rows', and 'complete' elements (None if nothing has been recorded)
+        """
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'r') as checkpoint_file:
+            lines = checkpoint_file.read().split('\n')
+        if len(lines[0]) == 0:
+            return None
+        header = json.loads(lines[0])
+        if header != self._header():
+            raise ValueError('Checkpoint {} is for a fetch from {} to {} for object IDs {} but this fetch is from {} to {} for object IDs {}'.format(
+                self.path,
+                header.get('start_time'),
+                header.get('end_time'),
+                header.get('object_ids'),
+                self.start_time,
+                self.end_time,
+                self.object_ids
+            ))
+        progress = None
+        for line in lines[1:]:
+            if len(line) == 0:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by an interrupted job
+                logger.warning('Ignoring incomplete record in checkpoint {}'.format(self.path))
+                continue
+            if record.get('complete'):
+                if progress is None:
+                    progress = {
+                        'timestamp': None,
+                        'data_id': None,
+                        'num_rows': 0
+                    }
+                progress['complete'] = True
+                continue
+            progress = {
+                'timestamp': record['timestamp'],
+                'data_id': record['data_id'],
+                'num_rows': record['num_rows'],
+                'complete': False
+            }
+        return progress
+
+    def record(
+        self,
+        timestamp,
+        data_id,
+        num_rows
+    ):
+        """
+        Append the position of the fetch to the checkpoint file.
+
+        The record is flushed to disk before returning.
+
+        Parameters:
+            timestamp (string): Timestamp of the last datapoint handed to the sink (Honeycomb format)
+            data_id (string): Data ID of the last datapoint handed to the sink
+            num_rows (int): Total number of rows handed to the sink so far
+        """
+        _append_record(
+            self.path,
+            self._header(),
+            {
+                'timestamp': timestamp,
+                'data_id': data_id,
+                'num_rows': num_rows
+            }
+        )
+
+    def complete(self):
+        """
+        Mark the fetch as complete in the checkpoint file.
+        """
+        _append_record(
+            self.path,
+            self._header(),
+            {
+                'complete': True
+            }
+        )
+
+    def _header(self):
+        return {
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+            'object_ids': self.object_ids
+        }
+
+# Internal function for appending a record to a checkpoint file (starting the
+# file with a header if it is empty). The record is flushed to the operating
+# system before returning, and synced to disk unless sync is False.
+def _append_record(
+    path,
+    header,
+    record,
+    sync=True
+):
+    write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+    terminate_line = False
+    if not write_header:
+        with open(path, 'rb') as checkpoint_file:
+            checkpoint_file.seek(-1, os.SEEK_END)
+            terminate_line = checkpoint_file.read(1) != b'\n'
+    with open(path, 'a') as checkpoint_file:
+        if write_header:
+            checkpoint_file.write(json.dumps(header) + '\n')
+        if terminate_line:
+            # Keep a record cut short by an interrupted job on its own line
+            checkpoint_file.write('\n')
+        checkpoint_file.write(json.dumps(record) + '\n')
+        checkpoint_file.flush()
+        if sync:
+            os.fsync(checkpoint_file.fileno())
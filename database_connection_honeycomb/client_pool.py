@@ -0,0 +1,315 @@
+import minimal_honeycomb
+from gqlpycgen.client import Client, exponential_retry, DEFAULT_HTTP_REQUEST_TIMEOUT
+from gqlpycgen.utils import json_dumps
+from collections import OrderedDict
+import requests
+import requests.adapters
+import threading
+import time
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONNECTIONS = 10
+
+# Lifetime assumed for access tokens whose token response does not include one
+# (in seconds)
+DEFAULT_ACCESS_TOKEN_LIFETIME = 3600
+
+# Access tokens are refreshed this long before they expire (in seconds), but at
+# most this fraction of their lifetime early
+ACCESS_TOKEN_REFRESH_MARGIN = 300
+ACCESS_TOKEN_REFRESH_MARGIN_FRACTION = 0.1
+
+_client_pool = dict()
+_client_pool_lock = threading.Lock()
+
+def get_pooled_client(
+    uri=None,
+    token_uri=None,
+    audience=None,
+    client_id=None,
+    client_secret=None,
+    max_connections=DEFAULT_MAX_CONNECTIONS
+):
+    """
+    Get the process-wide Honeycomb client for a set of access parameters.
+
+    Clients are pooled by (URI, token URI, audience, client ID), so every
+    caller with the same access parameters shares one HTTP session (and its
+    keep-alive connections) and one access token. The maximum number of
+    connections is set by the first caller for each set of access parameters.
+
+    If Honeycomb access parameters are not specified, they are read from the
+    corresponding environment variables (as in MinimalHoneycombClient).
+
+    Parameters:
+        uri (string): Honeycomb URI
+        token_uri (string): Honeycomb token URI
+        audience (string): Honeycomb audience
+        client_id (string): Honeycomb client ID
+        client_secret (string): Honeycomb client secret
+        max_connections (int): Maximum number of open connections to the Honeycomb URI (default is 10)
+
+    Returns:
+        (PooledHoneycombClient): Shared client
+    """
+    uri, token_uri, audience, client_id, client_secret = _resolve_access_parameters(
+        uri,
+        token_uri,
+        audience,
+        client_id,
+        client_secret
+    )
+    key = (uri, token_uri, audience, client_id)
+    with _client_pool_lock:
+        pooled_client = _client_pool.get(key)
+        if pooled_client is None:
+            # Missing access parameters are reported by the constructor
+            pooled_client = PooledHoneycombClient(
+                uri=uri,
+                token_uri=token_uri,
+                audience=audience,
+                client_id=client_id,
+                client_secret=client_secret,
+                max_connections=max_connections
+            )
+            _client_pool[key] = pooled_client
+            return pooled_client
+    if pooled_client.client.client_credentials['client_secret'] != client_secret:
+        raise ValueError('Pooled Honeycomb client for client ID {} was created with a different client secret'.format(client_id))
+    return pooled_client
+
+def clear_client_pool():
+    """
+    Close and forget all pooled Honeycomb clients.
+    """
+    with _client_pool_lock:
+        pooled_clients = list(_client_pool.values())
+        _client_pool.clear()
+    for pooled_client in pooled_clients:
+        pooled_client.close()
+
+# Internal function for filling in unspecified Honeycomb access parameters from
+# environment variables (as MinimalHoneycombClient does)
+def _resolve_access_parameters(
+    uri,
+    token_uri,
+    audience,
+    client_id,
+    client_secret
+):
+    return (
+        uri if uri is not None else os.getenv('HONEYCOMB_URI'),
+        token_uri if token_uri is not None else os.getenv('HONEYCOMB_TOKEN_URI'),
+        audience if audience is not None else os.getenv('HONEYCOMB_AUDIENCE'),
+        client_id if client_id is not None else os.getenv('HONEYCOMB_CLIENT_ID'),
+        client_secret if client_secret is not None else os.getenv('HONEYCOMB_CLIENT_SECRET')
+    )
+
+def access_token_expires_at(auth_response):
+    """
+    Compute when to request a new access token after a token response.
+
+    Tokens are refreshed ACCESS_TOKEN_REFRESH_MARGIN seconds before they
+    expire, but never earlier than ACCESS_TOKEN_REFRESH_MARGIN_FRACTION of the
+    way through their lifetime, so short-lived tokens are still reused. If the
+    response does not include a lifetime, DEFAULT_ACCESS_TOKEN_LIFETIME is
+    assumed.
+
+    Parameters:
+        auth_response (dict): Decoded response of the token endpoint
+
+    Returns:
+        (float): Time (as returned by time.time()) at which to request a new token
+    """
+    expires_in = auth_response.get('expires_in')
+    if expires_in is None:
+        expires_in = DEFAULT_ACCESS_TOKEN_LIFETIME
+    refresh_margin = min(ACCESS_TOKEN_REFRESH_MARGIN, ACCESS_TOKEN_REFRESH_MARGIN_FRACTION * expires_in)
+    return time.time() + expires_in - refresh_margin
+
+class PooledHoneycombClient(minimal_honeycomb.MinimalHoneycombClient):
+    """
+    Class to define a MinimalHoneycombClient which is safe to share between
+    threads and instances.
+
+    Requests are sent through a single HTTP session with a bounded pool of
+    keep-alive connections, and one access token is shared by all requests.
+    """
+
+    def __init__(
+        self,
+        uri=None,
+        token_uri=None,
+        audience=None,
+        client_id=None,
+        client_secret=None,
+        max_connections=DEFAULT_MAX_CONNECTIONS
+    ):
+        """
+        Constructor for PooledHoneycombClient.
+
+        Honeycomb access parameters are resolved as in MinimalHoneycombClient.
+        Most callers should use get_pooled_client() rather than constructing a
+        client directly.
+
+        Parameters:
+            uri (string): Honeycomb URI
+            token_uri (string): Honeycomb token URI
+            audience (string): Honeycomb audience
+            client_id (string): Honeycomb client ID
+            client_secret (string): Honeycomb client secret
+            max_connections (int): Maximum number of open connections to the Honeycomb URI (default is 10)
+        """
+        super().__init__(
+            uri=uri,
+            token_uri=token_uri,
+            audience=audience,
+            client_id=client_id,
+            client_secret=client_secret
+        )
+        self.client = SessionClient(
+            uri=self.client.uri,
+            client_credentials=self.client.client_credentials,
+            max_connections=max_connections
+        )
+
+    def close(self):
+        """
+        Close the HTTP session.
+        """
+        self.client.close()
+
+class SessionClient(Client):
+    """
+    Class to define a GraphQL client which sends requests through a shared
+    HTTP session and refreshes its access token under a lock.
+    """
+
+    def __init__(
+        self,
+        uri,
+        client_credentials,
+        max_connections=DEFAULT_MAX_CONNECTIONS,
+        timeout=DEFAULT_HTTP_REQUEST_TIMEOUT
+    ):
+        """
+        Constructor for SessionClient.
+
+        Requests wait for a free connection once max_connections are in use.
+
+        Parameters:
+            uri (string): GraphQL URI
+            client_credentials (dict): Token URI, audience, client ID, and client secret
+            max_connections (int): Maximum number of open connections to each host (default is 10)
+            timeout (float): HTTP request timeout in seconds (default is 30)
+        """
+        self._token_lock = threading.Lock()
+        self._transfer_sizes = threading.local()
+        self._access_token = None
+        self._access_token_expires_at = None
+        super().__init__(
+            uri=uri,
+            client_credentials=client_credentials,
+            timeout=timeout
+        )
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=max_connections,
+            pool_block=True
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        self.session.close()
+
+    def last_transfer_sizes(self):
+        """
+        Return the sizes of the last request and response sent by this thread.
+
+        Sizes are those of the request body as sent (including any multipart
+        framing) and of the response body as received (before any decoding of
+        its content encoding, if the server reports a Content-Length).
+
+        Returns:
+            (tuple): Number of bytes sent and number of bytes received (or None if this thread has sent no request)
+        """
+        return getattr(self._transfer_sizes, 'sizes', None)
+
+    # Internal method for returning a current access token, requesting a new one
+    # (once, however many threads are waiting) when none has been issued yet or
+    # the current one is about to expire (see access_token_expires_at())
+    def _get_access_token(self):
+        with self._token_lock:
+            if self._access_token is None or time.time() >= self._access_token_expires_at:
+                auth_response = self.session.post(
+                    self.client_credentials['token_uri'],
+                    {
+                        'audience': self.client_credentials['audience'],
+                        'grant_type': 'client_credentials',
+                        'client_id': self.client_credentials['client_id'],
+                        'client_secret': self.client_credentials['client_secret']
+                    },
+                    timeout=self.timeout
+                ).json()
+                access_token = auth_response.get('access_token')
+                if access_token is None:
+                    raise ValueError('Token request returned no access token (invalid client credentials?)')
+                self._access_token = access_token
+                self._access_token_expires_at = access_token_expires_at(auth_response)
+            return self._access_token
+
+    def refresh_token(self):
+        with self._token_lock:
+            self._access_token = None
+        self._get_access_token()
+
+    @property
+    def headers(self):
+        return {'Authorization': 'Bearer {}'.format(self._get_access_token()), **self._headers}
+
+    @headers.setter
+    def headers(self, header_dict):
+        self._headers = header_dict
+
+    @exponential_retry
+    def execute(self, query, variables=None, files=None, timeout=DEFAULT_HTTP_REQUEST_TIMEOUT):
+        payload = OrderedDict({
+            'query': query,
+            'variables': variables or {}
+        })
+        if files is not None and files.containsFiles:
+            data = {
+                'operations': json_dumps(payload),
+                'map': json_dumps(files.map)
+            }
+            response = self.session.post(self.uri, data=data, files=files.list, headers=self.headers, timeout=timeout)
+        else:
+            response = self.session.post(self.uri, data=json_dumps(payload), headers=self.headers, timeout=timeout)
+        self._transfer_sizes.sizes = _transfer_sizes(response)
+        response.raise_for_status()
+        result = response.json()
+        if 'errors' in result:
+            return result.get('errors')
+        return result.get('data')
+
+# Internal function for measuring the request and response bodies of a
+# requests response as they went over the wire
+def _transfer_sizes(response):
+    request_body = response.request.body
+    if request_body is None:
+        num_bytes_out = 0
+    elif isinstance(request_body, str):
+        num_bytes_out = len(request_body.encode('utf-8'))
+    else:
+        num_bytes_out = len(request_body)
+    content_length = response.headers.get('Content-Length')
+    if content_length is not None:
+        num_bytes_in = int(content_length)
+    else:
+        num_bytes_in = len(response.content)
+    return num_bytes_out, num_bytes_in
@@ -0,0 +1,381 @@
+import database_connection_honeycomb
+import urllib.parse
+import datetime
+import argparse
+import json
+import os
+import logging
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset
+    import pyarrow.parquet
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+def export_data(
+    connection,
+    directory,
+    start_time=None,
+    end_time=None,
+    object_ids=None,
+    file_format='parquet',
+    row_group_size=100000
+):
+    """
+    Export data for a given timespan and set of object IDs to Parquet or Arrow IPC files.
+
+    Arguments and rows are the same as for
+    DatabaseConnectionHoneycomb.fetch_data_object_time_series(), but rows are
+    streamed page by page into files partitioned by object ID and day (see
+    PartitionedWriter), so memory use is bounded by the row group size rather
+    than by the size of the export. Read the export back with read_export().
+
+    Requires pyarrow.
+
+    Parameters:
+        connection (DatabaseConnectionHoneycomb): Connection to an object time series database
+        directory (string): Directory to write the files to (created if it does not exist)
+        start_time (datetime or string): Beginning of timespan (default: None)
+        end_time (datetime or string): End of timespan (default: None)
+        object_ids (list of strings): Object IDs (default: None)
+        file_format (string): File format, 'parquet' or 'arrow' (Arrow IPC) (default is 'parquet')
+        row_group_size (int): Maximum number of rows in each row group (and held in memory at once) (default is 100000)
+
+    Returns:
+        (int): Number of rows exported
+    """
+    writer = PartitionedWriter(
+        directory=directory,
+        file_format=file_format,
+        row_group_size=row_group_size
+    )
+    try:
+        connection.fetch_data_to_sink(
+            writer.write,
+            start_time,
+            end_time,
+            object_ids
+        )
+    finally:
+        writer.close()
+    logger.info('Exported {} rows to {} files in {}'.format(
+        writer.num_rows,
+        writer.num_files,
+        directory
+    ))
+    return writer.num_rows
+
+def read_export(directory):
+    """
+    Open the files written by export_data() (or a PartitionedWriter) as a dataset.
+
+    The dataset has the final schema of the export, so columns which first
+    appeared partway through the export are null in earlier files.
+
+    Requires pyarrow.
+
+    Parameters:
+        directory (string): Directory the files were written to
+
+    Returns:
+        (pyarrow.dataset.Dataset): Dataset of exported rows (with object_id and date partition fields)
+    """
+    if pa is None:
+        raise ImportError('pyarrow must be installed to read exported data')
+    schema = pyarrow.parquet.read_schema(os.path.join(directory, SCHEMA_FILE_NAME))
+    file_format = schema.metadata[b'file_format'].decode()
+    return pyarrow.dataset.dataset(
+        directory,
+        schema=schema.remove_metadata().append(pa.field('date', pa.string())),
+        format=DATASET_FORMATS[file_format],
+        partitioning='hive'
+    )
+
+class PartitionedWriter:
+    """
+    Class to define a writer of data rows to Parquet or Arrow IPC files
+    partitioned by object ID and day (UTC).
+
+    Files are written to object_id=<object ID>/date=<YYYY-MM-DD>/part-<n>.parquet
+    (or .arrow) under the directory (Hive-style partitioning, with object IDs
+    URI-encoded). Rows are buffered for each partition and written as a row
+    group once the rows buffered across all partitions reach the row group
+    size (the largest buffer first). Rows are expected in roughly timestamp
+    order: once a row arrives for a day, the files for days more than one day
+    earlier are completed.
+
+    The schema is inferred from the rows written so far and evolves as new keys
+    appear (and as integer columns turn out to hold floats; columns with any
+    other mix of types are written as strings from then on, with lists and
+    dicts written as JSON). When the schema changes, later rows for a partition
+    go to a new file. The final schema is written to the _common_metadata file
+    when the writer is closed.
+
+    Use as a context manager (or call close()) to make sure that all rows are
+    written.
+    """
+
+    def __init__(
+        self,
+        directory,
+        file_format='parquet',
+        row_group_size=100000
+    ):
+        """
+        Constructor for PartitionedWriter.
+
+        Parameters:
+            directory (string): Directory to write the files to (created if it does not exist)
+            file_format (string): File format, 'parquet' or 'arrow' (Arrow IPC) (default is 'parquet')
+            row_group_size (int): Maximum number of rows in each row group (and held in memory at once) (default is 100000)
+        """
+        if pa is None:
+            raise ImportError('pyarrow must be installed to export data')
+        if file_format not in FILE_EXTENSIONS.keys():
+            raise ValueError('File format must be one of {}'.format(sorted(FILE_EXTENSIONS.keys())))
+        if row_group_size < 1:
+            raise ValueError('Row group size must be at least one row')
+        self.directory = directory
+        self.file_format = file_format
+        self.row_group_size = row_group_size
+        self.schema = pa.schema([])
+        self.num_rows = 0
+        self.num_files = 0
+        self._buffers = dict()
+        self._num_buffered_rows = 0
+        self._writers = dict()
+        self._num_partition_files = dict()
+        self._latest_date = None
+        os.makedirs(directory, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, rows):
+        """
+        Write a list of rows.
+
+        Each row must contain a 'timestamp' element (a timezone-aware datetime)
+        and an 'object_id' element, as returned by
+        DatabaseConnectionHoneycomb.fetch_data_object_time_series().
+
+        Parameters:
+            rows (list of dict): Rows to be written
+        """
+        for row in rows:
+            date = row['timestamp'].astimezone(datetime.timezone.utc).date()
+            partition = (row.get('object_id'), date)
+            if partition not in self._buffers.keys():
+                self._buffers[partition] = []
+            self._buffers[partition].append(row)
+            if self._latest_date is None or date > self._latest_date:
+                self._latest_date = date
+        self._num_buffered_rows += len(rows)
+        self.num_rows += len(rows)
+        completed_before = self._latest_date - datetime.timedelta(days=1) if self._latest_date is not None else None
+        for partition in set(self._buffers.keys()) | set(self._writers.keys()):
+            if partition[1] < completed_before:
+                self._complete_partition(partition)
+        while self._num_buffered_rows >= self.row_group_size:
+            largest_partition = max(self._buffers.keys(), key=lambda partition: len(self._buffers[partition]))
+            self._flush_partition(largest_partition)
+
+    def close(self):
+        """
+        Write all buffered rows, complete all files, and write the final schema.
+        """
+        for partition in set(self._buffers.keys()) | set(self._writers.keys()):
+            self._complete_partition(partition)
+        schema = self.schema.with_metadata({'file_format': self.file_format})
+        pyarrow.parquet.write_metadata(schema, os.path.join(self.directory, SCHEMA_FILE_NAME))
+
+    def _complete_partition(self, partition):
+        if partition in self._buffers.keys():
+            self._flush_partition(partition)
+        writer, schema = self._writers.pop(partition, (None, None))
+        if writer is not None:
+            writer.close()
+
+    # Internal method for writing the buffered rows of a partition as one row
+    # group (starting a new file if the schema has changed since the
+    # partition's current file was started)
+    def _flush_partition(self, partition):
+        rows = self._buffers.pop(partition)
+        self._num_buffered_rows -= len(rows)
+        table = self._table(rows)
+        writer, schema = self._writers.get(partition, (None, None))
+        if writer is not None and schema != self.schema:
+            writer.close()
+            writer = None
+        if writer is None:
+            writer = self._open_writer(partition)
+            self._writers[partition] = (writer, self.schema)
+        if self.file_format == 'parquet':
+            writer.write_table(table, row_group_size=self.row_group_size)
+        else:
+            writer.write_table(table, max_chunksize=self.row_group_size)
+
+    def _open_writer(self, partition):
+        object_id, date = partition
+        partition_directory = os.path.join(
+            self.directory,
+            'object_id={}'.format(urllib.parse.quote(object_id, safe='') if object_id is not None else NULL_PARTITION_NAME),
+            'date={}'.format(date.isoformat())
+        )
+        os.makedirs(partition_directory, exist_ok=True)
+        file_index = self._num_partition_files.get(partition, 0)
+        self._num_partition_files[partition] = file_index + 1
+        path = os.path.join(
+            partition_directory,
+            'part-{}.{}'.format(file_index, FILE_EXTENSIONS[self.file_format])
+        )
+        self.num_files += 1
+        if self.file_format == 'parquet':
+            return pyarrow.parquet.ParquetWriter(path, self.schema)
+        return pa.ipc.new_file(path, self.schema)
+
+    # Internal method for converting a list of rows to a table with the
+    # current schema (after evolving the schema to cover the rows)
+    def _table(self, rows):
+        keys = dict.fromkeys(self.schema.names)
+        for row in rows:
+            keys.update(dict.fromkeys(row.keys()))
+        fields = []
+        for key in keys.keys():
+            values = [row.get(key) for row in rows]
+            field_index = self.schema.get_field_index(key)
+            established_type = self.schema.field(field_index).type if field_index >= 0 else None
+            fields.append(pa.field(key, _merged_type(established_type, _value_type(key, values))))
+        self.schema = pa.schema(fields)
+        arrays = []
+        for field in self.schema:
+            values = [row.get(field.name) for row in rows]
+            if pa.types.is_string(field.type):
+                values = [_string_value(value) for value in values]
+            arrays.append(pa.array(values, type=field.type))
+        return pa.Table.from_arrays(arrays, schema=self.schema)
+
+# Internal function for inferring the Arrow type of the values of a key in a
+# batch of rows
+def _value_type(
+    key,
+    values
+):
+    if key == 'timestamp':
+        return TIMESTAMP_TYPE
+    value_types = set()
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            value_types.add(bool)
+        elif isinstance(value, int) and INT64_MIN <= value <= INT64_MAX:
+            value_types.add(int)
+        elif isinstance(value, float):
+            value_types.add(float)
+        elif isinstance(value, str):
+            value_types.add(str)
+        else:
+            value_types.add(object)
+    if len(value_types) == 0:
+        return pa.null()
+    if value_types == {bool}:
+        return pa.bool_()
+    if value_types == {int}:
+        return pa.int64()
+    if value_types <= {int, float}:
+        return pa.float64()
+    return pa.string()
+
+# Internal function for combining the type of a column so far with the type of
+# its values in a new batch of rows
+def _merged_type(
+    established_type,
+    value_type
+):
+    if established_type is None or pa.types.is_null(established_type):
+        return value_type
+    if pa.types.is_null(value_type) or value_type == established_type:
+        return established_type
+    if {established_type, value_type} == {pa.int64(), pa.float64()}:
+        return pa.float64()
+    return pa.string()
+
+def _string_value(value):
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, default=str)
+
+def main():
+    """
+    Export data from a Honeycomb environment to Parquet or Arrow IPC files.
+
+    Honeycomb access parameters are read from the usual environment variables
+    (HONEYCOMB_URI, HONEYCOMB_TOKEN_URI, HONEYCOMB_AUDIENCE,
+    HONEYCOMB_CLIENT_ID, HONEYCOMB_CLIENT_SECRET).
+    """
+    parser = argparse.ArgumentParser(description='Export data from a Honeycomb environment to Parquet or Arrow IPC files partitioned by object ID and day')
+    parser.add_argument('directory', help='Directory to write the files to')
+    parser.add_argument('--environment', required=True, help='Name of the Honeycomb environment')
+    parser.add_argument('--object-type', default='DEVICE', help='Honeycomb object type (default is DEVICE)')
+    parser.add_argument('--object-id-field', default='part_number', help='Honeycomb field name that holds the object ID (default is part_number)')
+    parser.add_argument('--start', help='Beginning of timespan (ISO 8601)')
+    parser.add_argument('--end', help='End of timespan (ISO 8601)')
+    parser.add_argument('--object-ids', nargs='+', help='Object IDs (default is all objects)')
+    parser.add_argument('--format', choices=sorted(FILE_EXTENSIONS.keys()), default='parquet', help='File format (default is parquet)')
+    parser.add_argument('--row-group-size', type=int, default=100000, help='Maximum number of rows in each row group (default is 100000)')
+    parser.add_argument('--read-chunk-size', type=int, default=1000, help='Number of datapoints to read in each request (default is 1000)')
+    parser.add_argument('--lean-fetch', action='store_true', help='Resolve datapoint sources locally instead of fetching them')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    connection = database_connection_honeycomb.DatabaseConnectionHoneycomb(
+        time_series_database=True,
+        object_database=True,
+        environment_name_honeycomb=args.environment,
+        object_type_honeycomb=args.object_type,
+        object_id_field_name_honeycomb=args.object_id_field,
+        read_chunk_size=args.read_chunk_size,
+        read_lean_fetch=args.lean_fetch
+    )
+    try:
+        num_rows = export_data(
+            connection,
+            args.directory,
+            start_time=args.start,
+            end_time=args.end,
+            object_ids=args.object_ids,
+            file_format=args.format,
+            row_group_size=args.row_group_size
+        )
+    finally:
+        connection.close()
+    print('Exported {} rows to {}'.format(num_rows, args.directory))
+
+FILE_EXTENSIONS = {
+    'parquet': 'parquet',
+    'arrow': 'arrow'
+}
+
+DATASET_FORMATS = {
+    'parquet': 'parquet',
+    'arrow': 'ipc'
+}
+
+SCHEMA_FILE_NAME = '_common_metadata'
+
+# Partition name for rows with no object ID (as used by Hive)
+NULL_PARTITION_NAME = '__HIVE_DEFAULT_PARTITION__'
+
+TIMESTAMP_TYPE = pa.timestamp('us', tz='UTC') if pa is not None else None
+
+INT64_MIN = -2**63
+INT64_MAX = 2**63 - 1
+
+if __name__ == '__main__':
+    main()
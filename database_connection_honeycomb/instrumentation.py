@@ -0,0 +1,204 @@
+import minimal_honeycomb
+import math
+import time
+import bisect
+import threading
+
+HISTOGRAM_BUCKET_BOUNDS = [
+    0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0,
+    10.0, 25.0, 50.0,
+    100.0, math.inf
+]
+
+class Instrumentation:
+    """
+    Class to define a thread-safe recorder of counters and latency histograms.
+
+    A connection with instrumentation enabled calls count() for counters (e.g.,
+    requests, bytes, pages, rows, datapoints written) and observe() for
+    latencies in seconds (e.g., request, parse, and assignment lookup times).
+    Totals are available from stats(). If a callback is specified, it is also
+    called with the kind ('count' or 'observe'), name, and value of every event
+    (e.g., to feed an external metrics system).
+
+    Any object with count() and observe() methods can be used in place of this
+    class.
+    """
+
+    def __init__(
+        self,
+        callback=None
+    ):
+        """
+        Constructor for Instrumentation.
+
+        Parameters:
+            callback (function): Function called with the kind, name, and value of every event (default is None)
+        """
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._counters = dict()
+        self._histograms = dict()
+
+    def count(
+        self,
+        name,
+        value=1
+    ):
+        """
+        Add a value to a counter.
+
+        Parameters:
+            name (string): Counter name
+            value (int): Amount to add (default is 1)
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+        if self.callback is not None:
+            self.callback('count', name, value)
+
+    def observe(
+        self,
+        name,
+        value
+    ):
+        """
+        Add a latency (in seconds) to a histogram.
+
+        Parameters:
+            name (string): Histogram name
+            value (float): Latency in seconds
+        """
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = {
+                    'count': 0,
+                    'sum': 0.0,
+                    'min': value,
+                    'max': value,
+                    'bucket_counts': [0] * len(HISTOGRAM_BUCKET_BOUNDS)
+                }
+                self._histograms[name] = histogram
+            histogram['count'] += 1
+            histogram['sum'] += value
+            histogram['min'] = min(histogram['min'], value)
+            histogram['max'] = max(histogram['max'], value)
+            histogram['bucket_counts'][bisect.bisect_left(HISTOGRAM_BUCKET_BOUNDS, value)] += 1
+        if self.callback is not None:
+            self.callback('observe', name, value)
+
+    def stats(self):
+        """
+        Return a snapshot of all counters and histograms.
+
+        Each histogram is summarized by its count, sum, min, max, and mean and
+        by its bucket counts (a map from each bucket's upper bound in seconds to
+        the number of values in that bucket).
+
+        Returns:
+            (dict): Dict with 'counters' (map from name to total) and 'histograms' (map from name to summary)
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = dict()
+            for name, histogram in self._histograms.items():
+                histograms[name] = {
+                    'count': histogram['count'],
+                    'sum': histogram['sum'],
+                    'min': histogram['min'],
+                    'max': histogram['max'],
+                    'mean': histogram['sum'] / histogram['count'],
+                    'buckets': {
+                        bound: bucket_count
+                        for bound, bucket_count in zip(HISTOGRAM_BUCKET_BOUNDS, histogram['bucket_counts'])
+                        if bucket_count > 0
+                    }
+                }
+        return {
+            'counters': counters,
+            'histograms': histograms
+        }
+
+    def reset(self):
+        """
+        Clear all counters and histograms.
+        """
+        with self._lock:
+            self._counters = dict()
+            self._histograms = dict()
+
+class InstrumentedHoneycombClient(minimal_honeycomb.MinimalHoneycombClient):
+    """
+    Class to define a wrapper around a MinimalHoneycombClient which records the
+    number, latency, and size of the requests it sends.
+
+    The wrapped client is not modified, so a shared (pooled) client can be
+    wrapped separately for each connection.
+    """
+
+    def __init__(
+        self,
+        honeycomb_client,
+        instrumentation
+    ):
+        """
+        Constructor for InstrumentedHoneycombClient.
+
+        Parameters:
+            honeycomb_client (MinimalHoneycombClient): Client to wrap
+            instrumentation (Instrumentation): Recorder for request statistics
+        """
+        self.honeycomb_client = honeycomb_client
+        self.client = InstrumentedGraphQLClient(
+            client=honeycomb_client.client,
+            instrumentation=instrumentation
+        )
+
+class InstrumentedGraphQLClient:
+    """
+    Class to define a wrapper around a GraphQL client which records the
+    number, latency, and size of the requests it executes.
+
+    Sizes are only recorded if the wrapped client reports the sizes of the
+    request and response bodies it transferred (see
+    SessionClient.last_transfer_sizes()), so requests and responses are never
+    encoded again just to be measured.
+    """
+
+    def __init__(
+        self,
+        client,
+        instrumentation
+    ):
+        self.client = client
+        self.instrumentation = instrumentation
+
+    def execute(
+        self,
+        query,
+        variables=None,
+        files=None
+    ):
+        operation_name = query.split('(', 1)[0].split('{', 1)[0].split()[-1]
+        start = time.perf_counter()
+        try:
+            result = self.client.execute(query, variables, files)
+        except Exception:
+            self.instrumentation.count('request_errors')
+            self.instrumentation.count('request_errors.{}'.format(operation_name))
+            raise
+        finally:
+            self.instrumentation.observe('request_seconds.{}'.format(operation_name), time.perf_counter() - start)
+        self.instrumentation.count('requests')
+        self.instrumentation.count('requests.{}'.format(operation_name))
+        last_transfer_sizes = getattr(self.client, 'last_transfer_sizes', None)
+        if last_transfer_sizes is not None:
+            num_bytes_out, num_bytes_in = last_transfer_sizes()
+            self.instrumentation.count('bytes_out', num_bytes_out)
+            self.instrumentation.count('bytes_in', num_bytes_in)
+        return result
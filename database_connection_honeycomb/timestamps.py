@@ -0,0 +1,174 @@
+import dateutil.parser
+import functools
+import datetime
+import re
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+HONEYCOMB_TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+UNIX_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+ONE_MICROSECOND = datetime.timedelta(microseconds=1)
+
+# ISO 8601 timestamps in UTC (or with no time zone, which is taken to be UTC),
+# which are parsed without dateutil. Honeycomb returns timestamps in this form.
+UTC_TIMESTAMP_PATTERN = re.compile(r'(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,6}))?(Z?)\Z', re.ASCII)
+
+# Minimum number of timestamps for which batch parsing goes through NumPy
+NUMPY_BATCH_MIN_SIZE = 32
+
+# Earliest timestamp which is formatted through NumPy (see _format_timestamps_numpy())
+NUMPY_FORMAT_MIN_TIMESTAMP = np.datetime64('1000-01-01T00:00:00', 'us') if np is not None else None
+
+def python_datetime_utc(timestamp):
+    """
+    Convert a timestamp to a timezone-aware (UTC) Python datetime.
+
+    Returns exactly what DatabaseConnection._python_datetime_utc() returns, but
+    strings in UTC ISO 8601 form are parsed without dateutil and recently
+    parsed strings (e.g., assignment start and end times) are memoized.
+
+    Parameters:
+        timestamp (datetime or string): Timestamp (timezone-naive timestamps are assumed to be UTC)
+
+    Returns:
+        (datetime): Timezone-aware datetime in UTC
+    """
+    if isinstance(timestamp, str):
+        return _parse_timestamp_string(timestamp)
+    try:
+        if timestamp.tzinfo is None:
+            return timestamp.replace(tzinfo=datetime.timezone.utc)
+        return timestamp.astimezone(tz=datetime.timezone.utc)
+    except:
+        return _parse_timestamp_dateutil(timestamp)
+
+def python_datetimes_utc(timestamps):
+    """
+    Convert a sequence of timestamps to timezone-aware (UTC) Python datetimes.
+
+    Equivalent to calling python_datetime_utc() on each timestamp. Large
+    batches of Honeycomb-format strings are parsed in one call through NumPy
+    (if installed).
+
+    Parameters:
+        timestamps (sequence of datetime or string): Timestamps
+
+    Returns:
+        (list of datetime): Timezone-aware datetimes in UTC
+    """
+    if np is not None and len(timestamps) >= NUMPY_BATCH_MIN_SIZE:
+        datetimes = _parse_timestamp_strings_numpy(timestamps)
+        if datetimes is not None:
+            return datetimes
+    return [python_datetime_utc(timestamp) for timestamp in timestamps]
+
+def datetime_honeycomb_string(timestamp):
+    """
+    Convert a timestamp to a string in Honeycomb format (%Y-%m-%dT%H:%M:%S.%fZ).
+
+    Returns exactly what strftime() returns, but without its overhead.
+
+    Parameters:
+        timestamp (datetime or string): Timestamp (timezone-naive timestamps are assumed to be UTC)
+
+    Returns:
+        (string): Timestamp in Honeycomb format
+    """
+    datetime_utc = python_datetime_utc(timestamp)
+    # strftime() does not pad years before 1000 on every platform
+    if datetime_utc.year < 1000:
+        return datetime_utc.strftime(HONEYCOMB_TIMESTAMP_FORMAT)
+    return '{:04d}-{:02d}-{:02d}T{:02d}:{:02d}:{:02d}.{:06d}Z'.format(
+        datetime_utc.year,
+        datetime_utc.month,
+        datetime_utc.day,
+        datetime_utc.hour,
+        datetime_utc.minute,
+        datetime_utc.second,
+        datetime_utc.microsecond
+    )
+
+def datetime_honeycomb_strings(timestamps):
+    """
+    Convert a sequence of timestamps to strings in Honeycomb format.
+
+    Equivalent to calling datetime_honeycomb_string() on each timestamp. Large
+    batches are parsed with python_datetimes_utc() and formatted in one call
+    through NumPy (if installed).
+
+    Parameters:
+        timestamps (sequence of datetime or string): Timestamps
+
+    Returns:
+        (list of string): Timestamps in Honeycomb format
+    """
+    if np is not None and len(timestamps) >= NUMPY_BATCH_MIN_SIZE:
+        timestamp_strings = _format_timestamps_numpy(python_datetimes_utc(timestamps))
+        if timestamp_strings is not None:
+            return timestamp_strings
+    return [datetime_honeycomb_string(timestamp) for timestamp in timestamps]
+
+@functools.lru_cache(maxsize=1024)
+def _parse_timestamp_string(timestamp):
+    match = UTC_TIMESTAMP_PATTERN.match(timestamp)
+    if match is None:
+        return _parse_timestamp_dateutil(timestamp)
+    year, month, day, hour, minute, second, fraction, zone = match.groups()
+    try:
+        return datetime.datetime(
+            int(year),
+            int(month),
+            int(day),
+            int(hour),
+            int(minute),
+            int(second),
+            int(fraction.ljust(6, '0')) if fraction is not None else 0,
+            tzinfo=datetime.timezone.utc
+        )
+    except ValueError:
+        # Out-of-range fields: leave the error (or any leniency) to dateutil
+        return _parse_timestamp_dateutil(timestamp)
+
+def _parse_timestamp_dateutil(timestamp):
+    datetime_parsed = dateutil.parser.parse(timestamp)
+    if datetime_parsed.tzinfo is None:
+        return datetime_parsed.replace(tzinfo=datetime.timezone.utc)
+    return datetime_parsed.astimezone(tz=datetime.timezone.utc)
+
+# Internal function for parsing a batch of UTC ISO 8601 strings with NumPy.
+# Returns None (so that the caller falls back to parsing each timestamp) if
+# any timestamp is not a string matching UTC_TIMESTAMP_PATTERN or has fields
+# out of range.
+def _parse_timestamp_strings_numpy(timestamps):
+    timestamp_strings = []
+    for timestamp in timestamps:
+        if not isinstance(timestamp, str):
+            return None
+        match = UTC_TIMESTAMP_PATTERN.match(timestamp)
+        # NumPy accepts year 0, which Python datetimes do not
+        if match is None or match.group(1) == '0000':
+            return None
+        timestamp_strings.append(timestamp[:-1] if match.group(8) else timestamp)
+    try:
+        timestamp_array = np.array(timestamp_strings, dtype='datetime64[us]')
+    except ValueError:
+        return None
+    return [naive_datetime.replace(tzinfo=datetime.timezone.utc) for naive_datetime in timestamp_array.tolist()]
+
+# Internal function for formatting a batch of timezone-aware (UTC) datetimes in
+# Honeycomb format with NumPy. Returns None (so that the caller falls back to
+# formatting each timestamp) if any year is before 1000, which strftime() does
+# not pad.
+def _format_timestamps_numpy(datetimes):
+    timestamp_array = np.array(
+        [(datetime_utc - UNIX_EPOCH) // ONE_MICROSECOND for datetime_utc in datetimes],
+        dtype='int64'
+    ).view('datetime64[us]')
+    if timestamp_array.min() < NUMPY_FORMAT_MIN_TIMESTAMP:
+        return None
+    return np.datetime_as_string(timestamp_array, unit='us', timezone='UTC').tolist()
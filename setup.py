@@ -10,6 +10,19 @@ BASE_DEPENDENCIES = [
     'python-dateutil>=2.8.0'
 ]
 
+EXTRA_DEPENDENCIES = {
+    'dataframe': [
+        'numpy>=1.17',
+        'pandas>=1.0'
+    ],
+    'async': [
+        'aiohttp>=3.7'
+    ],
+    'export': [
+        'pyarrow>=1.0'
+    ]
+}
+
 # allow setup.py to be run from any path
 os.chdir(os.path.normpath(BASEDIR))
 
@@ -24,6 +37,12 @@ setup(
     author='Theodore Quinn',
     author_email='ted.quinn@wildflowerschools.org',
     install_requires=BASE_DEPENDENCIES,
+    extras_require=EXTRA_DEPENDENCIES,
+    entry_points={
+        'console_scripts': [
+            'honeycomb-export=database_connection_honeycomb.export:main'
+        ]
+    },
     keywords=['database'],
     classifiers=[
         'Intended Audience :: Developers',
@@ -0,0 +1,37 @@
+import os
+import sys
+
+# The fake Honeycomb server lives with the benchmarks
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+from fake_honeycomb import FakeHoneycombServer
+import datetime
+import pytest
+
+START = datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+
+@pytest.fixture
+def server():
+    with FakeHoneycombServer() as fake_honeycomb:
+        fake_honeycomb.add_devices(3)
+        yield fake_honeycomb
+
+@pytest.fixture
+def other_server():
+    with FakeHoneycombServer() as fake_honeycomb:
+        fake_honeycomb.add_devices(3)
+        yield fake_honeycomb
+
+def generate_datapoints(
+    num_datapoints,
+    object_ids,
+    spacing=datetime.timedelta(seconds=1)
+):
+    return [
+        {
+            'timestamp': START + datapoint_index * spacing,
+            'object_id': object_ids[datapoint_index % len(object_ids)],
+            'value': datapoint_index
+        }
+        for datapoint_index in range(num_datapoints)
+    ]
@@ -0,0 +1,103 @@
+import pytest
+
+pytest.importorskip('numpy')
+
+from database_connection_honeycomb import DatabaseConnectionHoneycomb
+from conftest import START, generate_datapoints
+import datetime
+import itertools
+
+END = START + datetime.timedelta(minutes=10)
+
+OBJECT_IDS = ['device_0', 'device_1', 'device_2']
+
+AGGREGATIONS = ['count', 'sum', 'mean', 'min', 'max', 'last']
+
+WINDOW = datetime.timedelta(seconds=20)
+
+def irregular_datapoints():
+    datapoints = generate_datapoints(90, OBJECT_IDS)
+    for datapoint in datapoints:
+        value = datapoint['value']
+        # 'reading' is only numeric in some rows, and absent after the first
+        # 40 seconds (so later windows have no readings at all)
+        if value >= 40:
+            continue
+        if value % 7 == 0:
+            datapoint['reading'] = 'offline'
+        elif value % 5 == 0:
+            datapoint['reading'] = True
+        elif value % 2 == 0:
+            datapoint['reading'] = value / 4
+        else:
+            datapoint['reading'] = -value
+    return datapoints
+
+def is_number(value):
+    return type(value) is int or type(value) is float
+
+def expected_aggregates(rows, fields):
+    def window_start(timestamp):
+        return START + ((timestamp - START) // WINDOW) * WINDOW
+    def group_key(row):
+        return (window_start(row['timestamp']), row['object_id'])
+    aggregates = []
+    for (timestamp, object_id), group_rows in itertools.groupby(sorted(rows, key=group_key), key=group_key):
+        group_rows = sorted(group_rows, key=lambda row: row['timestamp'])
+        aggregate = {'timestamp': timestamp, 'object_id': object_id}
+        for field in fields:
+            values = [row.get(field) for row in group_rows if is_number(row.get(field))]
+            aggregate[field + '_count'] = len(values)
+            aggregate[field + '_sum'] = sum(values) if values else None
+            aggregate[field + '_mean'] = sum(values) / len(values) if values else None
+            aggregate[field + '_min'] = min(values) if values else None
+            aggregate[field + '_max'] = max(values) if values else None
+            aggregate[field + '_last'] = values[-1] if values else None
+        aggregates.append(aggregate)
+    return aggregates
+
+@pytest.mark.parametrize('read_chunk_size', [4, 1000])
+def test_aggregates_match_python_groupby(server, read_chunk_size):
+    connection = DatabaseConnectionHoneycomb(read_chunk_size=read_chunk_size, **server.connection_arguments())
+    connection.write_data_object_time_series(irregular_datapoints())
+    rows = connection.fetch_data_object_time_series(START, END)
+    aggregates = connection.fetch_data_aggregates(
+        WINDOW,
+        ['value', 'reading'],
+        aggregations=AGGREGATIONS,
+        start_time=START,
+        end_time=END
+    )
+    expected = expected_aggregates(rows, ['value', 'reading'])
+    # Windows hold more rows than a page when the read chunk size is small
+    assert len(aggregates) == len(expected) == 15
+    # Values are integers and quarters, so the float sums are exact
+    assert aggregates == expected
+    assert aggregates[-1]['reading_count'] == 0
+    assert aggregates[-1]['reading_mean'] is None
+
+def test_aggregates_for_subset_of_objects(server):
+    connection = DatabaseConnectionHoneycomb(read_chunk_size=4, **server.connection_arguments())
+    connection.write_data_object_time_series(irregular_datapoints())
+    rows = connection.fetch_data_object_time_series(START, END, ['device_1'])
+    aggregates = connection.fetch_data_aggregates(
+        WINDOW.total_seconds(),
+        ['value'],
+        aggregations=['count', 'mean', 'last'],
+        start_time=START,
+        end_time=END,
+        object_ids=['device_1']
+    )
+    assert aggregates == [
+        {
+            key: value
+            for key, value in aggregate.items()
+            if key in ['timestamp', 'object_id', 'value_count', 'value_mean', 'value_last']
+        }
+        for aggregate in expected_aggregates(rows, ['value'])
+    ]
+
+def test_invalid_aggregation_raises(server):
+    connection = DatabaseConnectionHoneycomb(**server.connection_arguments())
+    with pytest.raises(ValueError):
+        connection.fetch_data_aggregates(WINDOW, ['value'], aggregations=['median'])
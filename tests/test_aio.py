@@ -0,0 +1,157 @@
+from database_connection_honeycomb import DatabaseConnectionHoneycomb
+from database_connection_honeycomb.aio import AsyncDatabaseConnectionHoneycomb
+from database_connection_honeycomb.buffered_writer import BufferedWriter
+from conftest import START, generate_datapoints
+import datetime
+import asyncio
+import pytest
+
+END = START + datetime.timedelta(minutes=10)
+
+def sync_connection(server, **kwargs):
+    return DatabaseConnectionHoneycomb(
+        **kwargs,
+        **server.connection_arguments()
+    )
+
+def async_connection(server, **kwargs):
+    return AsyncDatabaseConnectionHoneycomb(
+        **kwargs,
+        **server.connection_arguments()
+    )
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+async def write_and_fetch_async(server, datapoints, **kwargs):
+    async with async_connection(server, **kwargs) as connection:
+        data_ids = await connection.write_data_object_time_series(datapoints)
+        rows = await connection.fetch_data_object_time_series(START, END)
+    return data_ids, rows
+
+@pytest.mark.parametrize('connection_options', [
+    {},
+    {'write_chunk_size': 7, 'read_chunk_size': 11},
+    {'read_chunk_size': 11, 'read_shard_mode': 'time', 'read_shard_count': 3},
+    {'read_chunk_size': 11, 'read_shard_mode': 'assignments'},
+    {'read_lean_fetch': True},
+    {'read_chunk_size': 2, 'pack_interval': 10}
+])
+def test_write_and_fetch_match_sync(server, other_server, connection_options):
+    datapoints = generate_datapoints(100, ['device_0', 'device_1', 'device_2'])
+    sync_data_ids = sync_connection(server, **connection_options).write_data_object_time_series(datapoints)
+    sync_rows = sync_connection(server, **connection_options).fetch_data_object_time_series(START, END)
+    async_data_ids, async_rows = run(write_and_fetch_async(other_server, datapoints, **connection_options))
+    assert len(async_data_ids) == len(sync_data_ids)
+    assert len(set(async_data_ids)) == len(set(sync_data_ids))
+    assert async_rows == sync_rows
+    assert [row['value'] for row in async_rows] == list(range(100))
+
+def test_fetch_same_server_matches_sync(server):
+    datapoints = generate_datapoints(50, ['device_0', 'device_1'])
+    sync_connection(server).write_data_object_time_series(datapoints)
+    sync_rows = sync_connection(server).fetch_data_object_time_series(START, END, ['device_1'])
+    async def fetch():
+        async with async_connection(server, read_chunk_size=7) as connection:
+            return await connection.fetch_data_object_time_series(START, END, ['device_1'])
+    assert run(fetch()) == sync_rows
+    assert len(sync_rows) == 25
+
+def test_iter_data_matches_sync(server):
+    sync_connection(server).write_data_object_time_series(generate_datapoints(60, ['device_0', 'device_1', 'device_2']))
+    sync_rows = list(sync_connection(server, read_chunk_size=9).iter_data(START, END))
+    async def iterate():
+        async with async_connection(server, read_chunk_size=9) as connection:
+            return [row async for row in connection.iter_data(START, END)]
+    assert run(iterate()) == sync_rows
+    assert len(sync_rows) == 60
+
+def test_delete_matches_sync(server, other_server):
+    datapoints = generate_datapoints(90, ['device_0', 'device_1', 'device_2'])
+    delete_start = START + datetime.timedelta(seconds=20)
+    delete_end = START + datetime.timedelta(seconds=49)
+    sync_connection(server).write_data_object_time_series(datapoints)
+    sync_connection(server, delete_chunk_size=4).delete_data_object_time_series(
+        delete_start,
+        delete_end,
+        ['device_0', 'device_2']
+    )
+    sync_rows = sync_connection(server).fetch_data_object_time_series(START, END)
+    async def write_delete_fetch():
+        async with async_connection(other_server, delete_chunk_size=4) as connection:
+            await connection.write_data_object_time_series(datapoints)
+            await connection.delete_data_object_time_series(
+                delete_start,
+                delete_end,
+                ['device_0', 'device_2']
+            )
+            return await connection.fetch_data_object_time_series(START, END)
+    async_rows = run(write_delete_fetch())
+    assert async_rows == sync_rows
+    assert len(async_rows) == 90 - 20
+
+def test_environment_loaded_lazily(server):
+    async def load():
+        connection = async_connection(server)
+        try:
+            assert server.request_count == 0
+            with pytest.raises(ValueError):
+                connection.environment
+            rows = await connection.fetch_data_object_time_series(START, END)
+            assert server.request_count > 0
+            return rows, connection.environment
+        finally:
+            await connection.close()
+    rows, async_environment = run(load())
+    assert rows == []
+    assert async_environment == sync_connection(server).environment
+
+def test_write_datapoint_matches_sync(server):
+    async def write():
+        async with async_connection(server) as connection:
+            return await connection.write_datapoint_object_time_series(START, 'device_0', {'value': 1})
+    data_id = run(write())
+    rows = sync_connection(server).fetch_data_object_time_series(START, END)
+    assert isinstance(data_id, str)
+    assert rows == [{
+        'timestamp': START,
+        'environment_name': server.environment_name,
+        'object_id': 'device_0',
+        'value': 1
+    }]
+
+def test_buffered_writer_not_available(server):
+    connection = async_connection(server)
+    with pytest.raises(TypeError):
+        connection.buffered_writer()
+    with pytest.raises(TypeError):
+        BufferedWriter(connection)
+    run(connection.close())
+
+@pytest.mark.parametrize('connection_options', [
+    {'read_chunk_size': 4},
+    {'read_chunk_size': 4, 'read_shard_mode': 'assignments'},
+    {'read_chunk_size': 2, 'pack_interval': 10}
+])
+def test_fetch_to_sink_resumes_like_sync(server, tmp_path, connection_options):
+    datapoints = generate_datapoints(60, ['device_0', 'device_1', 'device_2'])
+    sync_connection(server, **connection_options).write_data_object_time_series(datapoints)
+    sync_rows = []
+    sync_connection(server, **connection_options).fetch_data_to_sink(sync_rows.extend, START, END)
+    checkpoint_path = str(tmp_path / 'checkpoint.json')
+    async def fetch_interrupted_and_resumed():
+        received_rows = []
+        async def failing_sink(rows):
+            if len(received_rows) >= 20:
+                raise RuntimeError('Interrupted')
+            received_rows.extend(rows)
+        async with async_connection(server, **connection_options) as connection:
+            with pytest.raises(RuntimeError):
+                await connection.fetch_data_to_sink(failing_sink, START, END, checkpoint_path=checkpoint_path, checkpoint_interval=2)
+            num_resumed_rows = await connection.fetch_data_to_sink(received_rows.extend, START, END, checkpoint_path=checkpoint_path, checkpoint_interval=2)
+            assert await connection.fetch_data_to_sink(received_rows.extend, START, END, checkpoint_path=checkpoint_path) == 0
+        return received_rows, num_resumed_rows
+    async_rows, num_resumed_rows = run(fetch_interrupted_and_resumed())
+    assert async_rows == sync_rows
+    assert 0 < num_resumed_rows < 60
+    assert [row['value'] for row in async_rows] == list(range(60))
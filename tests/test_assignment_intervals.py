@@ -0,0 +1,107 @@
+from database_connection_honeycomb import DatabaseConnectionHoneycomb, AssignmentIntervals
+from database_connection_honeycomb.timestamps import python_datetime_utc
+from conftest import START
+import datetime
+import random
+import pytest
+
+def hours_after_start(hours):
+    return START + datetime.timedelta(hours=hours)
+
+def honeycomb_string(timestamp):
+    return timestamp.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+def assignment(assignment_id, object_id, start_hours, end_hours, assigned_type='DEVICE'):
+    return {
+        'assignment_id': assignment_id,
+        'start': honeycomb_string(hours_after_start(start_hours)) if start_hours is not None else None,
+        'end': honeycomb_string(hours_after_start(end_hours)) if end_hours is not None else None,
+        'assigned_type': assigned_type,
+        'assigned': {'part_number': object_id}
+    }
+
+def linear_scan_lookup(assignments, timestamp, object_id):
+    # The lookup that the assignment index replaced
+    for assignment in assignments:
+        if assignment.get('assigned_type') != 'DEVICE':
+            continue
+        if assignment.get('assigned').get('part_number') != object_id:
+            continue
+        start = assignment.get('start')
+        if start is not None and timestamp < python_datetime_utc(start):
+            continue
+        end = assignment.get('end')
+        if end is not None and timestamp > python_datetime_utc(end):
+            continue
+        return assignment.get('assignment_id')
+    return None
+
+def indexed_lookup(assignments, timestamp, object_id):
+    connection = DatabaseConnectionHoneycomb.__new__(DatabaseConnectionHoneycomb)
+    connection.object_type_honeycomb = 'DEVICE'
+    connection.object_id_field_name_honeycomb = 'part_number'
+    assignment_index = connection._build_assignment_index(assignments)
+    return connection._lookup_assignment_id_in_index(assignment_index, timestamp, object_id)
+
+def probe_timestamps(assignments):
+    # Every boundary, and the instants just before and after it
+    timestamps = set([hours_after_start(-100), hours_after_start(100)])
+    for assignment in assignments:
+        for boundary in [assignment['start'], assignment['end']]:
+            if boundary is None:
+                continue
+            boundary = python_datetime_utc(boundary)
+            for offset in [-1, 0, 1]:
+                timestamps.add(boundary + datetime.timedelta(microseconds=offset))
+    return sorted(timestamps)
+
+def assert_lookups_match(assignments, object_ids):
+    for object_id in object_ids:
+        for timestamp in probe_timestamps(assignments):
+            assert indexed_lookup(assignments, timestamp, object_id) == linear_scan_lookup(assignments, timestamp, object_id), (object_id, timestamp)
+
+@pytest.mark.parametrize('assignments', [
+    # Consecutive, with the end of one equal to the start of the next (the
+    # earlier assignment in the environment wins at the shared boundary)
+    [assignment('a', 'device_0', 0, 1), assignment('b', 'device_0', 1, 2)],
+    [assignment('b', 'device_0', 1, 2), assignment('a', 'device_0', 0, 1)],
+    # Open-ended at either end
+    [assignment('a', 'device_0', None, 1), assignment('b', 'device_0', 3, None)],
+    [assignment('a', 'device_0', None, None)],
+    # Overlapping, in both environment orders
+    [assignment('a', 'device_0', 0, 5), assignment('b', 'device_0', 2, 3), assignment('c', 'device_0', 4, None)],
+    [assignment('c', 'device_0', 4, None), assignment('b', 'device_0', 2, 3), assignment('a', 'device_0', 0, 5)],
+    # Open start overlapping later intervals
+    [assignment('b', 'device_0', 2, 3), assignment('a', 'device_0', None, 2)],
+    # Identical intervals
+    [assignment('a', 'device_0', 0, 1), assignment('b', 'device_0', 0, 1)],
+    # Zero-length interval
+    [assignment('a', 'device_0', 1, 1), assignment('b', 'device_0', 0, 2)],
+    # Other objects and types are ignored
+    [assignment('a', 'device_1', 0, 1), assignment('b', 'device_0', 0, 1, assigned_type='PERSON')]
+])
+def test_lookup_matches_linear_scan(assignments):
+    assert_lookups_match(assignments, ['device_0', 'device_1', 'device_2'])
+
+@pytest.mark.parametrize('seed', range(20))
+def test_lookup_matches_linear_scan_for_random_environments(seed):
+    generator = random.Random(seed)
+    assignments = []
+    for assignment_index in range(30):
+        # Coarse boundaries so that many of them coincide
+        start_hours = generator.choice([None, generator.randint(0, 10)])
+        end_hours = generator.choice([None, generator.randint(0, 10)])
+        if start_hours is not None and end_hours is not None and end_hours < start_hours:
+            start_hours, end_hours = end_hours, start_hours
+        assignments.append(assignment(
+            'assignment_{}'.format(assignment_index),
+            generator.choice(['device_0', 'device_1']),
+            start_hours,
+            end_hours
+        ))
+    assert_lookups_match(assignments, ['device_0', 'device_1'])
+
+def test_lookup_without_intervals():
+    assignment_intervals = AssignmentIntervals()
+    assignment_intervals.finalize()
+    assert assignment_intervals.lookup(START) is None
@@ -0,0 +1,66 @@
+from database_connection_honeycomb import DatabaseConnectionHoneycomb
+from conftest import START
+import datetime
+import threading
+import time
+import pytest
+
+def test_appends_racing_close_are_written_or_rejected(server):
+    connection = DatabaseConnectionHoneycomb(**server.connection_arguments())
+    written_data_ids = []
+    writer = connection.buffered_writer(
+        max_count=10,
+        max_queue_size=20,
+        callback=written_data_ids.extend
+    )
+    accepted_counts = []
+    def append_until_closed(object_id):
+        accepted_count = 0
+        while True:
+            try:
+                writer.append(START + datetime.timedelta(seconds=accepted_count), object_id, {'value': accepted_count})
+            except ValueError:
+                break
+            accepted_count += 1
+        accepted_counts.append(accepted_count)
+    threads = [threading.Thread(target=append_until_closed, args=('device_{}'.format(thread_index),)) for thread_index in range(3)]
+    for thread in threads:
+        thread.start()
+    while len(server.datapoints) < 50:
+        time.sleep(0.01)
+    writer.close()
+    for thread in threads:
+        thread.join()
+    assert len(written_data_ids) == sum(accepted_counts)
+    assert len(server.datapoints) == sum(accepted_counts)
+
+def test_flush_after_close_is_rejected(server):
+    connection = DatabaseConnectionHoneycomb(**server.connection_arguments())
+    writer = connection.buffered_writer()
+    writer.append(START, 'device_0', {'value': 0})
+    writer.close()
+    with pytest.raises(ValueError):
+        writer.flush()
+    assert len(server.datapoints) == 1
+
+def test_callbacks_cannot_use_writer(server):
+    connection = DatabaseConnectionHoneycomb(**server.connection_arguments())
+    callback_exceptions = []
+    def appending_callback(data_ids):
+        for method, args in [(writer.append, (START, 'device_0', {'value': 'again'})), (writer.flush, ()), (writer.close, ())]:
+            try:
+                method(*args)
+            except ValueError as exception:
+                callback_exceptions.append(exception)
+    # With a queue of one datapoint, an append from the callback would wait for
+    # the background thread forever
+    writer = connection.buffered_writer(
+        max_count=1,
+        max_queue_size=1,
+        callback=appending_callback
+    )
+    for value in range(3):
+        writer.append(START + datetime.timedelta(seconds=value), 'device_0', {'value': value})
+    writer.close()
+    assert len(callback_exceptions) == 9
+    assert len(server.datapoints) == 3
@@ -0,0 +1,147 @@
+from database_connection_honeycomb import DatabaseConnectionHoneycomb, CACHE_SETTLE_MARGIN
+from database_connection_honeycomb.cache import MIN_TIMESTAMP, MAX_TIMESTAMP
+from conftest import START, generate_datapoints
+import datetime
+import pytest
+
+END = START + datetime.timedelta(minutes=10)
+
+OBJECT_IDS = ['device_0', 'device_1', 'device_2']
+
+def uncached_connection(server):
+    return DatabaseConnectionHoneycomb(**server.connection_arguments())
+
+@pytest.fixture
+def cached_connection(server, tmp_path):
+    connection = DatabaseConnectionHoneycomb(
+        cache_directory=str(tmp_path / 'cache'),
+        read_chunk_size=7,
+        **server.connection_arguments()
+    )
+    yield connection
+    connection.close()
+
+def assignment_id(connection, object_id):
+    for assignment in connection.environment.get('assignments'):
+        if assignment['assigned']['part_number'] == object_id:
+            return assignment['assignment_id']
+    raise ValueError('No assignment for {}'.format(object_id))
+
+def uncovered_ranges(connection, object_id, start=MIN_TIMESTAMP, end=MAX_TIMESTAMP):
+    return connection.cache.uncovered_ranges(
+        connection.environment_name_honeycomb,
+        assignment_id(connection, object_id),
+        start,
+        end
+    )
+
+def honeycomb_string(timestamp):
+    return timestamp.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+def seconds_after_start(seconds):
+    return START + datetime.timedelta(seconds=seconds)
+
+@pytest.mark.parametrize('connection_options', [
+    {},
+    {'read_shard_mode': 'time', 'read_shard_count': 3},
+    {'read_shard_mode': 'assignments'},
+    {'read_lean_fetch': True}
+])
+def test_cached_fetch_matches_uncached(server, tmp_path, connection_options):
+    uncached_connection(server).write_data_object_time_series(generate_datapoints(60, OBJECT_IDS))
+    expected_rows = uncached_connection(server).fetch_data_object_time_series(START, END, ['device_0', 'device_2'])
+    connection = DatabaseConnectionHoneycomb(
+        cache_directory=str(tmp_path / 'cache'),
+        read_chunk_size=7,
+        **connection_options,
+        **server.connection_arguments()
+    )
+    try:
+        assert connection.fetch_data_object_time_series(START, END, ['device_0', 'device_2']) == expected_rows
+        request_count = server.request_count
+        assert connection.fetch_data_object_time_series(START, END, ['device_0', 'device_2']) == expected_rows
+        assert server.request_count == request_count
+    finally:
+        connection.close()
+
+def test_partially_covered_range_fetches_only_the_gap(server, cached_connection):
+    uncached_connection(server).write_data_object_time_series(generate_datapoints(60, OBJECT_IDS))
+    cached_connection.fetch_data_object_time_series(seconds_after_start(10), seconds_after_start(29), OBJECT_IDS)
+    # Written behind the cache's back: only a refetch of the covered range
+    # would return these
+    uncached_connection(server).write_data_object_time_series([
+        {'timestamp': seconds_after_start(20.5), 'object_id': 'device_0', 'value': 'late'},
+        {'timestamp': seconds_after_start(40.5), 'object_id': 'device_0', 'value': 'new'}
+    ])
+    rows = cached_connection.fetch_data_object_time_series(seconds_after_start(0), seconds_after_start(49), OBJECT_IDS)
+    assert [row['value'] for row in rows] == list(range(0, 41)) + ['new'] + list(range(41, 50))
+    for object_id in OBJECT_IDS:
+        assert uncovered_ranges(
+            cached_connection,
+            object_id,
+            honeycomb_string(seconds_after_start(0)),
+            honeycomb_string(seconds_after_start(49))
+        ) == []
+
+def test_coverage_not_recorded_within_settle_margin(server, cached_connection):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    recent_start = now - 2 * CACHE_SETTLE_MARGIN
+    uncached_connection(server).write_data_object_time_series([
+        {'timestamp': recent_start, 'object_id': 'device_0', 'value': 'settled'},
+        {'timestamp': now - CACHE_SETTLE_MARGIN / 2, 'object_id': 'device_0', 'value': 'recent'}
+    ])
+    rows = cached_connection.fetch_data_object_time_series(recent_start, now, ['device_0'])
+    fetched_at = datetime.datetime.now(datetime.timezone.utc)
+    assert [row['value'] for row in rows] == ['settled', 'recent']
+    remaining_ranges = uncovered_ranges(cached_connection, 'device_0', honeycomb_string(recent_start), honeycomb_string(now))
+    assert len(remaining_ranges) == 1
+    assert honeycomb_string(now - CACHE_SETTLE_MARGIN) <= remaining_ranges[0][0] <= honeycomb_string(fetched_at - CACHE_SETTLE_MARGIN)
+    assert remaining_ranges[0][1] == honeycomb_string(now)
+    uncached_connection(server).write_data_object_time_series([
+        {'timestamp': now - CACHE_SETTLE_MARGIN / 4, 'object_id': 'device_0', 'value': 'late'}
+    ])
+    rows = cached_connection.fetch_data_object_time_series(recent_start, now, ['device_0'])
+    assert [row['value'] for row in rows] == ['settled', 'recent', 'late']
+
+def test_empty_range_is_covered(server, cached_connection):
+    cached_connection.fetch_data_object_time_series(START, END, ['device_0'])
+    request_count = server.request_count
+    assert cached_connection.fetch_data_object_time_series(START, END, ['device_0']) == []
+    assert server.request_count == request_count
+
+def test_delete_splits_coverage(server, cached_connection):
+    uncached_connection(server).write_data_object_time_series(generate_datapoints(60, OBJECT_IDS))
+    cached_connection.fetch_data_object_time_series(START, END, OBJECT_IDS)
+    cached_connection.delete_data_object_time_series(seconds_after_start(20), seconds_after_start(29), ['device_1'])
+    assert uncovered_ranges(cached_connection, 'device_1', honeycomb_string(START), honeycomb_string(END)) == [(
+        honeycomb_string(seconds_after_start(20) - datetime.timedelta(microseconds=1)),
+        honeycomb_string(seconds_after_start(29) + datetime.timedelta(microseconds=1))
+    )]
+    for object_id in ['device_0', 'device_2']:
+        assert uncovered_ranges(cached_connection, object_id, honeycomb_string(START), honeycomb_string(END)) == []
+    rows = cached_connection.fetch_data_object_time_series(START, END, OBJECT_IDS)
+    assert rows == uncached_connection(server).fetch_data_object_time_series(START, END, OBJECT_IDS)
+    assert [row['value'] for row in rows] == [value for value in range(60) if value % 3 != 1 or not 20 <= value <= 29]
+
+def test_least_recently_used_ranges_evicted(server, cached_connection):
+    uncached_connection(server).write_data_object_time_series(generate_datapoints(60, OBJECT_IDS))
+    cached_connection.fetch_data_object_time_series(START, END, ['device_0'])
+    range_bytes = cached_connection.cache.connection.execute('SELECT SUM(num_bytes) FROM coverage').fetchone()[0]
+    cached_connection.cache.max_bytes = int(range_bytes * 1.5)
+    cached_connection.fetch_data_object_time_series(START, END, ['device_1'])
+    assert uncovered_ranges(cached_connection, 'device_0', honeycomb_string(START), honeycomb_string(END)) == [
+        (honeycomb_string(START), honeycomb_string(END))
+    ]
+    assert uncovered_ranges(cached_connection, 'device_1', honeycomb_string(START), honeycomb_string(END)) == []
+    assert cached_connection.cache.connection.execute(
+        'SELECT COUNT(*) FROM datapoints WHERE assignment_id = ?',
+        (assignment_id(cached_connection, 'device_0'),)
+    ).fetchone()[0] == 0
+    # Reading a range refreshes its last access time
+    cached_connection.cache.max_bytes = int(range_bytes * 2.5)
+    cached_connection.fetch_data_object_time_series(START, END, ['device_2'])
+    cached_connection.fetch_data_object_time_series(START, END, ['device_1'])
+    cached_connection.cache.max_bytes = int(range_bytes * 1.5)
+    cached_connection.fetch_data_object_time_series(START, END, ['device_1'])
+    assert uncovered_ranges(cached_connection, 'device_2', honeycomb_string(START), honeycomb_string(END)) != []
+    assert uncovered_ranges(cached_connection, 'device_1', honeycomb_string(START), honeycomb_string(END)) == []
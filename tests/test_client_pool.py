@@ -0,0 +1,86 @@
+from database_connection_honeycomb import client_pool
+import time
+import pytest
+
+@pytest.fixture(autouse=True)
+def empty_client_pool():
+    client_pool.clear_client_pool()
+    yield
+    client_pool.clear_client_pool()
+
+def test_pool_hit_does_not_construct_client(server, monkeypatch):
+    arguments = {
+        'uri': server.uri,
+        'token_uri': server.token_uri,
+        'audience': 'test',
+        'client_id': 'test',
+        'client_secret': 'test'
+    }
+    constructed_clients = []
+    original_init = client_pool.PooledHoneycombClient.__init__
+    def counting_init(self, *args, **kwargs):
+        constructed_clients.append(self)
+        original_init(self, *args, **kwargs)
+    monkeypatch.setattr(client_pool.PooledHoneycombClient, '__init__', counting_init)
+    first_client = client_pool.get_pooled_client(**arguments)
+    second_client = client_pool.get_pooled_client(**arguments)
+    assert second_client is first_client
+    assert len(constructed_clients) == 1
+    with pytest.raises(ValueError):
+        client_pool.get_pooled_client(**{**arguments, 'client_secret': 'other'})
+    assert len(constructed_clients) == 1
+
+def test_pool_key_uses_environment_variables(server, monkeypatch):
+    monkeypatch.setenv('HONEYCOMB_URI', server.uri)
+    monkeypatch.setenv('HONEYCOMB_TOKEN_URI', server.token_uri)
+    monkeypatch.setenv('HONEYCOMB_AUDIENCE', 'test')
+    monkeypatch.setenv('HONEYCOMB_CLIENT_ID', 'test')
+    monkeypatch.setenv('HONEYCOMB_CLIENT_SECRET', 'test')
+    client = client_pool.get_pooled_client()
+    assert client_pool.get_pooled_client(uri=server.uri, client_id='test') is client
+
+def test_missing_access_parameters_raise(monkeypatch):
+    monkeypatch.delenv('HONEYCOMB_URI', raising=False)
+    with pytest.raises(ValueError):
+        client_pool.get_pooled_client(
+            token_uri='http://localhost/oauth/token',
+            audience='test',
+            client_id='test',
+            client_secret='test'
+        )
+
+@pytest.mark.parametrize('auth_response, expected_lifetime', [
+    ({'expires_in': 86400}, 86400 - 300),
+    ({'expires_in': 120}, 108),
+    ({}, client_pool.DEFAULT_ACCESS_TOKEN_LIFETIME - 300)
+])
+def test_access_token_expires_at(auth_response, expected_lifetime):
+    now = time.time()
+    expires_at = client_pool.access_token_expires_at(auth_response)
+    assert expires_at - now == pytest.approx(expected_lifetime, abs=1)
+
+def test_short_lived_token_is_reused(server):
+    session_client = client_pool.SessionClient(
+        uri=server.uri,
+        client_credentials={
+            'token_uri': server.token_uri,
+            'audience': 'test',
+            'client_id': 'test',
+            'client_secret': 'test'
+        }
+    )
+    token_requests = []
+    original_post = session_client.session.post
+    def post(url, *args, **kwargs):
+        response = original_post(url, *args, **kwargs)
+        if url == server.token_uri:
+            token_requests.append(url)
+            response.json = lambda: {'access_token': 'short', 'expires_in': 60}
+        return response
+    session_client.session.post = post
+    try:
+        assert session_client._get_access_token() == 'short'
+        assert session_client._get_access_token() == 'short'
+        assert len(token_requests) == 1
+    finally:
+        session_client.close()
@@ -0,0 +1,106 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from database_connection_honeycomb import DatabaseConnectionHoneycomb, ColumnBuilder
+from conftest import START, generate_datapoints
+import datetime
+import math
+
+END = START + datetime.timedelta(minutes=10)
+
+OBJECT_IDS = ['device_0', 'device_1', 'device_2']
+
+def irregular_datapoints():
+    datapoints = generate_datapoints(30, OBJECT_IDS)
+    # Values 10-19 make up the second page for device_0 and device_1 with a
+    # read chunk size of 7: 'reading' is missing from some rows there and is an
+    # int in some rows and a float in others, and is absent from the other
+    # pages; 'label' only appears in the first page
+    for datapoint in datapoints[10:20]:
+        if datapoint['value'] % 5 == 0:
+            datapoint['reading'] = datapoint['value'] + 0.5
+        elif datapoint['value'] % 2 == 0:
+            datapoint['reading'] = datapoint['value']
+    datapoints[9]['label'] = 'high'
+    return datapoints
+
+@pytest.fixture
+def connection(server):
+    connection = DatabaseConnectionHoneycomb(read_chunk_size=7, **server.connection_arguments())
+    connection.write_data_object_time_series(irregular_datapoints())
+    return connection
+
+def is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+def column_values(column):
+    if column.dtype.kind == 'M':
+        return [
+            timestamp.astype(datetime.datetime).replace(tzinfo=datetime.timezone.utc)
+            for timestamp in column
+        ]
+    return [None if is_missing(value) else value for value in column.tolist()]
+
+def row_values(rows, column_name):
+    return [row.get(column_name) for row in rows]
+
+def test_columns_match_rows(connection):
+    rows = connection.fetch_data_object_time_series(START, END, ['device_0', 'device_1'])
+    assert [row.get('reading') for row in rows[7:14]] == [10.5, 12, None, 15.5, 16, 18, None]
+    columns = connection.fetch_data_columns(START, END, ['device_0', 'device_1'])
+    assert list(columns.keys()) == ['timestamp', 'environment_name', 'object_id', 'value', 'label', 'reading']
+    assert all(len(column) == len(rows) for column in columns.values())
+    for column_name, column in columns.items():
+        assert column_values(column) == row_values(rows, column_name)
+    assert columns['timestamp'].dtype == np.dtype('datetime64[us]')
+    assert columns['value'].dtype == np.int64
+    assert columns['reading'].dtype == np.float64
+    assert columns['label'].dtype == object
+
+def test_columns_for_empty_range(connection):
+    columns = connection.fetch_data_columns(END, END + datetime.timedelta(minutes=10))
+    assert list(columns.keys()) == ['timestamp', 'environment_name', 'object_id']
+    assert all(len(column) == 0 for column in columns.values())
+    assert columns['timestamp'].dtype == np.dtype('datetime64[us]')
+
+def test_column_builder_types_across_pages():
+    column_builder = ColumnBuilder()
+    pages = [
+        [{'count': 1, 'flag': True}, {'count': 2, 'flag': False}],
+        [{'count': 3.5}, {'object_id': 'inner'}],
+        [{'count': 10 ** 20, 'note': 'big'}]
+    ]
+    for page in pages:
+        for data_dict in page:
+            column_builder.add_datapoint(
+                timestamp=START,
+                environment_name='test',
+                object_id='device_0',
+                extracted_data_dict_list=[data_dict]
+            )
+        column_builder.end_page()
+    columns = column_builder.columns()
+    assert list(columns.keys()) == ['timestamp', 'environment_name', 'object_id', 'count', 'flag', 'object_id_secondary', 'note']
+    # Ints too large for int64 fall back to an object column
+    assert columns['count'].dtype == object
+    assert column_values(columns['count']) == [1, 2, 3.5, None, 10 ** 20]
+    assert columns['flag'].dtype == object
+    assert column_values(columns['flag']) == [True, False, None, None, None]
+    assert column_values(columns['object_id_secondary']) == [None, None, None, 'inner', None]
+    assert column_values(columns['note']) == [None, None, None, None, 'big']
+
+def test_data_frame_matches_rows(connection):
+    pd = pytest.importorskip('pandas')
+    rows = connection.fetch_data_object_time_series(START, END)
+    data_frame = connection.fetch_data_frame(START, END)
+    assert len(data_frame) == len(rows)
+    assert isinstance(data_frame['object_id'].dtype, pd.CategoricalDtype)
+    assert isinstance(data_frame['environment_name'].dtype, pd.CategoricalDtype)
+    assert str(data_frame['timestamp'].dt.tz) == 'UTC'
+    assert [timestamp.to_pydatetime() for timestamp in data_frame['timestamp']] == row_values(rows, 'timestamp')
+    for column_name in ['environment_name', 'object_id', 'value', 'reading', 'label']:
+        assert [
+            None if is_missing(value) else value
+            for value in data_frame[column_name].tolist()
+        ] == row_values(rows, column_name)
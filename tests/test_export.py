@@ -0,0 +1,128 @@
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+
+from database_connection_honeycomb import DatabaseConnectionHoneycomb
+from database_connection_honeycomb import export
+from conftest import START, generate_datapoints
+import datetime
+import sys
+import os
+
+OBJECT_IDS = ['device_0', 'device_1', 'device_2']
+
+def rows_at(values, object_id='device_0'):
+    return [
+        {
+            'timestamp': START + datetime.timedelta(seconds=value_index),
+            'object_id': object_id,
+            'value': value
+        }
+        for value_index, value in enumerate(values)
+    ]
+
+def read_rows(directory):
+    table = export.read_export(directory).to_table()
+    rows = table.to_pylist()
+    return sorted(rows, key=lambda row: (row['timestamp'], row['object_id']))
+
+def partition_files(directory):
+    return sorted(
+        os.path.relpath(os.path.join(path, file_name), directory)
+        for path, directory_names, file_names in os.walk(directory)
+        for file_name in file_names
+        if file_name != export.SCHEMA_FILE_NAME
+    )
+
+@pytest.mark.parametrize('file_format', ['parquet', 'arrow'])
+def test_export_round_trip_in_hive_layout(server, tmp_path, file_format):
+    connection = DatabaseConnectionHoneycomb(read_chunk_size=7, **server.connection_arguments())
+    connection.write_data_object_time_series(generate_datapoints(60, OBJECT_IDS, spacing=datetime.timedelta(hours=1)))
+    fetched_rows = connection.fetch_data_object_time_series(START, START + datetime.timedelta(days=3))
+    directory = str(tmp_path / 'export')
+    num_rows = export.export_data(connection, directory, START, START + datetime.timedelta(days=3), file_format=file_format, row_group_size=10)
+    assert num_rows == 60
+    extension = export.FILE_EXTENSIONS[file_format]
+    assert partition_files(directory) == sorted(
+        os.path.join('object_id={}'.format(object_id), 'date={}'.format(date), 'part-0.{}'.format(extension))
+        for object_id in OBJECT_IDS
+        for date in ['2021-01-01', '2021-01-02', '2021-01-03']
+    )
+    exported_rows = read_rows(directory)
+    assert [
+        {
+            'timestamp': row['timestamp'],
+            'object_id': row['object_id'],
+            'value': row['value']
+        }
+        for row in exported_rows
+    ] == [
+        {
+            'timestamp': row['timestamp'],
+            'object_id': row['object_id'],
+            'value': row['value']
+        }
+        for row in fetched_rows
+    ]
+    assert exported_rows[0]['date'] == '2021-01-01'
+    assert exported_rows[0]['environment_name'] == server.environment_name
+
+def test_int_column_promoted_to_float(tmp_path):
+    directory = str(tmp_path / 'export')
+    with export.PartitionedWriter(directory, row_group_size=2) as writer:
+        writer.write(rows_at([1, 2]))
+        writer.write(rows_at([None, None, 2.5])[2:])
+    assert writer.schema.field('value').type == pa.float64()
+    # The schema changed, so the float rows went to a new file
+    assert partition_files(directory) == [
+        os.path.join('object_id=device_0', 'date=2021-01-01', 'part-0.parquet'),
+        os.path.join('object_id=device_0', 'date=2021-01-01', 'part-1.parquet')
+    ]
+    assert [row['value'] for row in read_rows(directory)] == [1.0, 2.0, 2.5]
+
+def test_mixed_column_promoted_to_string(tmp_path):
+    directory = str(tmp_path / 'export')
+    with export.PartitionedWriter(directory, row_group_size=1) as writer:
+        writer.write(rows_at([1]))
+        writer.write(rows_at([None, 'high'])[1:])
+        writer.write(rows_at([None, None, {'level': 3}])[2:])
+        writer.write(rows_at([None, None, None, [1, 2]])[3:])
+    assert export.read_export(directory).schema.field('value').type == pa.string()
+    assert [row['value'] for row in read_rows(directory)] == ['1', 'high', '{"level": 3}', '[1, 2]']
+
+def test_new_columns_are_null_in_earlier_files(tmp_path):
+    directory = str(tmp_path / 'export')
+    with export.PartitionedWriter(directory, row_group_size=1) as writer:
+        writer.write(rows_at([1]))
+        writer.write([{**rows_at([None, 2])[1], 'extra': True}])
+    rows = read_rows(directory)
+    assert [row['extra'] for row in rows] == [None, True]
+
+def test_partition_names_are_uri_encoded(tmp_path):
+    directory = str(tmp_path / 'export')
+    with export.PartitionedWriter(directory) as writer:
+        writer.write(rows_at([1], object_id='room 1/a') + rows_at([2], object_id=None))
+    assert partition_files(directory) == [
+        os.path.join('object_id=__HIVE_DEFAULT_PARTITION__', 'date=2021-01-01', 'part-0.parquet'),
+        os.path.join('object_id=room%201%2Fa', 'date=2021-01-01', 'part-0.parquet')
+    ]
+
+def test_main_exports_environment(server, tmp_path, monkeypatch, capsys):
+    DatabaseConnectionHoneycomb(**server.connection_arguments()).write_data_object_time_series(generate_datapoints(12, OBJECT_IDS))
+    connection_arguments = server.connection_arguments()
+    monkeypatch.setenv('HONEYCOMB_URI', connection_arguments['honeycomb_uri'])
+    monkeypatch.setenv('HONEYCOMB_TOKEN_URI', connection_arguments['honeycomb_token_uri'])
+    monkeypatch.setenv('HONEYCOMB_AUDIENCE', connection_arguments['honeycomb_audience'])
+    monkeypatch.setenv('HONEYCOMB_CLIENT_ID', connection_arguments['honeycomb_client_id'])
+    monkeypatch.setenv('HONEYCOMB_CLIENT_SECRET', connection_arguments['honeycomb_client_secret'])
+    directory = str(tmp_path / 'export')
+    monkeypatch.setattr(sys, 'argv', [
+        'honeycomb-export',
+        directory,
+        '--environment', server.environment_name,
+        '--object-ids', 'device_1',
+        '--format', 'arrow'
+    ])
+    export.main()
+    assert 'Exported 4 rows' in capsys.readouterr().out
+    assert [row['value'] for row in read_rows(directory)] == [1, 4, 7, 10]
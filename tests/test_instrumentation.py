@@ -0,0 +1,71 @@
+from database_connection_honeycomb import DatabaseConnectionHoneycomb, client_pool
+from conftest import START, generate_datapoints
+import datetime
+import pytest
+
+END = START + datetime.timedelta(minutes=10)
+
+OBJECT_IDS = ['device_0', 'device_1', 'device_2']
+
+@pytest.fixture(autouse=True)
+def empty_client_pool():
+    client_pool.clear_client_pool()
+    yield
+    client_pool.clear_client_pool()
+
+def instrumented_connection(server, **kwargs):
+    return DatabaseConnectionHoneycomb(
+        instrumentation=True,
+        **kwargs,
+        **server.connection_arguments()
+    )
+
+def test_stats_count_writes_and_fetches(server):
+    connection = instrumented_connection(server, write_chunk_size=10, read_chunk_size=7)
+    connection.write_data_object_time_series(generate_datapoints(30, OBJECT_IDS))
+    counters = connection.stats()['counters']
+    assert counters['datapoints_written'] == 30
+    assert counters['requests.createDatapoints'] == 3
+    assert counters.get('lookup_misses', 0) == 0
+    connection.fetch_data_object_time_series(START, END, ['device_0'])
+    counters = connection.stats()['counters']
+    assert counters['datapoints_fetched'] == 10
+    assert counters['rows'] == 10
+    # A full page and a final short page
+    assert counters['pages'] == 2
+    assert counters['requests'] == server.request_count
+    histograms = connection.stats()['histograms']
+    assert histograms['request_seconds.createDatapoints']['count'] == 3
+    assert histograms['lookup_seconds']['count'] == 30
+
+def test_stats_count_lookup_misses(server):
+    connection = instrumented_connection(server)
+    connection.write_data_object_time_series([
+        {'timestamp': START, 'object_id': 'device_0', 'value': 0},
+        {'timestamp': START, 'object_id': 'unknown_device', 'value': 1}
+    ])
+    assert connection.stats()['counters']['lookup_misses'] == 1
+
+def test_stats_reset(server):
+    connection = instrumented_connection(server)
+    connection.write_data_object_time_series(generate_datapoints(3, OBJECT_IDS))
+    connection.fetch_data_object_time_series(START, END)
+    assert connection.stats()['counters']['requests'] > 0
+    connection.instrumentation.reset()
+    assert connection.stats() == {'counters': {}, 'histograms': {}}
+    connection.fetch_data_object_time_series(START, END)
+    assert connection.stats()['counters']['rows'] == 3
+
+def test_byte_counts_are_transferred_sizes(server):
+    connection = instrumented_connection(server, honeycomb_client_pool=True)
+    connection.write_data_object_time_series(generate_datapoints(3, OBJECT_IDS))
+    connection.fetch_data_object_time_series(START, END)
+    counters = connection.stats()['counters']
+    assert counters['bytes_out'] == server.bytes_received
+    assert counters['bytes_in'] == server.bytes_sent
+
+def test_byte_counts_require_pooled_client(server):
+    connection = instrumented_connection(server)
+    connection.fetch_data_object_time_series(START, END)
+    assert 'bytes_in' not in connection.stats()['counters']
+    assert 'bytes_out' not in connection.stats()['counters']
@@ -0,0 +1,57 @@
+from database_connection_honeycomb import DatabaseConnectionHoneycomb, ASSIGNED_SOURCE_FIELDS, GET_ENVIRONMENT_RETURN_OBJECT
+from conftest import START, generate_datapoints
+import datetime
+import pytest
+
+END = START + datetime.timedelta(minutes=10)
+
+OBJECT_IDS = ['device_0', 'device_1', 'device_2']
+
+def fetched_datapoints(connection):
+    return [
+        datapoint
+        for datapoints in connection._iter_datapoint_pages_object_time_series(START, END)
+        for datapoint in datapoints
+    ]
+
+@pytest.mark.parametrize('connection_options', [
+    {},
+    {'pack_interval': 60}
+])
+def test_lean_fetch_matches_full_fetch(server, connection_options):
+    DatabaseConnectionHoneycomb(**connection_options, **server.connection_arguments()).write_data_object_time_series(
+        generate_datapoints(30, OBJECT_IDS)
+    )
+    full_connection = DatabaseConnectionHoneycomb(read_chunk_size=7, **connection_options, **server.connection_arguments())
+    lean_connection = DatabaseConnectionHoneycomb(read_chunk_size=7, read_lean_fetch=True, **connection_options, **server.connection_arguments())
+    full_rows = full_connection.fetch_data_object_time_series(START, END)
+    assert len(full_rows) == 30
+    assert lean_connection.fetch_data_object_time_series(START, END) == full_rows
+    full_datapoints = fetched_datapoints(full_connection)
+    lean_datapoints = fetched_datapoints(lean_connection)
+    # Sources hold the same fields (and the assignment ID, which is all that a
+    # lean fetch returns; sources are shared between datapoints, so they are
+    # compared without it rather than modified)
+    assert all(datapoint['source']['assignment_id'] is not None for datapoint in lean_datapoints)
+    assert [
+        {
+            **datapoint,
+            'source': {key: value for key, value in datapoint['source'].items() if key != 'assignment_id'}
+        }
+        for datapoint in lean_datapoints
+    ] == full_datapoints
+    assert full_datapoints[1]['source']['assigned'] == {'part_number': 'device_1', 'tag_id': '1'}
+
+def test_assigned_source_fields_are_in_environment():
+    assigned_selection = next(
+        item['assignments']
+        for item in GET_ENVIRONMENT_RETURN_OBJECT
+        if isinstance(item, dict) and 'assignments' in item.keys()
+    )
+    environment_fields = dict()
+    for item in next(item['assigned'] for item in assigned_selection if isinstance(item, dict) and 'assigned' in item.keys()):
+        for fragment_name, fields in item.items():
+            environment_fields[fragment_name[len('... on '):].upper()] = fields
+    assert ASSIGNED_SOURCE_FIELDS == {'DEVICE': ['part_number', 'tag_id'], 'PERSON': ['name']}
+    for assigned_type, fields in ASSIGNED_SOURCE_FIELDS.items():
+        assert set(fields) <= set(environment_fields[assigned_type])
@@ -0,0 +1,123 @@
+from database_connection_honeycomb import DatabaseConnectionHoneycomb, ChunkedRequestError
+from database_connection_honeycomb.aio import AsyncDatabaseConnectionHoneycomb
+from conftest import START, generate_datapoints
+import datetime
+import asyncio
+import pytest
+
+END = START + datetime.timedelta(minutes=10)
+
+OBJECT_IDS = ['device_0', 'device_1', 'device_2']
+
+def packed_connection(server, **kwargs):
+    return DatabaseConnectionHoneycomb(
+        pack_interval=60,
+        **kwargs,
+        **server.connection_arguments()
+    )
+
+def unpacked_rows(server, start_time, end_time):
+    # The same measurements written one per datapoint
+    connection = DatabaseConnectionHoneycomb(**server.connection_arguments())
+    connection.write_data_object_time_series(generate_datapoints(200, OBJECT_IDS))
+    return connection.fetch_data_object_time_series(start_time, end_time)
+
+@pytest.mark.parametrize('read_chunk_size', [1, 2, 1000])
+@pytest.mark.parametrize('start_seconds, end_seconds', [(0, 600), (30, 150), (61, 61)])
+def test_fetch_packed_in_timestamp_order(server, read_chunk_size, start_seconds, end_seconds):
+    packed_connection(server).write_data_object_time_series(generate_datapoints(200, OBJECT_IDS))
+    start_time = START + datetime.timedelta(seconds=start_seconds)
+    end_time = START + datetime.timedelta(seconds=end_seconds)
+    connection = packed_connection(server, read_chunk_size=read_chunk_size)
+    rows = connection.fetch_data_object_time_series(start_time, end_time)
+    expected_values = list(range(start_seconds, min(end_seconds, 199) + 1))
+    assert [row['value'] for row in rows] == expected_values
+    assert list(connection.iter_data(start_time, end_time)) == rows
+    assert [row['timestamp'] for row in rows] == sorted([row['timestamp'] for row in rows])
+
+def test_fetch_packed_matches_unpacked(server, other_server):
+    packed_connection(server).write_data_object_time_series(generate_datapoints(200, OBJECT_IDS))
+    start_time = START + datetime.timedelta(seconds=15)
+    end_time = START + datetime.timedelta(seconds=170)
+    rows = packed_connection(server, read_chunk_size=2).fetch_data_object_time_series(start_time, end_time)
+    assert rows == unpacked_rows(other_server, start_time, end_time)
+
+def test_fetch_packed_to_sink_resumes_in_order(server, tmp_path):
+    packed_connection(server).write_data_object_time_series(generate_datapoints(200, OBJECT_IDS))
+    checkpoint_path = str(tmp_path / 'checkpoint.json')
+    connection = packed_connection(server, read_chunk_size=2)
+    received_rows = []
+    def failing_sink(rows):
+        if len(received_rows) >= 50:
+            raise RuntimeError('Interrupted')
+        received_rows.extend(rows)
+    with pytest.raises(RuntimeError):
+        connection.fetch_data_to_sink(failing_sink, START, END, checkpoint_path=checkpoint_path)
+    connection.fetch_data_to_sink(received_rows.extend, START, END, checkpoint_path=checkpoint_path)
+    assert [row['value'] for row in received_rows] == list(range(200))
+
+@pytest.mark.parametrize('write_max_workers', [1, 4])
+def test_failed_packs_reported_by_datapoint(server, write_max_workers):
+    connection = packed_connection(server, write_chunk_size=1, write_max_workers=write_max_workers)
+    write_packs = connection._write_datapoints_object_time_series
+    def write_packs_failing_device_1(packs):
+        if any(pack.object_id == 'device_1' for pack in packs):
+            raise RuntimeError('Write failed')
+        return write_packs(packs)
+    connection._write_datapoints_object_time_series = write_packs_failing_device_1
+    datapoints = generate_datapoints(120, OBJECT_IDS)
+    with pytest.raises(ChunkedRequestError) as error_info:
+        connection.write_data_object_time_series(datapoints)
+    error = error_info.value
+    failed_indices = [
+        datapoint_index
+        for chunk_beginning, chunk_end, exception in error.failed_chunks
+        for datapoint_index in range(chunk_beginning, chunk_end)
+    ]
+    if write_max_workers > 1:
+        # Only the packs of device_1 fail
+        expected_failed_indices = [datapoint_index for datapoint_index in range(120) if datapoint_index % 3 == 1]
+    else:
+        # Packs after the first failed pack (device_1 in the first minute) are
+        # not sent
+        expected_failed_indices = [datapoint_index for datapoint_index in range(120) if datapoint_index % 3 != 0 or datapoint_index >= 60]
+    assert failed_indices == expected_failed_indices
+    assert len(error.results) == 120
+    for datapoint_index, data_id in enumerate(error.results):
+        assert (data_id is None) == (datapoint_index in expected_failed_indices)
+    assert len(server.datapoints) == len(set(data_id for data_id in error.results if data_id is not None))
+
+@pytest.mark.parametrize('delete_start_seconds, delete_end_seconds', [(0, 5), (61, 200), (30, 90), (0, 119)])
+def test_delete_packed_removes_only_measurements_in_span(server, other_server, delete_start_seconds, delete_end_seconds):
+    packed_connection(server).write_data_object_time_series(generate_datapoints(120, OBJECT_IDS))
+    delete_start = START + datetime.timedelta(seconds=delete_start_seconds)
+    delete_end = START + datetime.timedelta(seconds=delete_end_seconds)
+    packed_connection(server).delete_data_object_time_series(delete_start, delete_end, OBJECT_IDS)
+    rows = packed_connection(server).fetch_data_object_time_series(START, END)
+    expected_values = [
+        value
+        for value in range(120)
+        if not delete_start_seconds <= value <= delete_end_seconds
+    ]
+    assert [row['value'] for row in rows] == expected_values
+    async_connection = AsyncDatabaseConnectionHoneycomb(pack_interval=60, **other_server.connection_arguments())
+    async def write_delete_fetch():
+        async with async_connection as connection:
+            await connection.write_data_object_time_series(generate_datapoints(120, OBJECT_IDS))
+            await connection.delete_data_object_time_series(delete_start, delete_end, OBJECT_IDS)
+            return await connection.fetch_data_object_time_series(START, END)
+    assert asyncio.run(write_delete_fetch()) == rows
+
+def test_delete_packed_for_some_objects(server):
+    packed_connection(server).write_data_object_time_series(generate_datapoints(120, OBJECT_IDS))
+    packed_connection(server).delete_data_object_time_series(
+        START + datetime.timedelta(seconds=30),
+        START + datetime.timedelta(seconds=89),
+        ['device_1']
+    )
+    rows = packed_connection(server).fetch_data_object_time_series(START, END)
+    assert [row['value'] for row in rows] == [
+        value
+        for value in range(120)
+        if value % 3 != 1 or not 30 <= value <= 89
+    ]
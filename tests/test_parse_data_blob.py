@@ -0,0 +1,77 @@
+from database_connection_honeycomb import DatabaseConnectionHoneycomb, orjson_safe
+from parse_data_blob import generate_blobs, legacy_parse_data_blob
+import json
+import math
+import pytest
+
+def blob_cases():
+    blob_cases = dict(generate_blobs(20))
+    blob_cases.update({
+        'empty string': '',
+        'blank lines': '\n\n',
+        'null': None,
+        'number': 5,
+        'JSON number': '5',
+        'JSON list of numbers': '[1, 2, 3]',
+        'NDJSON with trailing newline': '{"a": 1}\n{"b": 2}\n',
+        'NDJSON with CRLF line endings': '{"a": 1}\r\n{"b": 2}\r\n',
+        'NDJSON with blank lines': '\n{"a": 1}\n\n{"b": 2}',
+        'NDJSON with leading whitespace': '  {"a": 1}\n\t{"b": 2}',
+        'NDJSON with malformed lines': '{"a": 1}\n{"b": \nnot JSON\n{"c": 3}',
+        'NDJSON with malformed first line': '{"a": \n{"b": 2}\n{"c": 3}',
+        'NDJSON of lists': '[{"a": 1}, {"b": 2}]\n[{"c": 3}]',
+        'NDJSON of JSON strings': '"{\\"a\\": 1}"\n"{\\"b\\": 2}"',
+        'NDJSON of numbers': '1\n2\n{"a": 3}',
+        'pretty-printed JSON': json.dumps([{'a': 1}, {'b': [1, 2]}], indent=2),
+        'pretty-printed dict': json.dumps({'a': {'b': 1}}, indent=2),
+        'doubly JSON-encoded': json.dumps(json.dumps({'a': 1})),
+        'bytes': b'{"a": 1}',
+        'NDJSON bytes': b'{"a": 1}\n{"b": 2}',
+        'duplicate keys': '{"a": 1, "a": 2}',
+        # Inputs which orjson_safe() routes to the json module, or which orjson
+        # rejects
+        'long integer': '{"a": 12345678901234567890}',
+        'long negative integer': '{"a": -98765432109876543210}',
+        'long integer in NDJSON': '{"a": 1}\n{"b": 12345678901234567890123}',
+        'long integer in string': '{"a": "12345678901234567890"}',
+        'NaN': '{"a": NaN, "b": Infinity, "c": -Infinity}',
+        'NaN in NDJSON': '{"a": 1}\n{"b": NaN}',
+        'lone surrogate': '{"a": "\\ud800"}',
+        'lone surrogate in NDJSON': '{"a": "\\udfff"}\n{"b": 2}',
+        'huge exponent': '{"a": 1e400}',
+        'non-ASCII': '{"\u00e9": "\u2603", "b": "\U0001f600"}'
+    })
+    return blob_cases
+
+BLOB_CASES = blob_cases()
+
+def normalized(data_dict_list):
+    # NaN never equals itself, so compare it by its representation
+    return json.dumps(data_dict_list, sort_keys=True) if any(
+        isinstance(value, float) and math.isnan(value)
+        for data_dict in data_dict_list
+        for value in data_dict.values()
+    ) else data_dict_list
+
+@pytest.fixture(scope='module')
+def connection():
+    return DatabaseConnectionHoneycomb.__new__(DatabaseConnectionHoneycomb)
+
+@pytest.mark.parametrize('blob_name', list(BLOB_CASES.keys()))
+def test_parse_data_blob_matches_legacy(connection, blob_name):
+    blob = BLOB_CASES[blob_name]
+    data_dict_list = connection.parse_data_blob(blob)
+    assert normalized(data_dict_list) == normalized(legacy_parse_data_blob(blob))
+    # Exact types too (e.g., long integers are not turned into floats)
+    assert repr(data_dict_list) == repr(legacy_parse_data_blob(blob))
+
+@pytest.mark.parametrize('document, expected', [
+    ('{"a": 1234567890123456789}', False),
+    ('{"a": 123456789012345678}', True),
+    ('{"a": 1.23456789012345678901}', False),
+    (b'{"a": 1}', True),
+    ({'a': 1}, False)
+])
+def test_orjson_safe(document, expected):
+    pytest.importorskip('orjson')
+    assert orjson_safe(document) == expected
@@ -0,0 +1,82 @@
+from database_connection_honeycomb import DatabaseConnectionHoneycomb
+from conftest import START, generate_datapoints
+import datetime
+import pytest
+
+END = START + datetime.timedelta(minutes=10)
+
+OBJECT_IDS = ['device_0', 'device_1', 'device_2']
+
+def datapoints_with_shared_timestamps():
+    # Pairs of datapoints share timestamps, so pages (and resumes) can split
+    # datapoints with the same timestamp
+    datapoints = generate_datapoints(60, OBJECT_IDS)
+    for datapoint in datapoints:
+        datapoint['timestamp'] = START + datetime.timedelta(seconds=datapoint['value'] // 2)
+    return datapoints
+
+def interrupted_sink(received_rows, num_rows):
+    def sink(rows):
+        if len(received_rows) >= num_rows:
+            raise RuntimeError('Interrupted')
+        received_rows.extend(rows)
+    return sink
+
+@pytest.mark.parametrize('connection_options', [
+    {},
+    {'read_shard_mode': 'time', 'read_shard_count': 3},
+    {'read_shard_mode': 'assignments'}
+])
+@pytest.mark.parametrize('checkpoint_interval', [1, 3])
+def test_fetch_to_sink_resumes_without_duplicates(server, tmp_path, connection_options, checkpoint_interval):
+    DatabaseConnectionHoneycomb(**server.connection_arguments()).write_data_object_time_series(datapoints_with_shared_timestamps())
+    connection = DatabaseConnectionHoneycomb(read_chunk_size=5, **connection_options, **server.connection_arguments())
+    expected_rows = connection.fetch_data_object_time_series(START, END)
+    checkpoint_path = str(tmp_path / 'checkpoint.json')
+    received_rows = []
+    for num_rows in [13, 31]:
+        with pytest.raises(RuntimeError):
+            connection.fetch_data_to_sink(
+                interrupted_sink(received_rows, num_rows),
+                START,
+                END,
+                checkpoint_path=checkpoint_path,
+                checkpoint_interval=checkpoint_interval
+            )
+    num_interrupted_rows = len(received_rows)
+    assert 13 <= num_interrupted_rows < 60
+    num_resumed_rows = connection.fetch_data_to_sink(
+        received_rows.extend,
+        START,
+        END,
+        checkpoint_path=checkpoint_path,
+        checkpoint_interval=checkpoint_interval
+    )
+    assert num_resumed_rows == 60 - num_interrupted_rows
+    assert received_rows == expected_rows
+    assert connection.fetch_data_to_sink(received_rows.extend, START, END, checkpoint_path=checkpoint_path) == 0
+    assert len(received_rows) == 60
+
+def test_fetch_to_sink_without_checkpoint_hands_over_everything(server):
+    DatabaseConnectionHoneycomb(**server.connection_arguments()).write_data_object_time_series(datapoints_with_shared_timestamps())
+    connection = DatabaseConnectionHoneycomb(read_chunk_size=5, **server.connection_arguments())
+    batches = []
+    assert connection.fetch_data_to_sink(batches.append, START, END, checkpoint_interval=2) == 60
+    assert [len(batch) for batch in batches] == [10] * 6
+    assert [row for batch in batches for row in batch] == connection.fetch_data_object_time_series(START, END)
+
+@pytest.mark.parametrize('other_arguments', [
+    {'start_time': START + datetime.timedelta(seconds=1), 'end_time': END},
+    {'start_time': START, 'end_time': END + datetime.timedelta(seconds=1)},
+    {'start_time': START, 'end_time': END, 'object_ids': ['device_0']}
+])
+def test_checkpoint_for_other_fetch_raises(server, tmp_path, other_arguments):
+    DatabaseConnectionHoneycomb(**server.connection_arguments()).write_data_object_time_series(datapoints_with_shared_timestamps())
+    connection = DatabaseConnectionHoneycomb(read_chunk_size=5, **server.connection_arguments())
+    checkpoint_path = str(tmp_path / 'checkpoint.json')
+    received_rows = []
+    with pytest.raises(RuntimeError):
+        connection.fetch_data_to_sink(interrupted_sink(received_rows, 10), START, END, checkpoint_path=checkpoint_path)
+    with pytest.raises(ValueError):
+        connection.fetch_data_to_sink(received_rows.extend, checkpoint_path=checkpoint_path, **other_arguments)
+    assert len(received_rows) == 10
@@ -0,0 +1,44 @@
+from database_connection_honeycomb import timestamps
+import datetime
+import warnings
+import pytest
+
+BATCH_SIZE = timestamps.NUMPY_BATCH_MIN_SIZE
+
+@pytest.mark.parametrize('timestamp', [
+    '2021-01-01T00:00:00.Z',
+    '2021-01-01T00:00:00.000000+0000Z',
+    '2021-01-01T00:00:00+01:00',
+    '2021-01-01 00:00:00.000Z',
+    '2021-01-01T00:00:00.1234567Z',
+    '2021-01-01T00:00:00.123',
+    '2021-01-01T00:00:00Z',
+    '0999-12-31T23:59:59.999999Z'
+])
+def test_batch_parse_matches_single_parse(timestamp):
+    batch = ['2021-01-01T00:00:00.000000Z'] * (BATCH_SIZE - 1) + [timestamp]
+    try:
+        expected_datetimes = [timestamps.python_datetime_utc(timestamp) for timestamp in batch]
+    except ValueError:
+        with pytest.raises(ValueError):
+            timestamps.python_datetimes_utc(batch)
+        return
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        assert timestamps.python_datetimes_utc(batch) == expected_datetimes
+
+def test_batch_parse_rejects_out_of_range_fields():
+    batch = ['2021-01-01T00:00:00.000000Z'] * BATCH_SIZE + ['0000-01-01T00:00:00Z']
+    with pytest.raises(ValueError):
+        timestamps.python_datetimes_utc(batch)
+
+@pytest.mark.parametrize('first_timestamp', [
+    datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone(datetime.timedelta(hours=-5))),
+    datetime.datetime(2021, 1, 1, 12, 30, 15, 250),
+    '2021-06-30T23:59:59.5Z',
+    datetime.datetime(999, 1, 1, tzinfo=datetime.timezone.utc)
+])
+def test_batch_format_matches_single_format(first_timestamp):
+    start = datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+    batch = [first_timestamp] + [start + datetime.timedelta(microseconds=7 * index) for index in range(BATCH_SIZE)]
+    assert timestamps.datetime_honeycomb_strings(batch) == [timestamps.datetime_honeycomb_string(timestamp) for timestamp in batch]
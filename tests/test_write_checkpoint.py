@@ -0,0 +1,139 @@
+from database_connection_honeycomb import DatabaseConnectionHoneycomb, ChunkedRequestError
+from database_connection_honeycomb import checkpoint as checkpoint_module
+from database_connection_honeycomb.checkpoint import WriteCheckpoint
+from conftest import START, generate_datapoints
+import datetime
+import pytest
+
+END = START + datetime.timedelta(minutes=10)
+
+OBJECT_IDS = ['device_0', 'device_1', 'device_2']
+
+def connection_failing_chunks(server, failing_chunk_values, num_failures, **kwargs):
+    # Writes of chunks which begin with one of the specified values fail the
+    # specified number of times (None means always)
+    connection = DatabaseConnectionHoneycomb(
+        write_chunk_size=10,
+        write_retry_backoff=0.0,
+        **kwargs,
+        **server.connection_arguments()
+    )
+    write_datapoints = connection._write_datapoints_object_time_series
+    attempted_chunk_values = []
+    def write_datapoints_failing(datapoints):
+        chunk_value = datapoints[0]['value']
+        attempted_chunk_values.append(chunk_value)
+        if chunk_value in failing_chunk_values and (num_failures is None or attempted_chunk_values.count(chunk_value) <= num_failures):
+            raise RuntimeError('Write failed')
+        return write_datapoints(datapoints)
+    connection._write_datapoints_object_time_series = write_datapoints_failing
+    return connection, attempted_chunk_values
+
+@pytest.fixture
+def fsync_count(monkeypatch):
+    fsyncs = []
+    fsync = checkpoint_module.os.fsync
+    def counting_fsync(file_descriptor):
+        fsyncs.append(file_descriptor)
+        fsync(file_descriptor)
+    monkeypatch.setattr(checkpoint_module.os, 'fsync', counting_fsync)
+    return lambda: len(fsyncs)
+
+@pytest.mark.parametrize('write_max_workers', [1, 3])
+def test_transient_failure_is_retried(server, write_max_workers):
+    connection, attempted_chunk_values = connection_failing_chunks(
+        server,
+        [10],
+        2,
+        write_retries=2,
+        write_max_workers=write_max_workers
+    )
+    data_ids = connection.write_data_object_time_series(generate_datapoints(30, OBJECT_IDS))
+    assert sorted(attempted_chunk_values) == [0, 10, 10, 10, 20]
+    assert len(set(data_ids)) == 30
+    assert set(data_ids) == set(server.datapoints.keys())
+
+def test_failure_beyond_retries_is_reported(server):
+    connection, attempted_chunk_values = connection_failing_chunks(server, [10], 3, write_retries=2)
+    with pytest.raises(ChunkedRequestError) as error_info:
+        connection.write_data_object_time_series(generate_datapoints(30, OBJECT_IDS))
+    assert attempted_chunk_values == [0, 10, 10, 10]
+    assert [failed_chunk[:2] for failed_chunk in error_info.value.failed_chunks] == [(10, 20), (20, 30)]
+
+@pytest.mark.parametrize('write_max_workers', [1, 3])
+def test_restarted_write_skips_recorded_chunks(server, tmp_path, write_max_workers):
+    checkpoint_path = str(tmp_path / 'checkpoint.jsonl')
+    datapoints = generate_datapoints(40, OBJECT_IDS)
+    connection, attempted_chunk_values = connection_failing_chunks(
+        server,
+        [20],
+        None,
+        write_max_workers=write_max_workers
+    )
+    with pytest.raises(ChunkedRequestError) as error_info:
+        connection.write_data_object_time_series(datapoints, checkpoint_path=checkpoint_path)
+    first_data_ids = error_info.value.results
+    recorded_chunks = WriteCheckpoint(checkpoint_path, 40, 10).load()
+    written_chunks = sorted(recorded_chunks.keys())
+    assert (20, 30) not in written_chunks
+    assert (0, 10) in written_chunks and (10, 20) in written_chunks
+    connection, attempted_chunk_values = connection_failing_chunks(
+        server,
+        [],
+        None,
+        write_max_workers=write_max_workers
+    )
+    data_ids = connection.write_data_object_time_series(datapoints, checkpoint_path=checkpoint_path)
+    # Only the chunks which were not recorded are written again
+    assert sorted(attempted_chunk_values) == [
+        chunk_beginning
+        for chunk_beginning in [0, 10, 20, 30]
+        if (chunk_beginning, chunk_beginning + 10) not in written_chunks
+    ]
+    for chunk_beginning, chunk_end in written_chunks:
+        assert data_ids[chunk_beginning:chunk_end] == first_data_ids[chunk_beginning:chunk_end]
+    assert len(set(data_ids)) == 40
+    assert set(data_ids) == set(server.datapoints.keys())
+    assert [row['value'] for row in connection.fetch_data_object_time_series(START, END)] == list(range(40))
+    # A complete checkpoint returns the same data IDs without writing anything
+    request_count = server.request_count
+    assert connection.write_data_object_time_series(datapoints, checkpoint_path=checkpoint_path) == data_ids
+    assert server.request_count == request_count
+
+def test_checkpoint_for_other_write_raises(server, tmp_path):
+    checkpoint_path = str(tmp_path / 'checkpoint.jsonl')
+    connection = DatabaseConnectionHoneycomb(write_chunk_size=10, **server.connection_arguments())
+    connection.write_data_object_time_series(generate_datapoints(20, OBJECT_IDS), checkpoint_path=checkpoint_path)
+    with pytest.raises(ValueError):
+        connection.write_data_object_time_series(generate_datapoints(30, OBJECT_IDS), checkpoint_path=checkpoint_path)
+
+def test_checkpoint_syncs_every_record_by_default(tmp_path, fsync_count):
+    checkpoint = WriteCheckpoint(str(tmp_path / 'checkpoint.jsonl'), 30, 10)
+    for chunk_beginning in [0, 10, 20]:
+        checkpoint.record(chunk_beginning, chunk_beginning + 10, [str(chunk_beginning)])
+    assert fsync_count() == 3
+    checkpoint.sync()
+    assert fsync_count() == 3
+
+def test_checkpoint_sync_interval(tmp_path, fsync_count):
+    checkpoint = WriteCheckpoint(str(tmp_path / 'checkpoint.jsonl'), 30, 10, sync_interval=None)
+    for chunk_beginning in [0, 10, 20]:
+        checkpoint.record(chunk_beginning, chunk_beginning + 10, [str(chunk_beginning)])
+    assert fsync_count() == 0
+    # Unsynced records are still in the file
+    assert sorted(checkpoint.load().keys()) == [(0, 10), (10, 20), (20, 30)]
+    checkpoint.sync()
+    assert fsync_count() == 1
+    checkpoint.sync()
+    assert fsync_count() == 1
+
+def test_write_syncs_checkpoint_at_end(server, tmp_path, fsync_count):
+    connection = DatabaseConnectionHoneycomb(
+        write_chunk_size=10,
+        write_checkpoint_sync_interval=3600,
+        **server.connection_arguments()
+    )
+    checkpoint_path = str(tmp_path / 'checkpoint.jsonl')
+    connection.write_data_object_time_series(generate_datapoints(30, OBJECT_IDS), checkpoint_path=checkpoint_path)
+    assert fsync_count() == 1
+    assert len(WriteCheckpoint(checkpoint_path, 30, 10).load()) == 3